@@ -40,7 +40,8 @@ from phd.riemann.riemann import \
         RiemannBase, \
         HLL, \
         HLLC, \
-        Exact
+        Exact, \
+        Adaptive
 
 from phd.simulation.simulation import \
         Simulation
@@ -60,6 +61,20 @@ from phd.utils.particle_creator import \
 from phd.utils.logger import \
         phdLogger
 
+from phd.utils.profiler import \
+        Profiler
+
+from phd.io.io import \
+        ReaderWriterBase, \
+        Hdf5, \
+        ParallelHdf5, \
+        AsyncWriter
+
+from phd.io.reader import \
+        LazyContainer, \
+        read_snapshot, \
+        iterate_snapshots
+
 from phd.io.simulation_time import \
         SimulationTime, \
         Iteration, \
@@ -68,6 +83,9 @@ from phd.io.simulation_time import \
         TimeInterval, \
         SelectedTimes
 
+from phd.io.reduction import \
+        Reduction
+
 try:
     import mpi4py.MPI as mpi
     _has_mpi = True
@@ -7,6 +7,15 @@ cdef class CarrayContainer:
     cdef readonly dict properties
     cdef readonly dict carray_info
     cdef readonly dict named_groups
+    cdef readonly long num_items        # length shared by all carrays
+
+    # capacity retained across resizes, see set_capacity_policy
+    cdef bint retain_capacity
+    cdef readonly long capacity
+    cdef double growth_factor
+    cdef double shrink_fraction
+    cdef int shrink_delay
+    cdef int num_shrink_requests
 
     cpdef register_property(self, int size, str name, str dtype=*)
 
@@ -17,6 +26,9 @@ cdef class CarrayContainer:
     cpdef BaseArray get_carray(self, str prop)
     cdef  _check_property(self, str prop)
     cpdef resize(self, int size)
+    cpdef set_capacity_policy(self, double growth_factor=*, double shrink_fraction=*,
+            int shrink_delay=*)
+    cpdef long get_number_of_reallocs(self)
     cpdef remove_tagged_particles(self, np.int8_t tag)
     cpdef CarrayContainer extract_items(self, LongArray index_array, list fields=*)
     cpdef int append_container(self, CarrayContainer carray)
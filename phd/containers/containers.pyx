@@ -23,6 +23,9 @@ cdef class CarrayContainer:
         """
         cdef str name, dtype
 
+        self.num_items = 0
+        self.capacity = 0
+        self.retain_capacity = False
         self.properties = {}
         self.carray_info = {}
         self.named_groups = {}
@@ -45,12 +48,14 @@ cdef class CarrayContainer:
         dtype : str
             data type of carray
         """
-        if name in self.properties.keys():
+        if PyDict_Contains(self.properties, name):
             raise RuntimeError("Carray already registered")
 
         if len(self.properties) != 0:
-            if size != self.get_number_of_items():
+            if size != self.num_items:
                 raise RuntimeError("size inconsistent with carray size")
+        else:
+            self.num_items = size
 
         # store data type of field
         self.carray_info[name] = dtype
@@ -75,18 +80,20 @@ cdef class CarrayContainer:
         name : str
             name of carray retreive
         """
-        keys = self.properties.keys()
-        if name in keys:
-            return self.properties[name].get_npy_array()
+        cdef BaseArray arr
+        if PyDict_Contains(self.properties, name):
+            arr = <BaseArray> PyDict_GetItem(self.properties, name)
+            return arr.get_npy_array()
         else:
             raise AttributeError("Unrecognized field: %s" % name)
 
     cpdef int get_number_of_items(self):
-        """Return the number of items in carray"""
-        if len(self.properties) > 0:
-            return self.properties.values()[0].length
-        else:
-            return 0
+        """
+        Return the number of items in carray. The length is tracked by
+        the container, carrays should only be resized through the
+        container.
+        """
+        return self.num_items
 
     cpdef extend(self, int num_items):
         """
@@ -95,12 +102,14 @@ cdef class CarrayContainer:
         if num_items <= 0:
             return
 
-        cdef int old_size = self.get_number_of_items()
+        cdef int old_size = self.num_items
         cdef int new_size = old_size + num_items
         cdef BaseArray arr
 
-        for arr in self.properties.values():
-            arr.resize(new_size)
+        # grow geometrically, repeated extends are amortized
+        for arr in self.properties.itervalues():
+            arr._grow(new_size)
+        self.num_items = new_size
 
     cpdef BaseArray get_carray(self, str prop):
         """Return the c-array for the property."""
@@ -117,11 +126,93 @@ cdef class CarrayContainer:
             raise AttributeError, 'property %s not present' % (prop)
 
     cpdef resize(self, int size):
-        """Resize all arrays to the new size."""
+        """
+        Resize all arrays to the new size. If a capacity policy is set
+        the carrays are over allocated when growing and only shrunk after
+        the size stays small for several consecutive resizes.
+        """
         cdef BaseArray array
-        for array in self.properties.values():
+        cdef long capacity
+
+        if not self.retain_capacity:
+            for array in self.properties.itervalues():
+                array.resize(size)
+            self.num_items = size
+            return
+
+        capacity = self.capacity
+        if size > capacity:
+
+            # grow with head room for small fluctuations
+            capacity = <long> (self.growth_factor*size)
+            self.num_shrink_requests = 0
+
+        elif size < self.shrink_fraction*capacity:
+
+            # release memory only after a sustained decrease
+            self.num_shrink_requests += 1
+            if self.num_shrink_requests >= self.shrink_delay:
+                capacity = max(<long> (self.growth_factor*size), 16)
+                self.num_shrink_requests = 0
+
+        else:
+            self.num_shrink_requests = 0
+
+        for array in self.properties.itervalues():
+            if capacity > array.alloc:
+                array.reserve(capacity)
+            elif capacity < self.capacity and capacity < array.alloc:
+                array.resize(capacity)
+                array.squeeze()
             array.resize(size)
 
+        self.capacity = capacity
+        self.num_items = size
+
+    cpdef set_capacity_policy(self, double growth_factor=1.25, double shrink_fraction=0.5,
+            int shrink_delay=10):
+        """
+        Retain carray memory across resizes so containers that are resized
+        every step (faces, states, fluxes) stop reallocating once the
+        high-water mark is reached.
+
+        Parameters
+        ----------
+        growth_factor : double
+            Capacity allocated relative to requested size when growing.
+        shrink_fraction : double
+            Sizes below this fraction of the capacity count as a shrink
+            request.
+        shrink_delay : int
+            Number of consecutive shrink requests before memory is released.
+        """
+        cdef BaseArray array
+
+        if growth_factor < 1.0:
+            raise ValueError("growth_factor has to be atleast 1")
+
+        self.retain_capacity = True
+        self.growth_factor = growth_factor
+        self.shrink_fraction = shrink_fraction
+        self.shrink_delay = shrink_delay
+        self.num_shrink_requests = 0
+
+        # current high-water mark is the smallest allocation
+        self.capacity = -1
+        for array in self.properties.itervalues():
+            if self.capacity < 0 or array.alloc < self.capacity:
+                self.capacity = array.alloc
+        self.capacity = max(self.capacity, self.num_items)
+
+    cpdef long get_number_of_reallocs(self):
+        """Return the total number of carray reallocations in container."""
+        cdef BaseArray array
+        cdef long num_reallocs = 0
+
+        for array in self.properties.itervalues():
+            num_reallocs += array.num_reallocs
+        return num_reallocs
+
     def get_sendbufs(self, np.ndarray indices):
         cdef str prop
         cdef dict sendbufs = {}
@@ -140,23 +231,22 @@ cdef class CarrayContainer:
         if container.get_number_of_items() == 0:
             return 0
 
-        cdef int num_extra_items = container.get_number_of_items()
-        cdef int old_num_items = self.get_number_of_items()
+        cdef int num_extra_items = container.num_items
+        cdef int old_num_items = self.num_items
         cdef str prop_name
         cdef BaseArray dest, source
-        cdef np.ndarray nparr_dest, nparr_source
 
         # extend current arrays by the required number of items
         self.extend(num_extra_items)
 
-        # should check that fields are equal or not error
-        for prop_name in container.properties.keys():
+        # copy raw buffers of shared fields to the end of each carray
+        for prop_name in container.properties:
             if PyDict_Contains(self.properties, prop_name):
                 dest = <BaseArray> PyDict_GetItem(self.properties, prop_name)
                 source = <BaseArray> PyDict_GetItem(container.properties, prop_name)
-                nparr_source = source.get_npy_array()
-                nparr_dest = dest.get_npy_array()
-                nparr_dest[old_num_items:] = nparr_source
+                if dest.get_c_type() != source.get_c_type():
+                    raise ValueError("Inconsistent dtype for field: %s" % prop_name)
+                source.paste_block(old_num_items, dest)
 
     cpdef CarrayContainer extract_items(self, LongArray index_array, list fields=None):
         """
@@ -216,23 +306,17 @@ cdef class CarrayContainer:
         cdef str msg
         cdef np.ndarray sorted_indices
         cdef BaseArray prop_array
-        cdef int num_arrays, i
-        cdef list temp_arrays
-        cdef list property_arrays
 
-        if index_list.size > self.get_number_of_items():
+        if index_list.size > self.num_items:
             msg = 'Number of items to be removed is greater than'
             msg += 'number of items in array'
             raise ValueError, msg
 
         sorted_indices = np.sort(index_list)
-        num_arrays = len(self.properties.keys())
 
-        property_arrays = self.properties.values()
-
-        for i in range(num_arrays):
-            prop_array = property_arrays[i]
+        for prop_array in self.properties.itervalues():
             prop_array.remove(sorted_indices, 1)
+            self.num_items = prop_array.length
 
     cpdef copy(self, CarrayContainer container, LongArray indices, list properties):
         """
@@ -286,16 +370,18 @@ cdef class CarrayContainer:
         tag : int8
             The type of particles that need to be removed.
         """
-        cdef LongArray indices = LongArray()
         cdef IntArray tag_array = self.properties['tag']
+        cdef LongArray indices = LongArray(tag_array.length)
         cdef np.int8_t* tagarrptr = tag_array.get_data_ptr()
         cdef np.ndarray ind
-        cdef int i
+        cdef int i, num_indices = 0
 
         # find the indices of the particles to be removed
         for i in range(tag_array.length):
             if tagarrptr[i] == tag:
-                indices.append(i)
+                indices.data[num_indices] = i
+                num_indices += 1
+        indices.resize(num_indices)
 
         # remove the particles
         ind = indices.get_npy_array()
@@ -308,8 +394,8 @@ cdef class CarrayContainer:
 
         i = 0
         for field in field_names:
-            if field in self.properties.keys():
-                arr = <DoubleArray> self.get_carray(field)
+            if PyDict_Contains(self.properties, field):
+                arr = <DoubleArray> PyDict_GetItem(self.properties, field)
                 vec[i] = arr.get_data_ptr()
                 i += 1
             else:
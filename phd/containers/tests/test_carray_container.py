@@ -0,0 +1,105 @@
+import unittest
+import numpy as np
+
+from phd.utils.carray import LongArray
+from phd.containers.containers import CarrayContainer
+
+class TestCarrayContainerLength(unittest.TestCase):
+    """Tests the number of items tracked by CarrayContainer."""
+    def setUp(self):
+        var_dict = {
+                "mass": "double",
+                "tag": "int",
+                "map": "long",
+                "key": "longlong",
+                }
+        self.cc = CarrayContainer(10, var_dict)
+
+    def test_empty(self):
+        cc = CarrayContainer()
+        self.assertEqual(cc.get_number_of_items(), 0)
+
+        # first property sets the length
+        cc.register_property(5, "mass")
+        self.assertEqual(cc.get_number_of_items(), 5)
+
+        # inconsistent size is an error
+        self.assertRaises(RuntimeError, cc.register_property, 4, "energy")
+
+    def test_resize_extend(self):
+        self.cc.resize(20)
+        self.assertEqual(self.cc.get_number_of_items(), 20)
+        self.assertEqual(self.cc.num_items, 20)
+
+        self.cc.extend(5)
+        self.assertEqual(self.cc.get_number_of_items(), 25)
+        for field in self.cc.properties.keys():
+            self.assertEqual(self.cc[field].size, 25)
+
+    def test_remove(self):
+        self.cc.remove_items(np.array([0, 3, 9], dtype=np.int32))
+        self.assertEqual(self.cc.get_number_of_items(), 7)
+
+        self.cc["tag"][:] = 0
+        self.cc["tag"][[1, 2]] = 1
+        self.cc.remove_tagged_particles(1)
+        self.assertEqual(self.cc.get_number_of_items(), 5)
+        for field in self.cc.properties.keys():
+            self.assertEqual(self.cc[field].size, 5)
+
+    def test_append_extract(self):
+        self.cc["mass"][:] = np.arange(10)
+        indices = LongArray(3)
+        indices.get_npy_array()[:] = [1, 5, 7]
+
+        sub = self.cc.extract_items(indices)
+        self.assertEqual(sub.get_number_of_items(), 3)
+
+        self.cc.append_container(sub)
+        self.assertEqual(self.cc.get_number_of_items(), 13)
+        self.assertTrue(np.allclose(self.cc["mass"][10:], [1, 5, 7]))
+
+    def test_getitem_error(self):
+        self.assertRaises(AttributeError, self.cc.__getitem__, "energy")
+
+class TestCarrayContainerCapacity(unittest.TestCase):
+    """Tests the capacity policy of CarrayContainer."""
+    def setUp(self):
+        self.cc = CarrayContainer(100, {"area": "double", "pair-i": "long"})
+        self.cc.set_capacity_policy(growth_factor=1.25, shrink_fraction=0.5,
+                shrink_delay=3)
+
+    def test_steady_state(self):
+        self.cc.resize(200)
+        self.assertEqual(self.cc.capacity, 250)
+        num_reallocs = self.cc.get_number_of_reallocs()
+
+        # small fluctuations do not reallocate
+        for size in [190, 210, 240, 150, 230]:
+            self.cc.resize(size)
+            self.assertEqual(self.cc.get_number_of_items(), size)
+            self.assertEqual(self.cc["area"].size, size)
+        self.assertEqual(self.cc.get_number_of_reallocs(), num_reallocs)
+
+    def test_hysteresis(self):
+        self.cc.resize(400)
+        self.assertEqual(self.cc.capacity, 500)
+
+        # memory is only released after sustained decrease
+        self.cc.resize(100)
+        self.cc.resize(100)
+        self.assertEqual(self.cc.capacity, 500)
+        self.cc.resize(100)
+        self.assertEqual(self.cc.capacity, 125)
+        self.assertEqual(self.cc.get_carray("area").alloc, 125)
+        self.assertEqual(self.cc.get_number_of_items(), 100)
+
+        # a large size resets the shrink count
+        self.cc.resize(50)
+        self.cc.resize(50)
+        self.cc.resize(120)
+        self.cc.resize(50)
+        self.assertEqual(self.cc.capacity, 125)
+
+if __name__ == "__main__":
+    unittest.main()
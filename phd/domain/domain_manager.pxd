@@ -37,6 +37,8 @@ cdef class DomainManager:
 
     cdef public double param_initial_radius
     cdef public double param_search_radius_factor
+    cdef public double param_imbalance_threshold
+    cdef public list imbalance_history
 
     # hold/flag particle for ghost creation 
     cdef vector[BoundaryParticle] ghost_vec
@@ -49,6 +51,7 @@ cdef class DomainManager:
     cdef public np.ndarray recv_disp    # receive displacments for mpi
 
     # load balance methods
+    cpdef double local_work(self, CarrayContainer particles)
     cpdef check_for_partition(self, CarrayContainer particles)
     cpdef partition(self, CarrayContainer particles)
 
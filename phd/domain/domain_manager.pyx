@@ -1,4 +1,6 @@
 import phd
+import logging
+import numpy as np
 
 from libc.math cimport fmin
 from cython.operator cimport preincrement as inc
@@ -10,16 +12,24 @@ cdef int REAL = ParticleTAGS.Real
 cdef int GHOST = ParticleTAGS.Ghost
 cdef int Exterior = ParticleTAGS.Exterior
 
+phdLogger = logging.getLogger('phd')
+
 cdef dict fields_for_parallel = {
         "key": "longlong",
         "process": "long",
+        "work": "double",
         }
 
 cdef class DomainManager:
-    def __init__(self, double param_initial_radius, double param_search_radius_factor=2.0):
+    def __init__(self, double param_initial_radius, double param_search_radius_factor=2.0,
+            double param_imbalance_threshold=1.2):
 
         self.param_initial_radius = param_initial_radius
         self.param_search_radius_factor = param_search_radius_factor
+        self.param_imbalance_threshold = param_imbalance_threshold
+
+        # max work, mean work, imbalance and partition flag of each check
+        self.imbalance_history = []
 
         self.domain = None
         self.load_balance = None
@@ -31,12 +41,12 @@ cdef class DomainManager:
         if phd._in_parallel:
 
             # mpi send/receive counts
-            self.send_cnts = np.zeros(phd.size, dtype=np.int32)
-            self.recv_cnts = np.zeros(phd.size, dtype=np.int32)
+            self.send_cnts = np.zeros(phd._size, dtype=np.int32)
+            self.recv_cnts = np.zeros(phd._size, dtype=np.int32)
 
             # mpi send/recieve displacements
-            self.send_disp = np.zeros(phd.size, dtype=np.int32)
-            self.recv_disp = np.zeros(phd.size, dtype=np.int32)
+            self.send_disp = np.zeros(phd._size, dtype=np.int32)
+            self.recv_disp = np.zeros(phd._size, dtype=np.int32)
 
     def register_fields(self, CarrayContainer particles):
         """
@@ -51,9 +61,13 @@ cdef class DomainManager:
                 if field not in particles.carray_info.keys():
                     particles.register_property(num_particles, field, dtype)
 
-        particles.register_property(num_particles, 'map', 'long')
-        particles.register_property(num_particles, 'radius', 'double')
-        particles.register_property(num_particles, 'old_radius', 'double')
+            # equal cost until work is measured
+            particles["work"][:] = 1.
+
+        for field, dtype in [("map", "long"), ("radius", "double"),
+                ("old_radius", "double")]:
+            if field not in particles.carray_info.keys():
+                particles.register_property(num_particles, field, dtype)
 
         # set initial radius for mesh generation
         self.setup_initial_radius(particles)
@@ -63,6 +77,11 @@ cdef class DomainManager:
                 #not self.load_balance or
             raise RuntimeError("Not all setters defined in DomainMangaer")
 
+        if phd._in_parallel and self.load_balance is not None:
+            self.load_balance.domain = self.domain
+            self.load_balance.comm = phd._comm
+            self.load_balance._initialize()
+
     #@check_class(phd.DomainLimits)
     def set_domain_limits(self, domain):
         '''add boundary condition to list'''
@@ -78,17 +97,93 @@ cdef class DomainManager:
         '''add boundary condition to list'''
         self.load_balance = load_balance
 
+    def reduction(self, np.ndarray send, np.ndarray rec, str op):
+        """
+        Reduce send buffer across all processors and store the result
+        in rec. In serial runs send is copied to rec.
+
+        Parameters
+        ----------
+        send : np.ndarray
+            Local values.
+
+        rec : np.ndarray
+            Reduced values.
+
+        op : str
+            Reduction operation, one of 'min', 'max' or 'sum'.
+
+        """
+        if op not in ['min', 'max', 'sum']:
+            raise RuntimeError("DomainManager: unknown reduction %s" % op)
+
+        if phd._in_parallel:
+            from mpi4py import MPI
+            phd._comm.Allreduce(sendbuf=send, recvbuf=rec,
+                    op=getattr(MPI, op.upper()))
+        else:
+            rec[:] = send
+
+    cpdef double local_work(self, CarrayContainer particles):
+        """
+        Return work of the real particles of this processor, the sum
+        of the load balance work fields or the number of real particles
+        if no work fields are set.
+        """
+        cdef str field
+        cdef double work = 0.
+        cdef np.ndarray real = particles["tag"] == REAL
+
+        if self.load_balance is None or not self.load_balance.work_fields:
+            return np.count_nonzero(real)
+
+        for field in self.load_balance.work_fields:
+            work += particles[field][real].sum()
+        return work
+
     cpdef check_for_partition(self, CarrayContainer particles):
         """
-        Check if partition needs to called
+        Check if partition needs to called. The work of each processor
+        is compared across processors and partition is flagged when the
+        max over mean work exceeds param_imbalance_threshold, so the cost
+        of partition is only paid when the work has drifted. Each check
+        is logged and appended to imbalance_history. Always False in
+        serial runs.
         """
-        pass
+        cdef double max_work, mean_work, imbalance
+        cdef np.ndarray loc_work, glb_work
+        cdef bint flag
+
+        if not phd._in_parallel or self.load_balance is None:
+            return False
+
+        loc_work = np.array([self.local_work(particles)], dtype=np.float64)
+        glb_work = np.zeros(1, dtype=np.float64)
+
+        self.reduction(send=loc_work, rec=glb_work, op="max")
+        max_work = glb_work[0]
+        self.reduction(send=loc_work, rec=glb_work, op="sum")
+        mean_work = glb_work[0]/phd._size
+
+        imbalance = max_work/mean_work if mean_work > 0. else 1.
+        flag = imbalance > self.param_imbalance_threshold
+
+        self.imbalance_history.append((max_work, mean_work, imbalance, flag))
+        phdLogger.info("DomainManager: work max %e mean %e imbalance %f%s" %\
+                (max_work, mean_work, imbalance, ", partition" if flag else ""))
+        return flag
 
     cpdef partition(self, CarrayContainer particles):
         """
-        Distribute particles across processors.
+        Distribute particles across processors. Ghost particles are
+        removed and real particles are exchanged so each processor has
+        a segment of the hilbert curve with equal work. Ignored in
+        serial runs.
         """
-        pass
+        if not phd._in_parallel or self.load_balance is None:
+            return
+
+        self.load_balance.decomposition(particles)
 
     cpdef setup_initial_radius(self, CarrayContainer particles):
         cdef int i
@@ -318,16 +413,18 @@ cdef class DomainManager:
         fields : list
             List of field strings to update
         """
-        cdef int i
         cdef str field
-        cdef LongArray indices = LongArray()
+        cdef int i, num_indices = 0
         cdef np.ndarray indices_npy, map_indices_npy
         cdef IntArray types = particles.get_carray("type")
+        cdef LongArray indices = LongArray(types.length)
 
         # find all ghost that need to be updated
-        for i in range(particles.get_number_of_items()):
+        for i in range(types.length):
             if types.data[i] == Exterior:
-                indices.append(i)
+                indices.data[num_indices] = i
+                num_indices += 1
+        indices.resize(num_indices)
 
         if indices.length:
 
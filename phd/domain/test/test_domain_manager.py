@@ -6,6 +6,7 @@ from phd.mesh.mesh import Mesh
 from phd.domain.domain import DomainLimits
 from phd.domain.boundary import Reflective, Periodic
 from phd.domain.domain_manager import DomainManager
+from phd.utils.particle_tags import ParticleTAGS
 from phd.utils.particle_creator import HydroParticleCreator
 
 
@@ -22,6 +23,19 @@ class TestDomainManagerSetup(unittest.TestCase):
         # boundary and domain not set
         self.assertRaises(RuntimeError, self.domain_manager.initialize)
 
+    def test_check_for_partition_serial(self):
+        particles = HydroParticleCreator(num=4, dim=2)
+        particles['tag'][3] = ParticleTAGS.Ghost
+
+        # work is the number of real particles without load balance
+        self.assertEqual(self.domain_manager.local_work(particles), 3)
+
+        # never partition in serial
+        self.assertFalse(self.domain_manager.check_for_partition(particles))
+        self.domain_manager.partition(particles)
+        self.assertEqual(particles.get_number_of_items(), 4)
+        self.assertEqual(self.domain_manager.imbalance_history, [])
+
     def test_check_initial_radius(self):
 
         # create particle in center of lower left quadrant
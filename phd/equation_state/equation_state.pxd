@@ -1,14 +1,65 @@
 cimport numpy as np
 
+from ..utils.carray cimport DoubleArray, LongArray
 from ..containers.containers cimport CarrayContainer
 
 cdef class EquationStateBase:
     cdef public double param_gamma
+    cdef public double param_density_floor
+    cdef public double param_pressure_floor
+
+    # real cells that needed a floor in last primitive update
+    cdef public LongArray bad_cells
+    cdef public long num_violations
+
+    # per cell sound speed and radius for time step
+    cdef public DoubleArray sound_speeds
+    cdef public DoubleArray cell_radius
+    cdef public bint signal_speeds_valid
+
+    # scratch specific internal energy
+    cdef public DoubleArray internal_energy
+
+    # batched equation of state over n cells, particles start to
+    # start + n or not particles if start is negative
+    cdef void pressure_array(self, np.float64_t* d, np.float64_t* u,
+            np.float64_t* p, int n, int start) nogil except *
+    cdef void energy_array(self, np.float64_t* d, np.float64_t* p,
+            np.float64_t* u, int n, int start) nogil except *
+    cdef void sound_speed_array(self, np.float64_t* d, np.float64_t* u,
+            np.float64_t* c, int n, int start) nogil except *
 
     cpdef conserative_from_primitive(self, CarrayContainer particles)
-    cpdef primitive_from_conserative(self, CarrayContainer particles)
+    cpdef primitive_from_conserative(self, CarrayContainer particles, bint signal_speeds=*)
+    cpdef compute_signal_speeds(self, CarrayContainer particles)
+    cdef signal_from_energy(self, CarrayContainer particles)
     cpdef np.float64_t sound_speed(self, np.float64_t density, np.float64_t pressure)
-    cpdef np.float64_t get_gamma(self)
+    cpdef bint has_gamma(self)
+    cpdef np.float64_t get_gamma(self) except? -1
 
 cdef class IdealGas(EquationStateBase):
     pass
+
+cdef class TabulatedEOS(EquationStateBase):
+    cdef public str param_table_file
+
+    # table axes and values, tables are stored density major
+    cdef public DoubleArray table_density
+    cdef public DoubleArray table_energy
+    cdef public DoubleArray table_pressure
+    cdef public DoubleArray table_sound_speed
+    cdef int num_density, num_energy
+
+    # log spaced index lookup
+    cdef double log_density0, inv_dlog_density
+    cdef double log_energy0, inv_dlog_energy
+
+    # last table interval of each cell
+    cdef LongArray density_cache
+    cdef LongArray energy_cache
+    cdef public long num_cache_misses
+    cdef public long num_out_of_table
+
+    cdef prepare_cache(self, int n)
+    cdef void interpolate_array(self, np.float64_t* table, np.float64_t* d,
+            np.float64_t* u, np.float64_t* out, int n, int start) nogil except *
@@ -1,37 +1,321 @@
-from libc.math cimport sqrt
+import numpy as np
 
-from ..utils.carray cimport DoubleArray
+cimport cython
+from libc.math cimport sqrt, pow, log10, floor, fmin, fmax, M_PI
+
+from ..utils.particle_tags import ParticleTAGS
+from ..utils.carray cimport IntArray
+
+cdef int REAL = ParticleTAGS.Real
+
+# number of cells converted at a time
+cdef enum:
+    CELL_BLOCK = 1024
+
+cdef inline double radius_from_volume(double vol, int dim) nogil:
+    """Radius of a circle/sphere with the volume of the cell"""
+    if dim == 2:
+        return sqrt(vol/M_PI)
+    elif dim == 3:
+        return pow(3.0*vol/(4.0*M_PI), 1.0/3.0)
+    return vol
+
+cdef inline void record_floor(int i, np.int8_t* tags, np.float64_t* d,
+        double u, np.float64_t* vol, np.float64_t* m, np.float64_t* e,
+        np.float64_t** v, np.float64_t** mv, int dim, np.int32_t* bad_cells,
+        int* num_bad) nogil:
+    """
+    Update conserative variables of cell i to the floored density and
+    specific internal energy and add real cells to bad cells.
+    """
+    cdef int k
+    cdef double v_sq = 0.
+
+    m[i] = d[i]*vol[i]
+    for k in range(dim):
+        mv[k][i] = v[k][i]*m[i]
+        v_sq += v[k][i]*v[k][i]
+    e[i] = (.5*v_sq + u)*m[i]
+
+    if tags[i] == REAL:
+        bad_cells[num_bad[0]] = i
+        num_bad[0] += 1
 
 cdef class EquationStateBase:
     '''
     Equation of state base. All equation of states must inherit this
     class.
+
+    The thermodynamic state of a cell is given by density and specific
+    internal energy. An equation of state implements the batched methods
+    pressure_array, energy_array and sound_speed_array which operate on
+    whole arrays without the gil, all other methods are built from them.
+    Output arrays may be the same as input arrays. Subclasses may
+    override the particle methods with fused loops.
     '''
+    def __cinit__(self, *args, **kwargs):
+        self.sound_speeds = DoubleArray()
+        self.cell_radius = DoubleArray()
+        self.internal_energy = DoubleArray()
+        self.signal_speeds_valid = False
+
+        self.bad_cells = LongArray()
+        self.num_violations = 0
+        self.param_density_floor = 1.0e-10
+        self.param_pressure_floor = 1.0e-10
+
+    cdef void pressure_array(self, np.float64_t* d, np.float64_t* u,
+            np.float64_t* p, int n, int start) nogil except *:
+        '''
+        Computes pressure p of n cells from density d and specific
+        internal energy u. The cells are particles start to start + n,
+        start is negative if they are not particles (face states or
+        single values).
+        '''
+        with gil:
+            msg = "EquationStateBase::pressure_array called!"
+            raise NotImplementedError(msg)
+
+    cdef void energy_array(self, np.float64_t* d, np.float64_t* p,
+            np.float64_t* u, int n, int start) nogil except *:
+        '''
+        Computes specific internal energy u of n cells from density d
+        and pressure p, see pressure_array for start.
+        '''
+        with gil:
+            msg = "EquationStateBase::energy_array called!"
+            raise NotImplementedError(msg)
+
+    cdef void sound_speed_array(self, np.float64_t* d, np.float64_t* u,
+            np.float64_t* c, int n, int start) nogil except *:
+        '''
+        Computes sound speed c of n cells from density d and specific
+        internal energy u, see pressure_array for start.
+        '''
+        with gil:
+            msg = "EquationStateBase::sound_speed_array called!"
+            raise NotImplementedError(msg)
+
+    def pressure_from_energy(self, np.ndarray d, np.ndarray u):
+        '''
+        Pressure from density and specific internal energy arrays.
+        '''
+        cdef np.ndarray[np.float64_t, ndim=1] _d = np.ascontiguousarray(d, dtype=np.float64)
+        cdef np.ndarray[np.float64_t, ndim=1] _u = np.ascontiguousarray(u, dtype=np.float64)
+        cdef np.ndarray[np.float64_t, ndim=1] p = np.empty(_d.size, dtype=np.float64)
+
+        if _u.size != _d.size:
+            raise RuntimeError("EquationStateBase: inconsistent array sizes")
+        if _d.size == 0:
+            return p
+        self.pressure_array(&_d[0], &_u[0], &p[0], _d.size, -1)
+        return p
+
+    def energy_from_pressure(self, np.ndarray d, np.ndarray p):
+        '''
+        Specific internal energy from density and pressure arrays.
+        '''
+        cdef np.ndarray[np.float64_t, ndim=1] _d = np.ascontiguousarray(d, dtype=np.float64)
+        cdef np.ndarray[np.float64_t, ndim=1] _p = np.ascontiguousarray(p, dtype=np.float64)
+        cdef np.ndarray[np.float64_t, ndim=1] u = np.empty(_d.size, dtype=np.float64)
+
+        if _p.size != _d.size:
+            raise RuntimeError("EquationStateBase: inconsistent array sizes")
+        if _d.size == 0:
+            return u
+        self.energy_array(&_d[0], &_p[0], &u[0], _d.size, -1)
+        return u
+
+    def sound_speed_from_energy(self, np.ndarray d, np.ndarray u):
+        '''
+        Sound speed from density and specific internal energy arrays.
+        '''
+        cdef np.ndarray[np.float64_t, ndim=1] _d = np.ascontiguousarray(d, dtype=np.float64)
+        cdef np.ndarray[np.float64_t, ndim=1] _u = np.ascontiguousarray(u, dtype=np.float64)
+        cdef np.ndarray[np.float64_t, ndim=1] c = np.empty(_d.size, dtype=np.float64)
+
+        if _u.size != _d.size:
+            raise RuntimeError("EquationStateBase: inconsistent array sizes")
+        if _d.size == 0:
+            return c
+        self.sound_speed_array(&_d[0], &_u[0], &c[0], _d.size, -1)
+        return c
+
     cpdef conserative_from_primitive(self, CarrayContainer particles):
         '''
-        Computes conserative variables from primitive variables
+        Computes conserative variables from primitive variables. Calculates
+        for all particles (real + ghost).
         '''
-        msg = "EquationStateBase::conserative_from_primitive called!"
-        raise NotImplementedError(msg)
+        cdef DoubleArray m = particles.get_carray("mass")
+        cdef DoubleArray e = particles.get_carray("energy")
+        cdef DoubleArray d = particles.get_carray("density")
+        cdef DoubleArray p = particles.get_carray("pressure")
+        cdef DoubleArray vol = particles.get_carray("volume")
+
+        cdef int i, k, dim
+        cdef int num_particles = particles.get_number_of_items()
+        cdef np.float64_t v_sq, *u
+        cdef np.float64_t *v[3], *mv[3]
+
+        dim = len(particles.named_groups['position'])
+        particles.pointer_groups(v,  particles.named_groups['velocity'])
+        particles.pointer_groups(mv, particles.named_groups['momentum'])
+
+        self.internal_energy.resize(num_particles)
+        u = self.internal_energy.data
+
+        with nogil:
+            self.energy_array(d.data, p.data, u, num_particles, 0)
+
+            for i in range(num_particles):
+                m.data[i] = d.data[i]*vol.data[i]
+
+                v_sq = 0.
+                for k in range(dim):
+                    mv[k][i] = v[k][i]*m.data[i]
+                    v_sq    += v[k][i]*v[k][i]
 
-    cpdef primitive_from_conserative(self, CarrayContainer particles):
+                e.data[i] = (.5*v_sq + u[i])*m.data[i]
+
+    cpdef primitive_from_conserative(self, CarrayContainer particles, bint signal_speeds=False):
         '''
-        Computes primitive variables from conserative variables
+        Computes primitive variables from conserative variables. Calculates
+        for all particles (real + ghost). Density and pressure below the
+        floors are raised to the floors and the conserative variables of
+        the cell are updated to match, real cells that needed a floor are
+        recorded in bad_cells. If signal_speeds is True the sound speed and
+        radius of each cell are stored in sound_speeds and cell_radius.
         '''
-        msg = "EquationStateBase::primitive_from_conserative called!"
-        raise NotImplementedError(msg)
+        cdef IntArray tags = particles.get_carray("tag")
+        cdef DoubleArray m = particles.get_carray("mass")
+        cdef DoubleArray e = particles.get_carray("energy")
+        cdef DoubleArray d = particles.get_carray("density")
+        cdef DoubleArray p = particles.get_carray("pressure")
+        cdef DoubleArray vol = particles.get_carray("volume")
+
+        cdef int i, k, c, dim, start, end, num_bad = 0
+        cdef int num_particles = particles.get_number_of_items()
+        cdef double d_floor = self.param_density_floor
+        cdef double p_floor = self.param_pressure_floor
+        cdef bint bad[CELL_BLOCK]
+        cdef np.float64_t v_sq, *u
+        cdef np.float64_t *v[3], *mv[3]
+        cdef np.int32_t* bad_cells
+
+        dim = len(particles.named_groups['position'])
+        particles.pointer_groups(v,  particles.named_groups['velocity'])
+        particles.pointer_groups(mv, particles.named_groups['momentum'])
+
+        self.internal_energy.resize(num_particles)
+        self.bad_cells.resize(num_particles)
+        u = self.internal_energy.data
+        bad_cells = self.bad_cells.data
+
+        with nogil:
+            # blocks keep the batched pressure call in cache
+            for c in range((num_particles + CELL_BLOCK - 1)/CELL_BLOCK):
+                start = c*CELL_BLOCK
+                end = min(start + CELL_BLOCK, num_particles)
+
+                for i in range(start, end):
+                    d.data[i] = m.data[i]/vol.data[i]
+                    bad[i-start] = not (d.data[i] >= d_floor)
+                    if bad[i-start]:
+                        d.data[i] = d_floor
+
+                    v_sq = 0.
+                    for k in range(dim):
+                        v[k][i] = mv[k][i]/m.data[i] if m.data[i] > 0. else 0.
+                        v_sq   += v[k][i]*v[k][i]
+
+                    u[i] = e.data[i]/(vol.data[i]*d.data[i]) - .5*v_sq
+
+                self.pressure_array(d.data + start, u + start, p.data + start,
+                        end - start, start)
+
+                for i in range(start, end):
+                    if not (p.data[i] >= p_floor):
+                        bad[i-start] = True
+                        p.data[i] = p_floor
+                        self.energy_array(&d.data[i], &p.data[i], &u[i], 1, i)
+
+                    if bad[i-start]:
+                        record_floor(i, tags.data, d.data, u[i], vol.data, m.data,
+                                e.data, v, mv, dim, bad_cells, &num_bad)
+
+        self.bad_cells.resize(num_bad)
+        self.num_violations = num_bad
+
+        if signal_speeds:
+            self.signal_from_energy(particles)
+        else:
+            self.signal_speeds_valid = False
+
+    cpdef compute_signal_speeds(self, CarrayContainer particles):
+        '''
+        Computes sound speed and radius of each cell from the current
+        primitive variables and volumes.
+        '''
+        cdef DoubleArray d = particles.get_carray("density")
+        cdef DoubleArray p = particles.get_carray("pressure")
+        cdef int num_particles = particles.get_number_of_items()
+
+        self.internal_energy.resize(num_particles)
+        with nogil:
+            self.energy_array(d.data, p.data, self.internal_energy.data,
+                    num_particles, 0)
+        self.signal_from_energy(particles)
+
+    cdef signal_from_energy(self, CarrayContainer particles):
+        '''
+        Computes sound speed and radius of each cell from density and
+        the specific internal energy in internal_energy.
+        '''
+        cdef DoubleArray d = particles.get_carray("density")
+        cdef DoubleArray vol = particles.get_carray("volume")
+
+        cdef int i, dim
+        cdef int num_particles = particles.get_number_of_items()
+
+        dim = len(particles.named_groups['position'])
+        self.sound_speeds.resize(num_particles)
+        self.cell_radius.resize(num_particles)
+
+        with nogil:
+            self.sound_speed_array(d.data, self.internal_energy.data,
+                    self.sound_speeds.data, num_particles, 0)
+            for i in range(num_particles):
+                self.cell_radius.data[i] = radius_from_volume(vol.data[i], dim)
+
+        self.signal_speeds_valid = True
 
     cpdef np.float64_t sound_speed(self, np.float64_t density, np.float64_t pressure):
-        msg = "EquationStateBase::pressure_by_index called!"
-        raise NotImplementedError(msg)
+        '''
+        Sound speed of a single cell, prefer sound_speed_array for many
+        cells.
+        '''
+        cdef np.float64_t u, c
+        self.energy_array(&density, &pressure, &u, 1, -1)
+        self.sound_speed_array(&density, &u, &c, 1, -1)
+        return c
 
-    cpdef np.float64_t get_gamma(self):
+    cpdef bint has_gamma(self):
+        '''
+        True if the equation of state has a constant adiabatic index,
+        solvers that are built on the ideal gas relations need it.
+        '''
+        return False
+
+    cpdef np.float64_t get_gamma(self) except? -1:
         msg = "EquationStateBase::get_gamma called!"
         raise NotImplementedError(msg)
 
 cdef class IdealGas(EquationStateBase):
-    def __init__(self, param_gamma = 1.4):
+    def __init__(self, param_gamma = 1.4, param_density_floor=1.0e-10,
+            param_pressure_floor=1.0e-10):
         self.param_gamma = param_gamma
+        self.param_density_floor = param_density_floor
+        self.param_pressure_floor = param_pressure_floor
 
     cpdef conserative_from_primitive(self, CarrayContainer particles):
         '''
@@ -71,11 +355,16 @@ cdef class IdealGas(EquationStateBase):
             # total energy in cell
             e.data[i] = (.5*d.data[i]*v_sq + p.data[i]/(self.param_gamma-1.))*vol.data[i]
 
-    cpdef primitive_from_conserative(self, CarrayContainer particles):
+    cpdef primitive_from_conserative(self, CarrayContainer particles, bint signal_speeds=False):
         '''
         Computes primitive variables from conserative variables. Calculates
-        for all particles (real + ghost).
+        for all particles (real + ghost) in one pass, applies density and
+        pressure floors and records real cells that needed a floor, see
+        EquationStateBase. If signal_speeds is True the sound speed and
+        radius of each cell are computed in the same pass.
         '''
+        cdef IntArray tags = particles.get_carray("tag")
+
         # conserative variables
         cdef DoubleArray m = particles.get_carray("mass")
         cdef DoubleArray e = particles.get_carray("energy")
@@ -87,28 +376,112 @@ cdef class IdealGas(EquationStateBase):
         # particle volume
         cdef DoubleArray vol = particles.get_carray("volume")
 
-        cdef int i, k
-        cdef np.float64_t vs_sq
+        cdef int i, k, dim, num_bad = 0
+        cdef int num_particles = particles.get_number_of_items()
+        cdef double gamma = self.param_gamma
+        cdef double d_floor = self.param_density_floor
+        cdef double p_floor = self.param_pressure_floor
+        cdef bint bad
+        cdef np.float64_t v_sq, u
         cdef np.float64_t *v[3], *mv[3]
+        cdef np.float64_t *cs = NULL, *R = NULL
+        cdef np.int32_t* bad_cells
 
         dim = len(particles.named_groups['position'])
         particles.pointer_groups(v,  particles.named_groups['velocity'])
         particles.pointer_groups(mv, particles.named_groups['momentum'])
 
+        if signal_speeds:
+            self.sound_speeds.resize(num_particles)
+            self.cell_radius.resize(num_particles)
+            cs = self.sound_speeds.data
+            R = self.cell_radius.data
+
+        self.bad_cells.resize(num_particles)
+        bad_cells = self.bad_cells.data
+
         # loop through all particles (real + ghost)
-        for i in range(particles.get_number_of_items()):
+        with nogil:
+            for i in range(num_particles):
 
-            # density in cell
-            d.data[i] = m.data[i]/vol.data[i]
+                # density in cell
+                d.data[i] = m.data[i]/vol.data[i]
+                bad = not (d.data[i] >= d_floor)
+                if bad:
+                    d.data[i] = d_floor
 
-            # velocity in cell
-            v_sq = 0.
-            for k in range(dim):
-                v[k][i] = mv[k][i]/m.data[i]
-                v_sq   += v[k][i]*v[k][i]
+                # velocity in cell
+                v_sq = 0.
+                for k in range(dim):
+                    v[k][i] = mv[k][i]/m.data[i] if m.data[i] > 0. else 0.
+                    v_sq   += v[k][i]*v[k][i]
+
+                # pressure in cell
+                p.data[i] = (e.data[i]/vol.data[i] - .5*d.data[i]*v_sq)*(gamma-1.)
+                if not (p.data[i] >= p_floor):
+                    bad = True
+                    p.data[i] = p_floor
+
+                if bad:
+                    u = p.data[i]/((gamma - 1.)*d.data[i])
+                    record_floor(i, tags.data, d.data, u, vol.data, m.data,
+                            e.data, v, mv, dim, bad_cells, &num_bad)
+
+                if signal_speeds:
+                    cs[i] = sqrt(gamma*p.data[i]/d.data[i])
+                    R[i] = radius_from_volume(vol.data[i], dim)
+
+        self.bad_cells.resize(num_bad)
+        self.num_violations = num_bad
+        self.signal_speeds_valid = signal_speeds
+
+    cpdef compute_signal_speeds(self, CarrayContainer particles):
+        '''
+        Computes sound speed and radius of each cell from the current
+        primitive variables and volumes.
+        '''
+        cdef DoubleArray d = particles.get_carray("density")
+        cdef DoubleArray p = particles.get_carray("pressure")
+        cdef DoubleArray vol = particles.get_carray("volume")
+
+        cdef int i, dim
+        cdef int num_particles = particles.get_number_of_items()
+        cdef double gamma = self.param_gamma
+
+        dim = len(particles.named_groups['position'])
+        self.sound_speeds.resize(num_particles)
+        self.cell_radius.resize(num_particles)
+
+        with nogil:
+            for i in range(num_particles):
+                self.sound_speeds.data[i] = sqrt(gamma*p.data[i]/d.data[i])
+                self.cell_radius.data[i] = radius_from_volume(vol.data[i], dim)
+
+        self.signal_speeds_valid = True
+
+    @cython.cdivision(True)
+    cdef void pressure_array(self, np.float64_t* d, np.float64_t* u,
+            np.float64_t* p, int n, int start) nogil except *:
+        cdef int i
+        cdef double gm1 = self.param_gamma - 1.
+        for i in range(n):
+            p[i] = gm1*d[i]*u[i]
+
+    @cython.cdivision(True)
+    cdef void energy_array(self, np.float64_t* d, np.float64_t* p,
+            np.float64_t* u, int n, int start) nogil except *:
+        cdef int i
+        cdef double gm1 = self.param_gamma - 1.
+        for i in range(n):
+            u[i] = p[i]/(gm1*d[i])
 
-            # pressure in cell
-            p.data[i] = (e.data[i]/vol.data[i] - .5*d.data[i]*v_sq)*(self.param_gamma-1.)
+    @cython.cdivision(True)
+    cdef void sound_speed_array(self, np.float64_t* d, np.float64_t* u,
+            np.float64_t* c, int n, int start) nogil except *:
+        cdef int i
+        cdef double fac = self.param_gamma*(self.param_gamma - 1.)
+        for i in range(n):
+            c[i] = sqrt(fac*u[i])
 
     cpdef np.float64_t sound_speed(self, np.float64_t density, np.float64_t pressure):
         """
@@ -116,5 +489,275 @@ cdef class IdealGas(EquationStateBase):
         """
         return sqrt(self.param_gamma*pressure/density)
 
-    cpdef np.float64_t get_gamma(self):
+    cpdef bint has_gamma(self):
+        return True
+
+    cpdef np.float64_t get_gamma(self) except? -1:
         return self.param_gamma
+
+@cython.cdivision(True)
+cdef inline int find_bracket(double x, np.float64_t* axis, int num,
+        double log_x0, double inv_dlog, np.int32_t* cache, long* num_misses,
+        long* num_out, double* w) nogil:
+    """
+    Index j of table interval [axis[j], axis[j+1]] containing x and the
+    linear weight w of x in the interval. The cached interval is tried
+    first, on a miss the interval is found from the log spacing of axis.
+    Values outside the table are clamped to the table edge.
+    """
+    cdef int j = cache[0]
+
+    if not (0 <= j < num - 1 and axis[j] <= x <= axis[j+1]):
+        num_misses[0] += 1
+
+        if x <= axis[0]:
+            j = 0
+        elif x >= axis[num-1]:
+            j = num - 2
+        else:
+            j = <int> floor((log10(x) - log_x0)*inv_dlog)
+            j = min(max(j, 0), num - 2)
+
+            # guard against round off in log lookup
+            if x < axis[j]:
+                j -= 1
+            elif x > axis[j+1]:
+                j += 1
+        cache[0] = j
+
+    w[0] = (x - axis[j])/(axis[j+1] - axis[j])
+    if w[0] < 0. or w[0] > 1.:
+        num_out[0] += 1
+        w[0] = fmin(fmax(w[0], 0.), 1.)
+    return j
+
+cdef inline double bilinear(np.float64_t* table, int num_u,
+        int jd, double wd, int ju, double wu) nogil:
+    """Bilinear interpolation of table at interval (jd, ju) with weights (wd, wu)"""
+    cdef np.float64_t* t = table + jd*num_u + ju
+    return (1. - wd)*((1. - wu)*t[0] + wu*t[1]) +\
+            wd*((1. - wu)*t[num_u] + wu*t[num_u+1])
+
+cdef class TabulatedEOS(EquationStateBase):
+    """
+    Equation of state interpolated from a table of pressure and sound
+    speed as a function of density and specific internal energy.
+
+    The table is a npz or HDF5 file with the log spaced axes 'density'
+    (size nd) and 'energy' (size nu) and the tables 'pressure' and
+    'sound_speed' of shape (nd, nu). Pressure has to increase with energy
+    at fixed density. Values are found by bilinear interpolation, the
+    table interval of each particle is cached across calls so slowly
+    changing states skip the lookup.
+
+    Attributes
+    ----------
+    param_table_file : str
+        Name of table file.
+
+    num_cache_misses : long
+        Number of particle lookups not found in the cached interval.
+
+    num_out_of_table : long
+        Number of values clamped to the table edge.
+
+    """
+    def __init__(self, str param_table_file, double param_density_floor=1.0e-10,
+            double param_pressure_floor=1.0e-10):
+        self.param_table_file = param_table_file
+        self.param_density_floor = param_density_floor
+        self.param_pressure_floor = param_pressure_floor
+
+        self.density_cache = LongArray()
+        self.energy_cache = LongArray()
+        self.num_cache_misses = 0
+        self.num_out_of_table = 0
+
+        self.load_table(param_table_file)
+
+    def load_table(self, str filename):
+        """
+        Read table from npz or HDF5 file and setup index lookup.
+        """
+        fields = ["density", "energy", "pressure", "sound_speed"]
+
+        if filename.endswith(".npz"):
+            data = np.load(filename)
+            tables = dict((field, np.asarray(data[field], dtype=np.float64))
+                    for field in fields)
+            data.close()
+        elif filename.endswith((".hdf5", ".h5")):
+            import h5py
+            with h5py.File(filename, "r") as f:
+                tables = dict((field, np.asarray(f[field][:], dtype=np.float64))
+                        for field in fields)
+        else:
+            raise RuntimeError("TabulatedEOS: unknown table format %s" % filename)
+
+        self.set_table(tables["density"], tables["energy"],
+                tables["pressure"], tables["sound_speed"])
+
+    def set_table(self, np.ndarray density, np.ndarray energy,
+            np.ndarray pressure, np.ndarray sound_speed):
+        """
+        Set table and precompute log spaced index lookup.
+        """
+        cdef str name
+        cdef np.ndarray dlog
+
+        for name, axis in [("density", density), ("energy", energy)]:
+            if axis.ndim != 1 or axis.size < 2 or np.any(axis <= 0.):
+                raise RuntimeError("TabulatedEOS: %s axis not positive 1d array" % name)
+            dlog = np.diff(np.log10(axis))
+            if not np.allclose(dlog, dlog[0], rtol=1.0e-6) or dlog[0] <= 0.:
+                raise RuntimeError("TabulatedEOS: %s axis not log spaced" % name)
+
+        for name, table in [("pressure", pressure), ("sound_speed", sound_speed)]:
+            if table.shape != (density.size, energy.size):
+                raise RuntimeError("TabulatedEOS: %s table has wrong shape" % name)
+
+        if np.any(np.diff(pressure, axis=1) <= 0.):
+            raise RuntimeError("TabulatedEOS: pressure not increasing with energy")
+
+        self.num_density = density.size
+        self.num_energy = energy.size
+
+        self.log_density0 = np.log10(density[0])
+        self.log_energy0 = np.log10(energy[0])
+        self.inv_dlog_density = (density.size - 1)/(np.log10(density[-1]) - self.log_density0)
+        self.inv_dlog_energy = (energy.size - 1)/(np.log10(energy[-1]) - self.log_energy0)
+
+        self.table_density = DoubleArray(density.size)
+        self.table_energy = DoubleArray(energy.size)
+        self.table_pressure = DoubleArray(pressure.size)
+        self.table_sound_speed = DoubleArray(sound_speed.size)
+
+        self.table_density.get_npy_array()[:] = density
+        self.table_energy.get_npy_array()[:] = energy
+        self.table_pressure.get_npy_array()[:] = pressure.ravel()
+        self.table_sound_speed.get_npy_array()[:] = sound_speed.ravel()
+
+        # cached intervals refer to old table
+        self.density_cache.resize(0)
+        self.energy_cache.resize(0)
+
+    cdef prepare_cache(self, int n):
+        """Extend cached intervals to n cells, new cells have no interval"""
+        cdef long old = self.density_cache.length
+        if old < n:
+            self.density_cache.resize(n)
+            self.energy_cache.resize(n)
+            self.density_cache.get_npy_array()[old:] = -1
+            self.energy_cache.get_npy_array()[old:] = -1
+
+    cdef void interpolate_array(self, np.float64_t* table, np.float64_t* d,
+            np.float64_t* u, np.float64_t* out, int n, int start) nogil except *:
+        """
+        Interpolate table at n cells of density d and energy u. Cells
+        that are not particles (start negative) are looked up without
+        the cache.
+        """
+        cdef int i, jd, ju
+        cdef double wd, wu
+        cdef long num_misses = 0, num_out = 0
+        cdef np.int32_t dc = -1, ec = -1
+        cdef np.int32_t *dcache = &dc, *ecache = &ec
+
+        if start >= 0 and self.density_cache.length < start + n:
+            with gil:
+                self.prepare_cache(start + n)
+
+        for i in range(n):
+            if start >= 0:
+                dcache = self.density_cache.data + start + i
+                ecache = self.energy_cache.data + start + i
+            else:
+                dc = ec = -1
+
+            jd = find_bracket(d[i], self.table_density.data, self.num_density,
+                    self.log_density0, self.inv_dlog_density, dcache,
+                    &num_misses, &num_out, &wd)
+            ju = find_bracket(u[i], self.table_energy.data, self.num_energy,
+                    self.log_energy0, self.inv_dlog_energy, ecache,
+                    &num_misses, &num_out, &wu)
+            out[i] = bilinear(table, self.num_energy, jd, wd, ju, wu)
+
+        self.num_out_of_table += num_out
+        if start >= 0:
+            self.num_cache_misses += num_misses
+
+    cdef void pressure_array(self, np.float64_t* d, np.float64_t* u,
+            np.float64_t* p, int n, int start) nogil except *:
+        self.interpolate_array(self.table_pressure.data, d, u, p, n, start)
+
+    cdef void sound_speed_array(self, np.float64_t* d, np.float64_t* u,
+            np.float64_t* c, int n, int start) nogil except *:
+        self.interpolate_array(self.table_sound_speed.data, d, u, c, n, start)
+
+    @cython.cdivision(True)
+    cdef void energy_array(self, np.float64_t* d, np.float64_t* p,
+            np.float64_t* u, int n, int start) nogil except *:
+        """
+        Invert pressure table, at fixed density pressure is linear in
+        energy within an interval so the inversion is exact for the
+        interpolated table. Cache is used as in interpolate_array.
+        """
+        cdef int i, jd, ju, lo, hi, mid
+        cdef int nu = self.num_energy
+        cdef double wd, wu, p0, p1
+        cdef long num_misses = 0, num_out = 0
+        cdef np.int32_t dc = -1, ec = -1
+        cdef np.int32_t *dcache = &dc, *ecache = &ec
+        cdef np.float64_t* P = self.table_pressure.data
+        cdef np.float64_t* e = self.table_energy.data
+
+        if start >= 0 and self.density_cache.length < start + n:
+            with gil:
+                self.prepare_cache(start + n)
+
+        for i in range(n):
+            if start >= 0:
+                dcache = self.density_cache.data + start + i
+                ecache = self.energy_cache.data + start + i
+            else:
+                dc = ec = -1
+
+            jd = find_bracket(d[i], self.table_density.data, self.num_density,
+                    self.log_density0, self.inv_dlog_density, dcache,
+                    &num_misses, &num_out, &wd)
+
+            # try cached energy interval first
+            ju = ecache[0]
+            if 0 <= ju < nu - 1:
+                p0 = (1. - wd)*P[jd*nu + ju]   + wd*P[(jd+1)*nu + ju]
+                p1 = (1. - wd)*P[jd*nu + ju+1] + wd*P[(jd+1)*nu + ju+1]
+
+            if not (0 <= ju < nu - 1 and p0 <= p[i] <= p1):
+                num_misses += 1
+
+                # bisection on pressure column at density
+                lo = 0; hi = nu - 1
+                while hi - lo > 1:
+                    mid = (lo + hi)/2
+                    if (1. - wd)*P[jd*nu + mid] + wd*P[(jd+1)*nu + mid] <= p[i]:
+                        lo = mid
+                    else:
+                        hi = mid
+                ju = lo
+                ecache[0] = ju
+
+                p0 = (1. - wd)*P[jd*nu + ju]   + wd*P[(jd+1)*nu + ju]
+                p1 = (1. - wd)*P[jd*nu + ju+1] + wd*P[(jd+1)*nu + ju+1]
+
+            wu = (p[i] - p0)/(p1 - p0)
+            if wu < 0. or wu > 1.:
+                num_out += 1
+                wu = fmin(fmax(wu, 0.), 1.)
+            u[i] = e[ju] + wu*(e[ju+1] - e[ju])
+
+        self.num_out_of_table += num_out
+        if start >= 0:
+            self.num_cache_misses += num_misses
+
+    cpdef np.float64_t get_gamma(self) except? -1:
+        raise RuntimeError("TabulatedEOS: no constant adiabatic index")
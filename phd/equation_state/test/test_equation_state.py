@@ -0,0 +1,269 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from phd.equation_state.equation_state import EquationStateBase, IdealGas,\
+        TabulatedEOS
+from phd.utils.particle_creator import HydroParticleCreator
+
+class TestIdealGasArrays(unittest.TestCase):
+    """Tests batched equation of state of ideal gas."""
+    def setUp(self):
+        self.eos = IdealGas(param_gamma=5./3.)
+        self.d = 0.1 + np.random.rand(100)
+        self.p = 0.1 + np.random.rand(100)
+
+    def test_arrays(self):
+        gamma = 5./3.
+        u = self.eos.energy_from_pressure(self.d, self.p)
+        self.assertTrue(np.allclose(u, self.p/((gamma - 1.)*self.d)))
+
+        p = self.eos.pressure_from_energy(self.d, u)
+        self.assertTrue(np.allclose(p, self.p))
+
+        c = self.eos.sound_speed_from_energy(self.d, u)
+        self.assertTrue(np.allclose(c, np.sqrt(gamma*self.p/self.d)))
+
+        # scalar interface agrees with arrays
+        for i in range(10):
+            self.assertAlmostEqual(self.eos.sound_speed(self.d[i], self.p[i]), c[i])
+
+        self.assertEqual(self.eos.pressure_from_energy(np.zeros(0), np.zeros(0)).size, 0)
+        self.assertRaises(RuntimeError, self.eos.pressure_from_energy,
+                self.d, u[:10])
+
+    def test_base(self):
+        eos = EquationStateBase()
+        self.assertRaises(NotImplementedError, eos.pressure_from_energy,
+                self.d, self.p)
+        self.assertRaises(NotImplementedError, eos.sound_speed_from_energy,
+                self.d, self.p)
+
+class TestIdealGasParticles(unittest.TestCase):
+    """Tests conversion between primitive and conserative variables."""
+    def setUp(self):
+        num = 100
+        self.particles = HydroParticleCreator(num=num, dim=2)
+        self.particles["density"][:] = 0.1 + np.random.rand(num)
+        self.particles["pressure"][:] = 0.1 + np.random.rand(num)
+        self.particles["velocity-x"][:] = np.random.randn(num)
+        self.particles["velocity-y"][:] = np.random.randn(num)
+        self.particles["volume"][:] = 0.01*(0.5 + np.random.rand(num))
+        self.eos = IdealGas(param_gamma=1.4)
+
+    def test_round_trip(self):
+        fields = ["density", "velocity-x", "velocity-y", "pressure"]
+        initial = dict((field, self.particles[field].copy()) for field in fields)
+
+        self.eos.conserative_from_primitive(self.particles)
+        for field in fields:
+            self.particles[field][:] = 0.
+        self.eos.primitive_from_conserative(self.particles, True)
+
+        for field in fields:
+            self.assertTrue(np.allclose(initial[field], self.particles[field]))
+
+        # signal speeds from the same pass
+        self.assertTrue(self.eos.signal_speeds_valid)
+        c = self.eos.sound_speeds.get_npy_array().copy()
+        self.assertTrue(np.allclose(c, np.sqrt(1.4*initial["pressure"]/initial["density"])))
+        self.assertTrue(np.allclose(self.eos.cell_radius.get_npy_array(),
+            np.sqrt(self.particles["volume"]/np.pi)))
+
+        self.eos.compute_signal_speeds(self.particles)
+        self.assertTrue(np.allclose(c, self.eos.sound_speeds.get_npy_array()))
+
+class TestFloors(unittest.TestCase):
+    """Tests floors and bad cell records of primitive update."""
+    def setUp(self):
+        num = 2000
+        self.particles = HydroParticleCreator(num=num, dim=2)
+        self.particles["density"][:] = 1.0
+        self.particles["pressure"][:] = 1.0
+        self.particles["velocity-x"][:] = 0.5
+        self.particles["velocity-y"][:] = 0.0
+        self.particles["volume"][:] = 0.01
+        self.particles["tag"][:] = 0
+        self.particles["tag"][-100:] = 1
+
+    def check_floors(self, eos):
+        eos.conserative_from_primitive(self.particles)
+
+        # negative pressure, negative mass and ghost violation
+        bad = [3, 1500]
+        self.particles["energy"][3] = 0.
+        self.particles["mass"][1500] = -1.
+        self.particles["energy"][1950] = -1.
+
+        eos.primitive_from_conserative(self.particles, True)
+        self.assertEqual(eos.num_violations, 2)
+        self.assertTrue(np.array_equal(eos.bad_cells.get_npy_array(), bad))
+
+        self.assertAlmostEqual(self.particles["pressure"][3], eos.param_pressure_floor)
+        self.assertAlmostEqual(self.particles["density"][1500], eos.param_density_floor)
+        self.assertAlmostEqual(self.particles["pressure"][1950], eos.param_pressure_floor)
+        self.assertTrue(np.all(np.isfinite(eos.sound_speeds.get_npy_array())))
+
+        # conserative variables consistent with floors
+        self.assertAlmostEqual(self.particles["mass"][1500], 0.01*eos.param_density_floor)
+        self.assertTrue(self.particles["energy"][3] > 0.)
+
+        # other cells untouched
+        good = np.ones(2000, dtype=bool)
+        good[[3, 1500, 1950]] = False
+        self.assertTrue(np.allclose(self.particles["pressure"][good], 1.0))
+        self.assertTrue(np.allclose(self.particles["density"][good], 1.0))
+
+        # clean state has no violations
+        self.particles["mass"][:] = 0.01
+        self.particles["energy"][:] = 0.01*(0.5*0.25 + 1.0/0.4)
+        eos.primitive_from_conserative(self.particles)
+        self.assertEqual(eos.num_violations, 0)
+        self.assertEqual(eos.bad_cells.length, 0)
+
+    def test_ideal_gas(self):
+        self.check_floors(IdealGas(param_gamma=1.4, param_pressure_floor=1.0e-6,
+            param_density_floor=1.0e-4))
+
+    def test_tabulated(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, "table.npz")
+            np.savez(filename, **ideal_gas_table(nd=256, nu=1024))
+            self.check_floors(TabulatedEOS(filename, param_pressure_floor=1.0e-6,
+                param_density_floor=1.0e-4))
+        finally:
+            shutil.rmtree(path)
+
+def ideal_gas_table(gamma=1.4, nd=64, nu=128):
+    """Ideal gas table, pressure is bilinear in density and energy"""
+    d = np.logspace(-5, 2, nd)
+    u = np.logspace(-6, 3, nu)
+    D, U = np.meshgrid(d, u, indexing="ij")
+    return {"density": d, "energy": u, "pressure": (gamma - 1.)*D*U,
+            "sound_speed": np.sqrt(gamma*(gamma - 1.)*U)}
+
+class TestTabulatedEOS(unittest.TestCase):
+    """Tests tabulated equation of state against ideal gas."""
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.table = ideal_gas_table()
+        self.filename = os.path.join(self.path, "table.npz")
+        np.savez(self.filename, **self.table)
+
+        self.eos = TabulatedEOS(self.filename)
+        self.d = 10**(-2 + 3*np.random.rand(1000))
+        self.u = 10**(-1 + 3*np.random.rand(1000))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_interpolation(self):
+        p = self.eos.pressure_from_energy(self.d, self.u)
+        self.assertTrue(np.allclose(p, 0.4*self.d*self.u))
+
+        c = self.eos.sound_speed_from_energy(self.d, self.u)
+        self.assertTrue(np.allclose(c, np.sqrt(1.4*0.4*self.u), rtol=1.0e-3))
+
+        # inversion is exact for interpolated table
+        u = self.eos.energy_from_pressure(self.d, p)
+        self.assertTrue(np.allclose(u, self.u))
+        self.assertEqual(self.eos.num_out_of_table, 0)
+
+    def test_gamma(self):
+        # table has no adiabatic index to hand to ideal gas solvers
+        self.assertFalse(self.eos.has_gamma())
+        self.assertRaises(RuntimeError, self.eos.get_gamma)
+        self.assertTrue(IdealGas(param_gamma=1.4).has_gamma())
+
+    def test_cache(self):
+        num = 5000
+        particles = HydroParticleCreator(num=num, dim=2)
+        particles["density"][:] = self.d[np.arange(num) % self.d.size]
+        particles["pressure"][:] = 0.4*particles["density"]*\
+                self.u[np.arange(num) % self.u.size]
+        particles["velocity-x"][:] = 0.
+        particles["velocity-y"][:] = 0.
+        particles["volume"][:] = 0.01*(0.5 + np.random.rand(num))
+
+        # first lookup of each particle misses
+        self.eos.conserative_from_primitive(particles)
+        self.assertEqual(self.eos.num_cache_misses, 2*num)
+
+        # particles of all blocks keep their intervals
+        self.eos.primitive_from_conserative(particles)
+        self.eos.primitive_from_conserative(particles)
+        num_misses = self.eos.num_cache_misses
+        self.assertTrue(num_misses - 2*num < 0.01*num)
+
+        # single values and arrays do not touch the cache
+        self.eos.sound_speed(1.0e-3, 1.0e-3)
+        self.eos.pressure_from_energy(self.d, self.u)
+        self.assertEqual(self.eos.num_cache_misses, num_misses)
+
+        # small changes stay in cached interval
+        particles["energy"][:] *= 1. + 1.0e-6
+        self.eos.primitive_from_conserative(particles)
+        self.assertTrue(self.eos.num_cache_misses - num_misses < 0.01*num)
+
+    def test_out_of_table(self):
+        p = self.eos.pressure_from_energy(np.array([1.0e-7, 1.0e3]),
+                np.array([1., 1.0e5]))
+        self.assertEqual(self.eos.num_out_of_table, 3)
+        self.assertAlmostEqual(p[0], 0.4*1.0e-5)
+        self.assertAlmostEqual(p[1], 0.4*1.0e2*1.0e3)
+
+    def test_bad_table(self):
+        table = ideal_gas_table()
+        table["density"] = np.linspace(1., 2., table["density"].size)
+        self.assertRaises(RuntimeError, self.eos.set_table, table["density"],
+                table["energy"], table["pressure"], table["sound_speed"])
+
+        table = ideal_gas_table()
+        self.assertRaises(RuntimeError, self.eos.set_table, table["density"],
+                table["energy"], -table["pressure"], table["sound_speed"])
+        self.assertRaises(RuntimeError, TabulatedEOS,
+                os.path.join(self.path, "table.txt"))
+
+    def test_hdf5(self):
+        try:
+            import h5py
+        except ImportError:
+            raise unittest.SkipTest("h5py not installed")
+
+        filename = os.path.join(self.path, "table.hdf5")
+        with h5py.File(filename, "w") as f:
+            for field, data in self.table.items():
+                f.create_dataset(field, data=data)
+
+        eos = TabulatedEOS(filename)
+        self.assertTrue(np.allclose(eos.pressure_from_energy(self.d, self.u),
+            self.eos.pressure_from_energy(self.d, self.u)))
+
+    def test_particles(self):
+        num = 100
+        particles = HydroParticleCreator(num=num, dim=2)
+        particles["density"][:] = 0.1 + np.random.rand(num)
+        particles["pressure"][:] = 0.1 + np.random.rand(num)
+        particles["velocity-x"][:] = np.random.randn(num)
+        particles["velocity-y"][:] = np.random.randn(num)
+        particles["volume"][:] = 0.01*(0.5 + np.random.rand(num))
+
+        ideal = IdealGas(param_gamma=1.4)
+        ideal.conserative_from_primitive(particles)
+        energy = particles["energy"].copy()
+
+        # same conserative variables as ideal gas
+        self.eos.conserative_from_primitive(particles)
+        self.assertTrue(np.allclose(energy, particles["energy"]))
+
+        pressure = particles["pressure"].copy()
+        self.eos.primitive_from_conserative(particles, True)
+        self.assertTrue(np.allclose(pressure, particles["pressure"]))
+        self.assertTrue(np.allclose(self.eos.sound_speeds.get_npy_array(),
+            np.sqrt(1.4*pressure/particles["density"]), rtol=1.0e-3))
+
+if __name__ == "__main__":
+    unittest.main()
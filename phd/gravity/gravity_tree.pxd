@@ -41,6 +41,7 @@ cdef class GravityTree:
     cdef public str split_type                  # method to open nodes
     cdef public GravityPool nodes               # node array for gravity tree
     cdef public int calc_potential              # flag if potential is calculated
+    cdef public int count_work                  # flag if interactions are counted
     cdef public double barnes_angle             # angle to open node in barnes hut
     cdef public Interaction export_interaction  # acceleration calculator
 
@@ -34,7 +34,8 @@ cdef class GravityTree:
     class if run in parallel. The algorithm works in 2d or 3d.
     """
     def __init__(self, str split_type='barnes-hut',  double barnes_angle=0.3,
-            int calculate_potential=0, int parallel=0, int max_buffer_size=256):
+            int calculate_potential=0, int parallel=0, int max_buffer_size=256,
+            int count_work=0):
 
         #self.domain = domain
         #self.load_bal = load_bal
@@ -42,6 +43,7 @@ cdef class GravityTree:
         self.split_type = split_type
         self.barnes_angle = barnes_angle
         self.calc_potential = calculate_potential
+        self.count_work = count_work
 
         self.parallel = parallel
         self.max_buffer_size = max_buffer_size
@@ -68,6 +70,11 @@ cdef class GravityTree:
         self.export_interaction = GravityAcceleration(self.pc,
                 self.domain, splitter, 1, self.calc_potential)
 
+        # interactions of each particle, cost for load balance
+        if self.count_work and 'gravity_work' not in self.pc.properties:
+            self.pc.register_property(self.pc.get_number_of_items(),
+                    'gravity_work', 'double')
+
         self.rank = self.size = 0
 
         if self.parallel:
@@ -656,6 +663,9 @@ cdef class GravityTree:
         """
         Walk the tree calculating accerlerations.
         """
+        if self.count_work:
+            self.pc['gravity_work'][:] = 0.
+
         self.export_interaction.initialize_particles(self.pc)
         if self.parallel:
             self._parallel_walk(self.export_interaction)
@@ -42,3 +42,4 @@ cdef class GravityAcceleration(Interaction):
     cdef np.float64_t *pot          # gravitational potential
     cdef np.float64_t *x[3]         # positions
     cdef np.float64_t *a[3]         # accelerations
+    cdef np.float64_t *work         # interaction counts, NULL if not counted
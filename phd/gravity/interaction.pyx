@@ -195,6 +195,12 @@ cdef class GravityAcceleration(Interaction):
             doub_array = pc.get_carray('potential')
             self.pot   = doub_array.get_data_ptr()
 
+        # interactions are counted as cost for load balance
+        self.work = NULL
+        if self.local_particles and 'gravity_work' in pc.properties:
+            doub_array = pc.get_carray('gravity_work')
+            self.work  = doub_array.get_data_ptr()
+
         # setup information for opening nodes and
         # first particle to process
         self.splitter.initialize_particles(pc)
@@ -236,6 +242,9 @@ cdef class GravityAcceleration(Interaction):
         if self.calc_potential:
             self.pot[self.current] -= node.group.data.mass / sqrt(r2)
 
+        if self.work != NULL:
+            self.work[self.current] += 1.
+
     cdef bint process_particle(self):
         """
         Iterator for particles. Each time this is called it moves
@@ -3,3 +3,8 @@ cimport numpy as np
 cdef np.int64_t hilbert_key_2d(np.int32_t x, np.int32_t y, np.int32_t z, int order)
 cdef np.int64_t hilbert_key_3d(np.int32_t x, np.int32_t y, np.int32_t z, int order)
 
+
+cdef np.int64_t hilbert_key_table_2d(np.int32_t x, np.int32_t y, np.int32_t z, int order) nogil
+cdef np.int64_t hilbert_key_table_3d(np.int32_t x, np.int32_t y, np.int32_t z, int order) nogil
+cdef void hilbert_keys_array(np.float64_t *x[3], np.float64_t corner[3], double fac,
+        int dim, int order, np.int64_t *keys, long n, int num_threads) nogil
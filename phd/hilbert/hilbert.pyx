@@ -2,6 +2,7 @@ import numpy as np
 
 cimport numpy as np
 cimport cython
+from cython.parallel cimport prange
 
 cdef int *key_index_2d = [0, 1, 3, 2]
 cdef int *key_index_3d = [0, 1, 7, 6, 3, 2, 4, 5]
@@ -50,3 +51,265 @@ cdef np.int64_t hilbert_key_3d(np.int32_t x, np.int32_t y, np.int32_t z, int ord
 
 def py_hilbert_key_3d(np.int32_t[:] pos,  order):
     return hilbert_key_3d(pos[0], pos[1], pos[2], order)
+
+# Table driven keys. The swaps and complements above are a state, the
+# transformation from the particle coordinates to the coordinates of
+# the current sub cell. For every state and the bits of several levels
+# at once the tables hold the key bits and the next state, so a key is
+# a few lookups instead of a branch per level.
+
+# levels per lookup
+cdef enum:
+    LEVELS_2D = 4
+    LEVELS_3D = 3
+
+# state update of one level of hilbert_key_2d/3d, for each bit pattern
+# of the current coordinates the new coordinates as (axis, complement)
+cdef dict update_2d = {
+        (0, 0): ((1, 0), (0, 0)),   # x, y = y, x
+        (1, 0): ((1, 1), (0, 1)),   # x, y = ~y, ~x
+        }
+
+cdef dict update_3d = {
+        (0, 0, 0): ((0, 0), (2, 0), (1, 0)),   # y, z = z, y
+        (0, 0, 1): ((1, 0), (0, 0), (2, 0)),   # x, y = y, x
+        (1, 0, 1): ((1, 0), (0, 0), (2, 0)),   # x, y = y, x
+        (1, 0, 0): ((0, 1), (1, 0), (2, 1)),   # x, z = ~x, ~z
+        (1, 1, 0): ((0, 1), (1, 0), (2, 1)),   # x, z = ~x, ~z
+        (1, 1, 1): ((1, 1), (0, 1), (2, 0)),   # x, y = ~y, ~x
+        (0, 1, 1): ((1, 1), (0, 1), (2, 0)),   # x, y = ~y, ~x
+        (0, 1, 0): ((0, 0), (2, 1), (1, 1)),   # y, z = ~z, ~y
+        }
+
+def _hilbert_step(state, bits, int dim):
+    '''
+    Advance one level. The state holds for each current coordinate the
+    particle axis and complement flag. Returns key digit and new state.
+    '''
+    cdef int j, digit = 0
+    cdef dict update = update_2d if dim == 2 else update_3d
+    cdef int *key_index = key_index_2d if dim == 2 else key_index_3d
+
+    current = tuple(bits[axis] ^ flip for axis, flip in state)
+    for j in range(dim):
+        digit = (digit << 1) + current[j]
+
+    new_state = state
+    if current in update:
+        new_state = tuple((state[axis][0], state[axis][1] ^ flip)
+                for axis, flip in update[current])
+    return key_index[digit], new_state
+
+def _hilbert_states(int dim):
+    '''
+    Return states reachable from the identity, breadth first, with
+    the identity as state 0.
+    '''
+    cdef int j
+
+    identity = tuple((j, 0) for j in range(dim))
+    states = [identity]
+    i = 0
+    while i < len(states):
+        for pattern in range(1 << dim):
+            bits = tuple((pattern >> (dim-1-j)) & 1 for j in range(dim))
+            digit, state = _hilbert_step(states[i], bits, dim)
+            if state not in states:
+                states.append(state)
+        i += 1
+    return states
+
+def _build_tables(int dim, int levels):
+    '''
+    Create key and next state tables for lookups of levels at once.
+    Tables are indexed by state and the interleaved bits of the levels,
+    x before y before z and higher levels first.
+    '''
+    cdef int i, l, j, key, pattern
+    cdef int num_patterns = 1 << (dim*levels)
+
+    states = _hilbert_states(dim)
+    index = dict((state, i) for i, state in enumerate(states))
+    keys = np.zeros((len(states), num_patterns), dtype=np.int32)
+    next_states = np.zeros((len(states), num_patterns), dtype=np.int32)
+
+    for i in range(len(states)):
+        for pattern in range(num_patterns):
+            state = states[i]
+            key = 0
+            for l in range(levels-1, -1, -1):
+                level_bits = (pattern >> (l*dim)) & ((1 << dim) - 1)
+                bits = tuple((level_bits >> (dim-1-j)) & 1 for j in range(dim))
+                digit, state = _hilbert_step(state, bits, dim)
+                key = (key << dim) + digit
+
+            keys[i, pattern] = key
+            next_states[i, pattern] = index[state]
+
+    return keys, next_states
+
+def _build_spread(int dim, int levels):
+    '''Spread the bits of a value so there are dim-1 zeros between them'''
+    cdef int value, k
+    spread = np.zeros(1 << levels, dtype=np.int32)
+    for value in range(1 << levels):
+        for k in range(levels):
+            if value & (1 << k):
+                spread[value] |= 1 << (k*dim)
+    return spread
+
+# tables are kept alive by these arrays, kernels use the pointers
+cdef np.ndarray key_table_2d, state_table_2d, key_table_1_2d, state_table_1_2d
+cdef np.ndarray key_table_3d, state_table_3d, key_table_1_3d, state_table_1_3d
+cdef np.ndarray spread_2d_npy, spread_3d_npy
+
+key_table_2d, state_table_2d = _build_tables(2, LEVELS_2D)
+key_table_1_2d, state_table_1_2d = _build_tables(2, 1)
+key_table_3d, state_table_3d = _build_tables(3, LEVELS_3D)
+key_table_1_3d, state_table_1_3d = _build_tables(3, 1)
+spread_2d_npy = _build_spread(2, LEVELS_2D)
+spread_3d_npy = _build_spread(3, LEVELS_3D)
+
+cdef np.int32_t *key_2d = <np.int32_t*> key_table_2d.data
+cdef np.int32_t *state_2d = <np.int32_t*> state_table_2d.data
+cdef np.int32_t *key_1_2d = <np.int32_t*> key_table_1_2d.data
+cdef np.int32_t *state_1_2d = <np.int32_t*> state_table_1_2d.data
+cdef np.int32_t *key_3d = <np.int32_t*> key_table_3d.data
+cdef np.int32_t *state_3d = <np.int32_t*> state_table_3d.data
+cdef np.int32_t *key_1_3d = <np.int32_t*> key_table_1_3d.data
+cdef np.int32_t *state_1_3d = <np.int32_t*> state_table_1_3d.data
+cdef np.int32_t *spread_2d = <np.int32_t*> spread_2d_npy.data
+cdef np.int32_t *spread_3d = <np.int32_t*> spread_3d_npy.data
+
+cdef np.int64_t hilbert_key_table_2d(np.int32_t x, np.int32_t y, np.int32_t z, int order) nogil:
+    '''Same key as hilbert_key_2d using table lookups'''
+    cdef np.int64_t key = 0
+    cdef int i, index, state = 0
+    cdef int mask = (1 << LEVELS_2D) - 1
+
+    # leading levels one at a time
+    for i in range(order-1, order - 1 - order % LEVELS_2D, -1):
+        index = (((x >> i) & 1) << 1) | ((y >> i) & 1)
+        key = (key << 2) | key_1_2d[4*state + index]
+        state = state_1_2d[4*state + index]
+
+    # remaining levels in groups
+    i = order - order % LEVELS_2D
+    while i > 0:
+        i -= LEVELS_2D
+        index = (spread_2d[(x >> i) & mask] << 1) | spread_2d[(y >> i) & mask]
+        key = (key << 2*LEVELS_2D) | key_2d[(state << 2*LEVELS_2D) + index]
+        state = state_2d[(state << 2*LEVELS_2D) + index]
+
+    return key
+
+cdef np.int64_t hilbert_key_table_3d(np.int32_t x, np.int32_t y, np.int32_t z, int order) nogil:
+    '''Same key as hilbert_key_3d using table lookups'''
+    cdef np.int64_t key = 0
+    cdef int i, index, state = 0
+    cdef int mask = (1 << LEVELS_3D) - 1
+
+    # leading levels one at a time
+    for i in range(order-1, order - 1 - order % LEVELS_3D, -1):
+        index = (((x >> i) & 1) << 2) | (((y >> i) & 1) << 1) | ((z >> i) & 1)
+        key = (key << 3) | key_1_3d[8*state + index]
+        state = state_1_3d[8*state + index]
+
+    # remaining levels in groups
+    i = order - order % LEVELS_3D
+    while i > 0:
+        i -= LEVELS_3D
+        index = (spread_3d[(x >> i) & mask] << 2) |\
+                (spread_3d[(y >> i) & mask] << 1) | spread_3d[(z >> i) & mask]
+        key = (key << 3*LEVELS_3D) | key_3d[(state << 3*LEVELS_3D) + index]
+        state = state_3d[(state << 3*LEVELS_3D) + index]
+
+    return key
+
+cdef void hilbert_keys_array(np.float64_t *x[3], np.float64_t corner[3], double fac,
+        int dim, int order, np.int64_t *keys, long n, int num_threads) nogil:
+    '''
+    Compute keys of n positions, each coordinate is scaled to integer
+    hilbert space by (x - corner)*fac.
+    '''
+    cdef long i
+    cdef np.int32_t xh, yh, zh
+
+    if dim == 2:
+        for i in prange(n, num_threads=num_threads, schedule='static'):
+            xh = <np.int32_t> ((x[0][i] - corner[0])*fac)
+            yh = <np.int32_t> ((x[1][i] - corner[1])*fac)
+            keys[i] = hilbert_key_table_2d(xh, yh, 0, order)
+    else:
+        for i in prange(n, num_threads=num_threads, schedule='static'):
+            xh = <np.int32_t> ((x[0][i] - corner[0])*fac)
+            yh = <np.int32_t> ((x[1][i] - corner[1])*fac)
+            zh = <np.int32_t> ((x[2][i] - corner[2])*fac)
+            keys[i] = hilbert_key_table_3d(xh, yh, zh, order)
+
+def py_hilbert_keys(np.ndarray pos, int order):
+    '''
+    Return keys of integer coordinates pos of shape (n, dim), same
+    as py_hilbert_key_2d/3d applied to each row.
+    '''
+    cdef long i, n
+    cdef int dim
+    cdef np.int32_t[:, :] p = np.ascontiguousarray(pos, dtype=np.int32)
+    cdef np.ndarray[np.int64_t, ndim=1] keys
+
+    n, dim = pos.shape[0], pos.shape[1]
+    if dim not in [2, 3]:
+        raise RuntimeError("Wrong dimension for hilbert keys")
+    keys = np.empty(n, dtype=np.int64)
+
+    with nogil:
+        if dim == 2:
+            for i in range(n):
+                keys[i] = hilbert_key_table_2d(p[i, 0], p[i, 1], 0, order)
+        else:
+            for i in range(n):
+                keys[i] = hilbert_key_table_3d(p[i, 0], p[i, 1], p[i, 2], order)
+    return keys
+
+def hilbert_keys(list positions, corner, double fac, int order, int num_threads=1):
+    '''
+    Return keys of particle positions without the GIL.
+
+    Parameters
+    ----------
+    positions : list
+        Float64 arrays of each coordinate.
+
+    corner : np.ndarray
+        Lower corner of hilbert space.
+
+    fac : double
+        Factor mapping distance to integer hilbert space.
+
+    order : int
+        Number of bits per dimension.
+
+    num_threads : int
+        Number of threads computing keys.
+    '''
+    cdef int j, dim = len(positions)
+    cdef np.float64_t *x[3]
+    cdef np.float64_t c[3]
+    cdef np.ndarray coord
+    cdef np.ndarray[np.int64_t, ndim=1] keys
+    cdef long n = positions[0].size
+
+    if dim not in [2, 3]:
+        raise RuntimeError("Wrong dimension for hilbert keys")
+
+    positions = [np.ascontiguousarray(coord, dtype=np.float64) for coord in positions]
+    for j in range(dim):
+        coord = positions[j]
+        x[j] = <np.float64_t*> coord.data
+        c[j] = corner[j]
+
+    keys = np.empty(n, dtype=np.int64)
+    with nogil:
+        hilbert_keys_array(x, c, fac, dim, order, <np.int64_t*> keys.data,
+                n, num_threads)
+    return keys
@@ -0,0 +1,36 @@
+"""
+Micro-benchmarks for hilbert keys. Run directly:
+
+    python bench_hilbert.py
+"""
+import timeit
+import numpy as np
+
+from phd.hilbert.hilbert import py_hilbert_key_2d, py_hilbert_key_3d,\
+        hilbert_keys
+
+def bench_keys(dim, n=100000, order=21, num_threads=1, repeat=5):
+    """Compare per particle keys against the table driven array kernel."""
+    scalar = py_hilbert_key_2d if dim == 2 else py_hilbert_key_3d
+    corner = np.zeros(dim)
+    fac = 2.**order
+    x = [np.random.random(n) for _ in range(dim)]
+    pos = np.array([xi*fac for xi in x]).T.astype(np.int32)
+
+    def per_particle():
+        keys = np.empty(n, dtype=np.int64)
+        for i in range(n):
+            keys[i] = scalar(pos[i], order)
+
+    def array_kernel():
+        hilbert_keys(x, corner, fac, order, num_threads=num_threads)
+
+    return (min(timeit.repeat(per_particle, number=1, repeat=repeat)),
+            min(timeit.repeat(array_kernel, number=1, repeat=repeat)))
+
+if __name__ == "__main__":
+    for dim in [2, 3]:
+        for num_threads in [1, 4]:
+            loop, bulk = bench_keys(dim, num_threads=num_threads)
+            print("%dd threads %d  per particle: %.2e s  array: %.2e s  speedup: %6.1fx" %\
+                    (dim, num_threads, loop, bulk, loop/bulk))
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+
+from phd.hilbert.hilbert import py_hilbert_key_2d, py_hilbert_key_3d,\
+        py_hilbert_keys, hilbert_keys
+
+class TestHilbertKeys(unittest.TestCase):
+    """Tests for the table driven hilbert keys."""
+    def check_keys(self, dim, order, n=500):
+        """Compare table keys against the per particle keys."""
+        scalar = py_hilbert_key_2d if dim == 2 else py_hilbert_key_3d
+        pos = np.random.randint(0, 2**order, size=(n, dim)).astype(np.int32)
+
+        keys = py_hilbert_keys(pos, order)
+        for i in range(n):
+            self.assertEqual(keys[i], scalar(pos[i], order))
+
+    def test_keys_2d(self):
+        """Test 2d keys for orders not multiple of lookup levels."""
+        for order in [1, 2, 5, 8, 21]:
+            self.check_keys(2, order)
+
+    def test_keys_3d(self):
+        """Test 3d keys for orders not multiple of lookup levels."""
+        for order in [1, 2, 5, 9, 21]:
+            self.check_keys(3, order)
+
+    def test_curve_2d(self):
+        """Test order 1 keys traverse the cells in hilbert order."""
+        pos = np.array([[0, 0], [0, 1], [1, 1], [1, 0]], dtype=np.int32)
+        np.testing.assert_array_equal(py_hilbert_keys(pos, 1), [0, 1, 2, 3])
+
+    def test_float_positions(self):
+        """Test keys of positions scaled to hilbert space."""
+        order = 21
+        corner = np.array([-1., -1., -1.])
+        fac = 2**order/2.
+        x = [np.random.uniform(-1., 1., 1000) for _ in range(3)]
+
+        pos = np.array([(xi - corner[i])*fac for i, xi in enumerate(x)]).T
+        expected = py_hilbert_keys(pos.astype(np.int32), order)
+
+        for num_threads in [1, 2]:
+            keys = hilbert_keys(x, corner, fac, order, num_threads=num_threads)
+            np.testing.assert_array_equal(keys, expected)
+
+    def test_dimension(self):
+        """Test wrong dimension raises."""
+        pos = np.zeros((3, 4), dtype=np.int32)
+        self.assertRaises(RuntimeError, py_hilbert_keys, pos, 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,14 @@
+import os
+import time
 import logging
+import threading
 import numpy as np
 
 import phd
 
 from ..mesh.mesh import Mesh
 from ..utils.tools import check_class
+from ..utils.profiler import Profiler
 from ..domain.domain import DomainLimits
 from ..riemann.riemann import RiemannBase
 from ..domain.domain_manager import DomainManager
@@ -14,20 +18,35 @@ from ..equation_state.equation_state import EquationStateBase
 from ..reconstruction.reconstruction import ReconstructionBase
 
 phdLogger = logging.getLogger('phd')
-callbacks = []
+
+# events in order they are signaled during a time step
+hook_events = [
+        'before_reconstruction', 'after_reconstruction',
+        'before_riemann', 'after_riemann',
+        'before_flux_update', 'after_flux_update',
+        'before_move', 'after_move',
+        'before_mesh', 'after_mesh',
+        ]
 
 class IntegrateBase(object):
-    def __init__(self, param_initial_time=0., param_final_time=1.0, param_dim=2):
+    def __init__(self, param_initial_time=0., param_final_time=1.0, param_dim=2,
+            param_fused_faces=False, param_work="faces"):
         """Constructor for Integrate base class. Every integrate class has
         to inherit this class.
         """
+        if param_work not in ["faces", "time"]:
+            raise RuntimeError("Unknown work measure %s" % param_work)
+
         self.param_dim = param_dim
+        self.param_work = param_work
+        self.param_fused_faces = param_fused_faces
         self.param_final_time = param_final_time
         self.param_initial_time = param_initial_time
 
         self.dt = 0.                    # time step
         self.iteration = 0              # iteration number
         self.time = param_initial_time  # current time
+        self.step_time = 0.             # wall time of last step
 
         # required objects to be set
         self.mesh = None
@@ -42,6 +61,14 @@ class IntegrateBase(object):
         self.loc_dt = np.zeros(1, dtype=np.float64)
         self.glb_dt = np.zeros(1, dtype=np.float64)
 
+        # hooks called at events of the time step
+        self.hooks = dict((event, []) for event in hook_events)
+        self.hook_threads = dict((event, []) for event in hook_events)
+        self.hook_timings = {}
+
+        # optional per stage profiling
+        self.profiler = None
+
     def initialize(self):
         """
         Setup all connections for computation classes
@@ -64,6 +91,122 @@ class IntegrateBase(object):
         msg = "IntegrateBase::evolve_timestep called!"
         raise NotImplementedError(msg)
 
+    def add_hook(self, event, hook, name=None, join_event=None):
+        '''
+        Register function to be called at event of the time step.
+
+        Parameters
+        ----------
+        event : str
+            Event in hook_events the hook is called at.
+
+        hook : callable
+            Function called with the integrator as argument.
+
+        name : str
+            Name used for timings, defaults to function name.
+
+        join_event : str
+            If given the hook runs in a background thread started at
+            event and joined at join_event, which has to come later in
+            the time step. Used to overlap hook work with main stages,
+            the hook must not touch data the stages in between modify.
+        '''
+        if event not in hook_events:
+            raise RuntimeError("Integrator: unknown hook event %s" % event)
+        if join_event is not None and\
+                hook_events.index(join_event) <= hook_events.index(event):
+            raise RuntimeError("Integrator: hook %s joined before started" % event)
+
+        name = name or hook.__name__
+        if name in self.hook_timings:
+            raise RuntimeError("Integrator: hook %s already added" % name)
+
+        self.hooks[event].append((name, hook, join_event))
+        self.hook_timings[name] = {"calls": 0, "time": 0., "wait": 0.}
+
+    def remove_hook(self, name):
+        '''Remove hook registered under name'''
+        for event in hook_events:
+            self.hooks[event] = [h for h in self.hooks[event] if h[0] != name]
+        self.hook_timings.pop(name, None)
+
+    def run_hooks(self, event):
+        '''
+        Join background hooks that end at event and call all hooks
+        registered at event.
+        '''
+        for name, thread in self.hook_threads[event]:
+            start = time.time()
+            thread.join()
+            self.hook_timings[name]["wait"] += time.time() - start
+
+            if thread.error is not None:
+                raise thread.error
+        self.hook_threads[event] = []
+
+        for name, hook, join_event in self.hooks[event]:
+            if join_event is None:
+                self._timed_hook(name, hook)
+            else:
+                thread = threading.Thread(target=self._timed_hook,
+                        args=(name, hook, True))
+                thread.error = None
+                thread.start()
+                self.hook_threads[join_event].append((name, thread))
+
+    def _timed_hook(self, name, hook, background=False):
+        start = time.time()
+        try:
+            hook(self)
+        except Exception as e:
+            if not background:
+                raise
+            threading.current_thread().error = e
+        timings = self.hook_timings[name]
+        timings["calls"] += 1
+        timings["time"] += time.time() - start
+
+    def profile_start(self, stage):
+        '''Start timing stage if profiling'''
+        if self.profiler is not None:
+            self.profiler.start(stage)
+
+    def profile_stop(self, stage, **items):
+        '''Stop timing stage if profiling, items are counts processed'''
+        if self.profiler is not None:
+            self.profiler.stop(stage, **items)
+
+    def update_work(self, step_time):
+        '''
+        Set cost of each real particle in field work, used by the load
+        balance to weight the domain decomposition. The cost is the
+        number of faces of the particle, for param_work 'time' scaled
+        so the particles of the processor sum to the wall time of the
+        step. Ignored if work is not registered (serial runs).
+
+        Parameters
+        ----------
+        step_time : float
+            Wall time of the step on this processor
+        '''
+        self.step_time = step_time
+        if "work" not in self.particles.properties:
+            return
+
+        num_real = self.mesh.num_real
+        num_particles = self.particles.get_number_of_items()
+        faces = self.mesh.faces
+
+        # each face is solved once for both particles
+        work = self.particles["work"][:num_real]
+        work[:] = np.bincount(faces["pair-i"], minlength=num_particles)[:num_real]
+        work += np.bincount(faces["pair-j"], minlength=num_particles)[:num_real]
+
+        total = work.sum()
+        if self.param_work == "time" and total > 0.:
+            work *= step_time/total
+
     def set_intial_time(self, initial_time):
         '''Set current time'''
         self.param_initial_time = initial_time
@@ -121,6 +264,11 @@ class IntegrateBase(object):
         '''Set riemann solver'''
         self.riemann = riemann
 
+    @check_class(Profiler)
+    def set_profiler(self, profiler):
+        '''Set profiler to record timings of each stage'''
+        self.profiler = profiler
+
     def before_loop(self, simulation):
         '''
         Build initial mesh.
@@ -162,15 +310,32 @@ class IntegrateBase(object):
                 simulation.param_output_directory,
                 self)
 
+    def restart_loop(self, simulation):
+        '''
+        Rebuild mesh for particles restored from a checkpoint. Mesh
+        relaxation and initial output are skipped and primitive
+        variables are computed from the conserative variables, as at
+        the end of a time step.
+        '''
+        phdLogger.info('Restarting at iteration %d time: %f' %\
+                (self.iteration, self.time))
+        self.mesh.build_geometry(self.particles, self.domain_manager)
+        self.update_primitive('Restart')
+
     def compute_time_step(self):
         '''
         Compute time step for current state of the simulation.
         Works in serial and parallel.
         '''
-        self.dt = self.riemann.compute_time_step(
+        self.profile_start('time_step')
+        self.loc_dt[0] = self.riemann.compute_time_step(
                 self.particles, self.equation_state)
 
-        # if in parallel find smallest dt across TODO
+        # if in parallel find smallest dt across all processors
+        self.domain_manager.reduction(send=self.loc_dt,
+                rec=self.glb_dt, op='min')
+        self.dt = self.glb_dt[0]
+        self.profile_stop('time_step', cells=self.mesh.num_real)
         return self.dt
 
 class StaticMesh(IntegrateBase):
@@ -178,10 +343,12 @@ class StaticMesh(IntegrateBase):
     Static mesh integrator. Once the mesh is created in `begin_loop` method
     the mesh will stay static throughout the simulation.
     '''
-    def __init__(self, param_initial_time=0., param_final_time=1.0, param_dim=2):
+    def __init__(self, param_initial_time=0., param_final_time=1.0, param_dim=2,
+            param_fused_faces=False, param_work="faces"):
         """Constructor for the Integrator
         """
-        super(StaticMesh, self).__init__(param_initial_time, param_final_time, param_dim)
+        super(StaticMesh, self).__init__(param_initial_time, param_final_time,
+                param_dim, param_fused_faces, param_work)
 
     def initialize(self):
         if not self.mesh or\
@@ -212,43 +379,126 @@ class StaticMesh(IntegrateBase):
         self.mesh.initialize()
 
         self.reconstruction.set_fields_for_reconstruction(self.particles)
+        self.reconstruction.set_equation_state(self.equation_state)
         self.reconstruction.initialize()
 
         self.riemann.set_fields_for_riemann(self.particles)
         self.riemann.initialize()
 
+        # reallocations of main containers are profiled
+        if self.profiler is not None:
+            self.profiler.watch(self.particles, self.mesh.faces,
+                    self.reconstruction.left_states,
+                    self.reconstruction.right_states,
+                    self.riemann.fluxes)
 
     def evolve_timestep(self):
         '''
         Solve the compressible gas equations
         '''
+        start = time.time()
         phdLogger.info('Static Mesh Integrator: Starting iteration %d time: %f dt: %f' %\
                 (self.iteration,
                  self.time,
                  self.dt))
 
         # solve the riemann problem at each face
-        phdLogger.info('Static Mesh Integrator: Starting reconstruction...')
-        self.reconstruction.compute_states(self.particles, self.mesh,
-                False, self.domain_manager, self.dt)
-        phdLogger.success('Static Mesh Integrator: Finished reconstruction')
+        self.update_faces('Static Mesh Integrator', False)
+
+        # mesh is static, events are signaled for hooks
+        for event in ['before_move', 'after_move', 'before_mesh', 'after_mesh']:
+            self.run_hooks(event)
+
+        phdLogger.info('Static Mesh Integrator: Finished iteration %d' %\
+                self.iteration)
+
+        # setup the mesh for the next setup
+        self.update_primitive('Static Mesh Integrator')
+        self.update_work(time.time() - start)
+        self.iteration += 1; self.time += self.dt
 
-        phdLogger.info('Static Mesh Integrator: Starting riemann...')
+    def update_faces(self, name, boost):
+        '''
+        Reconstruct face states, solve riemann problem and update
+        conserative variables. With param_fused_faces all three are done
+        in one loop over faces, otherwise as separate stages. With fused
+        faces the hooks of the events in between are run after the update.
+        '''
+        num_faces = self.mesh.faces.get_number_of_items()
+        self.run_hooks('before_reconstruction')
+
+        if self.param_fused_faces:
+            phdLogger.info('%s: Starting fused face update...' % name)
+            self.profile_start('fused_faces')
+            self.riemann.fused_update(self.particles, self.mesh,
+                    self.reconstruction, self.equation_state,
+                    self.domain_manager, boost, self.dt)
+            self.profile_stop('fused_faces', faces=num_faces)
+            phdLogger.success('%s: Finished fused face update' % name)
+
+            for event in ['after_reconstruction', 'before_riemann', 'after_riemann',
+                    'before_flux_update', 'after_flux_update']:
+                self.run_hooks(event)
+            return
+
+        phdLogger.info('%s: Starting reconstruction...' % name)
+        self.profile_start('reconstruction')
+        self.reconstruction.compute_states(self.particles, self.mesh,
+                boost, self.domain_manager, self.dt)
+        self.profile_stop('reconstruction', faces=num_faces)
+        phdLogger.success('%s: Finished reconstruction' % name)
+        self.run_hooks('after_reconstruction')
+
+        self.run_hooks('before_riemann')
+        phdLogger.info('%s: Starting riemann...' % name)
+        self.profile_start('riemann')
         self.riemann.compute_fluxes(self.particles, self.mesh, self.reconstruction,
                 self.equation_state)
-        phdLogger.success('Static Mesh Integrator: Finished riemann')
+        self.profile_stop('riemann', faces=num_faces)
+        phdLogger.success('%s: Finished riemann' % name)
+        self.run_hooks('after_riemann')
 
+        self.run_hooks('before_flux_update')
+        self.profile_start('flux_update')
         self.mesh.update_from_fluxes(self.particles, self.riemann, self.dt)
+        self.profile_stop('flux_update', faces=num_faces)
+        self.run_hooks('after_flux_update')
 
-        phdLogger.info('Static Mesh Integrator: Finished iteration %d' %\
-                self.iteration)
+    def update_primitive(self, name):
+        '''
+        Compute primitive variables and keep signal speeds for the time
+        step. Cells that needed a density or pressure floor are reported.
+        '''
+        self.profile_start('primitive')
+        self.equation_state.primitive_from_conserative(self.particles, True)
+        self.profile_stop('primitive', cells=self.mesh.num_real,
+                ghosts=self.mesh.num_ghost)
 
-        # setup the mesh for the next setup 
-        self.equation_state.primitive_from_conserative(self.particles)
-        self.iteration += 1; self.time += self.dt
+        if self.equation_state.num_violations:
+            phdLogger.warning('%s: %d cells below density/pressure floor, cells: %s' %\
+                    (name, self.equation_state.num_violations,
+                     self.equation_state.bad_cells.get_npy_array()[:10]))
 
     def after_loop(self, simulation):
-        pass
+        if self.profiler is not None:
+            filename = simulation.param_simulation_name + "_profile"
+            if phd._in_parallel:
+                filename += "_%04d" % phd._rank
+            filename += "." + self.profiler.param_format
+            self.profiler.dump(os.path.join(simulation.param_output_directory,
+                filename), self.iteration)
+
+        # work imbalance of each step, written by one processor
+        history = self.domain_manager.imbalance_history
+        if history and phd._rank == 0:
+            filename = simulation.param_simulation_name + "_imbalance.txt"
+            np.savetxt(os.path.join(simulation.param_output_directory, filename),
+                    np.array(history, dtype=np.float64),
+                    header="max_work mean_work imbalance partition")
+
+        for name, timings in sorted(self.hook_timings.items()):
+            phdLogger.info('Hook %s: calls %d time %.3e s wait %.3e s' %\
+                    (name, timings["calls"], timings["time"], timings["wait"]))
 
 class MovingMesh(StaticMesh):
     '''
@@ -258,43 +508,52 @@ class MovingMesh(StaticMesh):
         '''
         Solve the compressible gas equations
         '''
+        start = time.time()
         phdLogger.info('Moving Mesh Integrator: Starting iteration %d time: %f dt: %f' %\
                 (self.iteration,
                  self.time,
                  self.dt))
 
         # assign velocities to mesh cells and faces 
+        self.profile_start('velocities')
         self.mesh.assign_generator_velocities(self.particles, self.equation_state)
         self.mesh.assign_face_velocities(self.particles)
+        self.profile_stop('velocities', cells=self.mesh.num_real,
+                faces=self.mesh.faces.get_number_of_items())
 
-        phdLogger.info('Moving Mesh Integrator: Starting reconstruction...')
-        self.reconstruction.compute_states(self.particles, self.mesh,
-                self.riemann.param_boost, self.domain_manager, self.dt)
-        phdLogger.success('Moving Mesh Integrator: Finished reconstruction')
-
-        phdLogger.info('Moving Mesh Integrator: Starting riemann...')
-        self.riemann.compute_fluxes(self.particles, self.mesh, self.reconstruction,
-                self.equation_state)
-        phdLogger.success('Moving Mesh Integrator: Finished riemann')
-
-        self.mesh.update_from_fluxes(self.particles, self.riemann, self.dt)
+        # solve the riemann problem at each face
+        self.update_faces('Moving Mesh Integrator', self.riemann.param_boost)
 
         # update mesh generator positions
+        self.run_hooks('before_move')
+        self.profile_start('move')
         self.domain_manager.move_generators(self.particles, self.dt)
+        self.profile_stop('move', cells=self.mesh.num_real)
+        self.run_hooks('after_move')
 #        self.domain_manager.migrate_particles(self.particles)
 
-        # ignored if serial run
-#        if self.domain_manager.check_for_partion():
-#            phdLogger.info('Moving Mesh Integrator: Starting domain decomposition...')
-#            self.domain_manager.partion()
-#            phdLogger.success('Moving Mesh Integrator: Finished domain decomposition')
+        # repartition if work is imbalanced, ignored if serial run
+        if self.domain_manager.check_for_partition(self.particles):
+            phdLogger.info('Moving Mesh Integrator: Starting domain decomposition...')
+            self.profile_start('partition')
+            self.domain_manager.partition(self.particles)
+            self.profile_stop('partition', cells=self.particles.get_number_of_items())
+            phdLogger.success('Moving Mesh Integrator: Finished domain decomposition')
 
         # setup the mesh for the next setup 
+        self.run_hooks('before_mesh')
         phdLogger.info('Moving Mesh Integrator: Rebuilding mesh...')
+        self.profile_start('mesh')
         self.mesh.build_geometry(self.particles, self.domain_manager)
+        self.profile_stop('mesh', cells=self.mesh.num_real,
+                faces=self.mesh.faces.get_number_of_items(),
+                ghosts=self.mesh.num_ghost,
+                ghost_rounds=self.mesh.num_ghost_rounds)
         phdLogger.success('Moving Mesh Integrator: Finished mesh')
+        self.run_hooks('after_mesh')
 
-        self.equation_state.primitive_from_conserative(self.particles)
+        self.update_primitive('Moving Mesh Integrator')
+        self.update_work(time.time() - start)
         phdLogger.info('Moving Mesh Integrator: Finished iteration %d' %\
                 self.iteration)
 
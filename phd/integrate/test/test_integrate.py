@@ -0,0 +1,106 @@
+import time
+import unittest
+import numpy as np
+
+from phd.integrate.integrate import IntegrateBase, hook_events
+from phd.containers.containers import CarrayContainer
+
+class TestHooks(unittest.TestCase):
+    """Tests hook registration, order and timing of IntegrateBase."""
+    def setUp(self):
+        self.integrator = IntegrateBase()
+        self.calls = []
+
+    def hook(self, name):
+        def func(integrator):
+            self.calls.append(name)
+        return func
+
+    def test_add_hook(self):
+        self.assertRaises(RuntimeError, self.integrator.add_hook,
+                "before_gravity", self.hook("a"))
+        self.assertRaises(RuntimeError, self.integrator.add_hook,
+                "after_riemann", self.hook("a"), join_event="before_riemann")
+
+        self.integrator.add_hook("after_riemann", self.hook("a"), name="a")
+        self.assertRaises(RuntimeError, self.integrator.add_hook,
+                "after_mesh", self.hook("a"), name="a")
+
+        self.integrator.remove_hook("a")
+        self.assertEqual(self.integrator.hooks["after_riemann"], [])
+        self.assertTrue("a" not in self.integrator.hook_timings)
+
+    def test_run_hooks(self):
+        for event in hook_events:
+            self.integrator.add_hook(event, self.hook(event), name=event)
+
+        for step in range(3):
+            for event in hook_events:
+                self.integrator.run_hooks(event)
+
+        self.assertEqual(self.calls, 3*hook_events)
+        for event in hook_events:
+            self.assertEqual(self.integrator.hook_timings[event]["calls"], 3)
+
+    def test_background_hook(self):
+        def slow(integrator):
+            time.sleep(0.05)
+            self.calls.append("slow")
+
+        self.integrator.add_hook("before_reconstruction", slow,
+                join_event="after_riemann")
+        self.integrator.add_hook("after_reconstruction", self.hook("fast"), name="fast")
+
+        self.integrator.run_hooks("before_reconstruction")
+        self.integrator.run_hooks("after_reconstruction")
+        self.assertEqual(self.calls, ["fast"])
+
+        # joined at later event
+        self.integrator.run_hooks("after_riemann")
+        self.assertEqual(self.calls, ["fast", "slow"])
+        self.assertTrue(self.integrator.hook_timings["slow"]["time"] >= 0.05)
+
+    def test_background_error(self):
+        def fail(integrator):
+            raise ValueError("hook failed")
+
+        self.integrator.add_hook("before_move", fail, join_event="after_mesh")
+        self.integrator.run_hooks("before_move")
+        self.assertRaises(ValueError, self.integrator.run_hooks, "after_mesh")
+
+class TestWork(unittest.TestCase):
+    """Tests particle cost for the load balance."""
+    def setUp(self):
+        # three real particles and one ghost
+        self.particles = CarrayContainer(4, {"work": "double"})
+        faces = CarrayContainer(4, {"pair-i": "long", "pair-j": "long"})
+        faces["pair-i"][:] = [0, 0, 1, 2]
+        faces["pair-j"][:] = [1, 2, 2, 3]
+
+        class Mesh(object):
+            pass
+        self.mesh = Mesh()
+        self.mesh.faces = faces
+        self.mesh.num_real = 3
+
+    def integrator(self, param_work):
+        integrator = IntegrateBase(param_work=param_work)
+        integrator.particles = self.particles
+        integrator.mesh = self.mesh
+        return integrator
+
+    def test_faces(self):
+        self.integrator("faces").update_work(2.0)
+        np.testing.assert_array_equal(self.particles["work"][:3], [2, 2, 3])
+
+    def test_time(self):
+        integrator = self.integrator("time")
+        integrator.update_work(2.0)
+        self.assertEqual(integrator.step_time, 2.0)
+        np.testing.assert_allclose(self.particles["work"][:3], [4./7, 4./7, 6./7])
+
+    def test_unknown(self):
+        self.assertRaises(RuntimeError, IntegrateBase, param_work="flops")
+
+if __name__ == "__main__":
+    unittest.main()
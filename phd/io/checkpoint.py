@@ -0,0 +1,120 @@
+import json
+import logging
+import numpy as np
+
+import phd
+
+from .io import Snapshot
+from ..utils.tools import create_components_timeshot
+
+phdLogger = logging.getLogger('phd')
+
+def checkpoint_filename(filename):
+    '''Return file name of the checkpoint of this processor'''
+    if phd._in_parallel:
+        filename += "_cpu%04d" % phd._rank
+    return filename + ".npz"
+
+def write_checkpoint(filename, integrator, simulation_time):
+    '''
+    Write every field of the real particles, integrator state, class
+    names and parameters of the components, load balance state and
+    output state to filename.npz, a file per processor in parallel.
+    Fields are written uncompressed straight from the carray buffers.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the checkpoint without extension.
+
+    integrator : phd.IntegrateBase
+        Integrator that solves the equations
+
+    simulation_time : phd.SimulationTime
+        Outputs and finishers of the simulation
+    '''
+    snapshot = Snapshot(integrator)
+
+    arrays = dict(("field-" + field, snapshot.data[field])
+            for field in snapshot.fields)
+    arrays["time"] = np.array([integrator.time, integrator.dt], dtype=np.float64)
+    arrays["iteration"] = np.array([integrator.iteration], dtype=np.int64)
+
+    load_balance = getattr(integrator.domain_manager, "load_balance", None)
+    if load_balance is not None:
+        arrays["leaf_pid"] = load_balance.leaf_pid.get_npy_array()
+
+    state = {
+            "dim": integrator.param_dim,
+            "num_procs": phd._size,
+            "components": snapshot.parameters,
+            "outputs": [output.get_state() for output in simulation_time.outputs],
+            }
+    arrays["state"] = np.array(json.dumps(state))
+
+    with open(checkpoint_filename(filename), "wb") as f:
+        np.savez(f, **arrays)
+
+def read_checkpoint(filename, integrator, simulation_time):
+    '''
+    Restore state written by write_checkpoint. Particles, integrator
+    and outputs have to be setup as in the run that wrote the
+    checkpoint, components that differ are reported.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the checkpoint without extension.
+
+    integrator : phd.IntegrateBase
+        Integrator that solves the equations, already initialized
+
+    simulation_time : phd.SimulationTime
+        Outputs and finishers of the simulation
+    '''
+    data = np.load(checkpoint_filename(filename))
+    try:
+        state = json.loads(str(data["state"]))
+        if state["num_procs"] != phd._size:
+            raise RuntimeError("Checkpoint written with %d processors, running %d" %\
+                    (state["num_procs"], phd._size))
+        if state["dim"] != integrator.param_dim:
+            raise RuntimeError("Checkpoint dimension %d, integrator %d" %\
+                    (state["dim"], integrator.param_dim))
+
+        # compare components with the same conversions as written
+        components = json.loads(json.dumps(create_components_timeshot(integrator)))
+        for name, (class_name, params) in sorted(state["components"].items()):
+            if name not in components:
+                phdLogger.warning("Checkpoint: component %s not set" % name)
+            elif components[name] != [class_name, params]:
+                phdLogger.warning("Checkpoint: component %s differs, checkpoint %s %s" %\
+                        (name, class_name, params))
+
+        # real particles, ghosts are created when mesh is built
+        particles = integrator.particles
+        fields = [key[6:] for key in data.files if key.startswith("field-")]
+        for field in fields:
+            if field not in particles.properties:
+                raise RuntimeError("Checkpoint: field %s not in particles" % field)
+
+        particles.resize(data["field-" + fields[0]].size)
+        for field in fields:
+            particles[field][:] = data["field-" + field]
+
+        integrator.time, integrator.dt = data["time"]
+        integrator.set_iteration(int(data["iteration"][0]))
+
+        load_balance = getattr(integrator.domain_manager, "load_balance", None)
+        if load_balance is not None and "leaf_pid" in data.files:
+            leaf_pid = data["leaf_pid"]
+            load_balance.leaf_pid.resize(leaf_pid.size)
+            load_balance.leaf_pid.get_npy_array()[:] = leaf_pid
+
+        if len(state["outputs"]) != len(simulation_time.outputs):
+            raise RuntimeError("Checkpoint has %d outputs, simulation %d" %\
+                    (len(state["outputs"]), len(simulation_time.outputs)))
+        for output, output_state in zip(simulation_time.outputs, state["outputs"]):
+            output.set_state(output_state)
+    finally:
+        data.close()
@@ -0,0 +1,517 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import phd
+
+from ..utils.particle_tags import ParticleTAGS
+from ..utils.tools import create_components_timeshot
+
+phdLogger = logging.getLogger('phd')
+
+def real_particles(particles):
+    '''
+    Return slice of the real particles if they are stored first in the
+    container, which is the case after tessellation, otherwise the
+    indices of the real particles.
+
+    Parameters
+    ----------
+    particles : CarrayContainer
+        Particles of the simulation
+
+    Returns
+    -------
+    slice or np.ndarray
+        Selection of real particles
+    '''
+    real = particles['tag'] == ParticleTAGS.Real
+    num_real = np.count_nonzero(real)
+    if real[:num_real].all():
+        return slice(0, num_real)
+    return np.flatnonzero(real)
+
+def subsample(selection, stride=1, sample_fraction=None, seed=0):
+    '''
+    Reduce selection of particles to every stride particle and then to
+    a random fraction of those. Slices stay slices, so no copy is made
+    when only a stride is used.
+
+    Parameters
+    ----------
+    selection : slice or np.ndarray
+        Selection from real_particles.
+
+    stride : int
+        Keep every stride particle.
+
+    sample_fraction : float
+        Fraction of particles randomly kept, all if None.
+
+    seed : int
+        Seed of the random sample.
+
+    Returns
+    -------
+    slice or np.ndarray
+        Reduced selection
+    '''
+    if isinstance(selection, slice):
+        selection = slice(0, selection.stop, stride)
+    else:
+        selection = selection[::stride]
+
+    if sample_fraction is not None:
+        if isinstance(selection, slice):
+            selection = np.arange(selection.start, selection.stop, selection.step)
+        num_sample = int(round(sample_fraction*selection.size))
+        keep = np.random.RandomState(seed).choice(selection.size,
+                num_sample, replace=False)
+        selection = selection[np.sort(keep)]
+
+    return selection
+
+class Snapshot(object):
+    '''
+    State of the simulation written in an output, fields of the real
+    particles and integrator state.
+
+    Parameters
+    ----------
+    integrator : phd.IntegrateBase
+        Integrator that solves the equations
+
+    fields : list
+        Fields to store, all fields if None.
+
+    copy : bool
+        If True fields are copied, otherwise fields are views of the
+        carray buffers when possible and only valid until the
+        particles are modified.
+
+    stride : int
+        Keep every stride real particle.
+
+    sample_fraction : float
+        Fraction of particles randomly kept, all if None. The sample
+        is seeded by seed, iteration and rank so it is reproducible.
+
+    seed : int
+        Seed of the random sample.
+    '''
+    def __init__(self, integrator, fields=None, copy=False, stride=1,
+            sample_fraction=None, seed=0):
+        particles = integrator.particles
+
+        if fields is None:
+            fields = sorted(particles.properties.keys())
+        for field in fields:
+            if field not in particles.properties:
+                raise RuntimeError("Snapshot: field %s not in particles" % field)
+
+        selection = subsample(real_particles(particles), stride,
+                sample_fraction, (seed, integrator.iteration, phd._rank))
+        if isinstance(selection, slice):
+            self.num_particles = (selection.stop + selection.step - 1)//selection.step
+        else:
+            self.num_particles = selection.size
+
+        self.fields = []
+        self.data = {}
+        for field in fields:
+            data = particles[field][selection]
+            if copy and isinstance(selection, slice):
+                data = data.copy()
+            self.fields.append(field)
+            self.data[field] = data
+
+        self.stride = stride
+        self.sample_fraction = sample_fraction
+
+        self.time = integrator.time
+        self.dt = integrator.dt
+        self.iteration = integrator.iteration
+        self.dim = integrator.param_dim
+        self.parameters = create_components_timeshot(integrator)
+
+    def nbytes(self):
+        return sum(data.nbytes for data in self.data.values())
+
+class ReaderWriterBase(object):
+    '''
+    Base class for writing simulation data to disk.
+
+    Parameters
+    ----------
+    param_fields : list
+        Fields to write, all fields if None.
+
+    param_stride : int
+        Write every param_stride real particle.
+
+    param_sample_fraction : float
+        Fraction of particles randomly written, all if None.
+
+    param_seed : int
+        Seed of the random sample.
+    '''
+    extension = None
+
+    def __init__(self, param_fields=None, param_stride=1,
+            param_sample_fraction=None, param_seed=0):
+        if param_stride < 1:
+            raise RuntimeError("Writer: stride has to be positive")
+        if param_sample_fraction is not None and\
+                not 0. < param_sample_fraction <= 1.:
+            raise RuntimeError("Writer: sample fraction not in (0, 1]")
+
+        self.param_fields = param_fields
+        self.param_stride = param_stride
+        self.param_sample_fraction = param_sample_fraction
+        self.param_seed = param_seed
+
+    def snapshot(self, integrator, copy=False):
+        '''Return snapshot of the fields and particles written'''
+        return Snapshot(integrator, self.param_fields, copy, self.param_stride,
+                self.param_sample_fraction, self.param_seed)
+
+    def write(self, filename, integrator):
+        '''
+        Write simulation data to disk.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the file without extension.
+
+        integrator : phd.IntegrateBase
+            Integrator that solves the equations
+        '''
+        snapshot = self.snapshot(integrator)
+        self.prepare(filename, snapshot)
+        self.write_snapshot(filename, snapshot)
+
+    def prepare(self, filename, snapshot):
+        '''
+        Work done before writing snapshot that has to be done by the
+        main thread, i.e. communication across processors.
+        '''
+        pass
+
+    def write_snapshot(self, filename, snapshot):
+        '''
+        Write snapshot to disk.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the file without extension.
+
+        snapshot : Snapshot
+            State of the simulation to write
+        '''
+        msg = "ReaderWriterBase::write_snapshot called!"
+        raise NotImplementedError(msg)
+
+    def close(self):
+        '''Finish all pending writes'''
+        pass
+
+class Hdf5(ReaderWriterBase):
+    '''
+    Write fields of the real particles into a hdf5 file. Each field is
+    a chunked, optionally compressed, dataset in the root group and the
+    state of the integrator is stored as attributes. Parameters of each
+    component are stored as attributes in the parameters group.
+
+    Parameters
+    ----------
+    param_fields : list
+        Fields to write, all fields if None.
+
+    param_compression : str
+        Compression filter passed to h5py, 'gzip', 'lzf' or None.
+
+    param_compression_level : int
+        Level for gzip compression.
+
+    param_chunk_size : int
+        Number of particles in a chunk. If None datasets are stored
+        contiguous and uncompressed, which readers can memory map.
+
+    Stride and sample parameters are those of ReaderWriterBase.
+    '''
+    extension = "hdf5"
+
+    def __init__(self, param_fields=None, param_compression="gzip",
+            param_compression_level=4, param_chunk_size=65536, **kwargs):
+        if param_compression not in [None, "gzip", "lzf"]:
+            raise RuntimeError("Hdf5: unknown compression %s" % param_compression)
+        if param_chunk_size is None:
+            if param_compression is not None:
+                raise RuntimeError("Hdf5: compression requires chunks")
+        elif param_chunk_size < 1:
+            raise RuntimeError("Hdf5: chunk size has to be positive")
+
+        super(Hdf5, self).__init__(param_fields, **kwargs)
+        self.param_compression = param_compression
+        self.param_compression_level = param_compression_level
+        self.param_chunk_size = param_chunk_size
+
+    def dataset_options(self, size):
+        '''Return chunk and compression options for dataset of size'''
+        options = {}
+        if size == 0 or self.param_chunk_size is None:
+            return options
+
+        options["chunks"] = (min(self.param_chunk_size, size),)
+        if self.param_compression is not None:
+            options["compression"] = self.param_compression
+            options["shuffle"] = True
+            if self.param_compression == "gzip":
+                options["compression_opts"] = self.param_compression_level
+        return options
+
+    def write_snapshot(self, filename, snapshot):
+        '''
+        Write snapshot to filename.hdf5.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the file without extension.
+
+        snapshot : Snapshot
+            State of the simulation to write
+        '''
+        import h5py
+
+        with h5py.File(filename + "." + self.extension, "w") as f:
+            for field in snapshot.fields:
+                data = snapshot.data[field]
+                f.create_dataset(field, data=data, **self.dataset_options(data.size))
+
+            f.attrs["time"] = snapshot.time
+            f.attrs["dt"] = snapshot.dt
+            f.attrs["iteration"] = snapshot.iteration
+            f.attrs["dim"] = snapshot.dim
+            f.attrs["stride"] = snapshot.stride
+            if snapshot.sample_fraction is not None:
+                f.attrs["sample_fraction"] = snapshot.sample_fraction
+
+            group = f.create_group("parameters")
+            for name, (class_name, params) in snapshot.parameters.items():
+                comp = group.create_group(name)
+                comp.attrs["class"] = class_name
+                for param, value in params.items():
+                    if value is not None:
+                        comp.attrs[param] = value
+
+class ParallelHdf5(Hdf5):
+    '''
+    Write real particles of each processor to its own file
+    filename/dataNNNN_cpuRRRR.hdf5 concurrently. Processor 0 writes
+    the master file filename.hdf5 where each field is a virtual dataset
+    joining the fields of every processor file in rank order, analysis
+    scripts read it as one snapshot. If h5py does not support virtual
+    datasets the master file holds external links to the processor
+    files instead.
+
+    Parameters are the same as Hdf5.
+    '''
+    def rank_filename(self, filename, rank):
+        '''Return processor file name relative to filename directory'''
+        number = os.path.basename(filename).rsplit("_", 1)[-1]
+        return os.path.join(os.path.basename(filename),
+                "data%s_cpu%04d" % (number, rank))
+
+    def prepare(self, filename, snapshot):
+        '''
+        Create directory for processor files and collect number of
+        particles of each processor.
+        '''
+        if phd._rank == 0 and not os.path.isdir(filename):
+            os.mkdir(filename)
+
+        # no processor continues before the directory exists
+        if phd._in_parallel:
+            snapshot.rank_sizes = phd._comm.allgather(snapshot.num_particles)
+        else:
+            snapshot.rank_sizes = [snapshot.num_particles]
+
+    def write_snapshot(self, filename, snapshot):
+        '''
+        Write processor file and master file if processor 0.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the master file without extension.
+
+        snapshot : Snapshot
+            State of the simulation to write, prepared by prepare
+        '''
+        directory = os.path.dirname(filename)
+        super(ParallelHdf5, self).write_snapshot(
+                os.path.join(directory, self.rank_filename(filename, phd._rank)),
+                snapshot)
+
+        if phd._rank == 0:
+            self.write_master(filename, snapshot)
+
+    def write_master(self, filename, snapshot):
+        '''Write master file referencing every processor file'''
+        import h5py
+
+        rank_sizes = snapshot.rank_sizes
+        num_ranks = len(rank_sizes)
+        rank_files = [self.rank_filename(filename, rank) + "." + self.extension
+                for rank in range(num_ranks)]
+        total = sum(rank_sizes)
+
+        with h5py.File(filename + "." + self.extension, "w") as f:
+            if hasattr(h5py, "VirtualLayout"):
+                for field in snapshot.fields:
+                    dtype = snapshot.data[field].dtype
+                    layout = h5py.VirtualLayout(shape=(total,), dtype=dtype)
+
+                    offset = 0
+                    for rank_file, size in zip(rank_files, rank_sizes):
+                        if size:
+                            layout[offset:offset+size] = h5py.VirtualSource(
+                                    rank_file, field, shape=(size,))
+                        offset += size
+                    f.create_virtual_dataset(field, layout)
+            else:
+                group = f.create_group("files")
+                for rank, rank_file in enumerate(rank_files):
+                    group["cpu%04d" % rank] = h5py.ExternalLink(rank_file, "/")
+
+            f.attrs["time"] = snapshot.time
+            f.attrs["dt"] = snapshot.dt
+            f.attrs["iteration"] = snapshot.iteration
+            f.attrs["dim"] = snapshot.dim
+            f.attrs["stride"] = snapshot.stride
+            if snapshot.sample_fraction is not None:
+                f.attrs["sample_fraction"] = snapshot.sample_fraction
+            f.attrs["num_files"] = num_ranks
+            f.attrs["rank_sizes"] = np.asarray(rank_sizes, dtype=np.int64)
+
+class AsyncWriter(ReaderWriterBase):
+    '''
+    Write outputs in a background thread. Fields are copied into a
+    snapshot and queued, the integration continues while the writer
+    compresses and writes to disk. If the queue is full write blocks
+    until the oldest output is written.
+
+    Parameters
+    ----------
+    writer : ReaderWriterBase
+        Writer that writes snapshots to disk.
+
+    param_queue_size : int
+        Maximum number of snapshots waiting to be written.
+    '''
+    def __init__(self, writer, param_queue_size=2):
+        if not isinstance(writer, ReaderWriterBase):
+            raise RuntimeError("AsyncWriter: %s is not type ReaderWriterBase" %\
+                    writer.__class__.__name__)
+        if param_queue_size < 1:
+            raise RuntimeError("AsyncWriter: queue size has to be positive")
+
+        super(AsyncWriter, self).__init__(writer.param_fields)
+        self.writer = writer
+        self.extension = writer.extension
+        self.param_queue_size = param_queue_size
+
+        self.queue = queue.Queue(maxsize=param_queue_size)
+        self.thread = None
+        self.error = None
+
+        # timings
+        self.num_writes = 0
+        self.stage_time = 0.    # time copying fields
+        self.wait_time = 0.     # time blocked on full queue
+        self.write_time = 0.    # time spent writing in background
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        '''Write queued snapshots until signaled to stop'''
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    start = time.time()
+                    self.writer.write_snapshot(*item)
+                    self.write_time += time.time() - start
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def check_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def write(self, filename, integrator):
+        '''
+        Copy fields of the real particles and queue them to be written.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the file without extension.
+
+        integrator : phd.IntegrateBase
+            Integrator that solves the equations
+        '''
+        start = time.time()
+        snapshot = self.writer.snapshot(integrator, copy=True)
+        self.writer.prepare(filename, snapshot)
+        self.stage_time += time.time() - start
+        self.write_snapshot(filename, snapshot)
+
+    def write_snapshot(self, filename, snapshot):
+        '''
+        Queue snapshot to be written, snapshot can not be modified after.
+        '''
+        self.check_error()
+        if self.thread is None:
+            self.start()
+
+        start = time.time()
+        self.queue.put((filename, snapshot))
+        self.wait_time += time.time() - start
+        self.num_writes += 1
+
+    def flush(self):
+        '''Block until all queued snapshots are written'''
+        self.queue.join()
+        self.check_error()
+
+    def close(self):
+        '''Write all queued snapshots and stop background thread'''
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+            phdLogger.info('AsyncWriter: %d outputs, staging %.3e s, '
+                    'waiting %.3e s, writing %.3e s' %\
+                    (self.num_writes, self.stage_time, self.wait_time,
+                        self.write_time))
+        self.check_error()
@@ -0,0 +1,130 @@
+import glob
+import numpy as np
+
+class LazyContainer(object):
+    '''
+    Read access to a snapshot written by Hdf5 or ParallelHdf5 with the
+    interface of CarrayContainer. Fields are only read from disk when
+    first accessed. Contiguous uncompressed fields are memory mapped,
+    so only the pages touched are read. Parameters of the simulation
+    are in attrs.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the hdf5 file.
+
+    fields : list
+        Fields available, all fields in the file if None.
+
+    region : tuple
+        Lower and upper corner of box, only particles inside are
+        selected. If None all particles are selected.
+    '''
+    def __init__(self, filename, fields=None, region=None):
+        import h5py
+
+        self.filename = filename
+        self.file = h5py.File(filename, "r")
+        self.attrs = dict(self.file.attrs)
+
+        available = [name for name in self.file.keys()
+                if isinstance(self.file[name], h5py.Dataset)]
+        if fields is None:
+            fields = sorted(available)
+        for field in fields:
+            if field not in available:
+                self.close()
+                raise RuntimeError("LazyContainer: field %s not in %s" %\
+                        (field, filename))
+
+        self.properties = dict((field, self.file[field].dtype.name)
+                for field in fields)
+        self.cache = {}
+
+        self.selection = None
+        if region is not None:
+            self.selection = self.select_region(region)
+
+    def read_field(self, name):
+        '''Read field from disk, memory mapped if possible'''
+        dataset = self.file[name]
+
+        offset = dataset.id.get_offset()
+        if offset is not None and dataset.chunks is None and\
+                dataset.compression is None and\
+                not getattr(dataset, "is_virtual", False):
+            return np.memmap(self.filename, dtype=dataset.dtype, mode="r",
+                    offset=offset, shape=dataset.shape)
+        return dataset[...]
+
+    def select_region(self, region):
+        '''Return indices of particles inside box region'''
+        low, high = np.asarray(region[0]), np.asarray(region[1])
+        dim = int(self.attrs["dim"])
+
+        inside = None
+        for i, axis in enumerate('xyz'[:dim]):
+            x = self.read_field("position-" + axis)
+            flag = (low[i] <= x) & (x < high[i])
+            inside = flag if inside is None else inside & flag
+        return np.flatnonzero(inside)
+
+    def __getitem__(self, name):
+        '''Return numpy array of field name'''
+        if name not in self.properties:
+            raise AttributeError("LazyContainer: field %s not available" % name)
+
+        if name not in self.cache:
+            data = self.read_field(name)
+            if self.selection is not None:
+                data = data[self.selection]
+            self.cache[name] = data
+        return self.cache[name]
+
+    def get_number_of_items(self):
+        if self.selection is not None:
+            return self.selection.size
+        if not self.properties:
+            return 0
+        return self.file[next(iter(self.properties))].shape[0]
+
+    def close(self):
+        '''Release cached fields and close the file'''
+        self.cache = {}
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def read_snapshot(filename, fields=None, region=None):
+    '''
+    Open snapshot for lazy reading, see LazyContainer.
+    '''
+    return LazyContainer(filename, fields, region)
+
+def iterate_snapshots(filenames, fields=None, region=None):
+    '''
+    Iterate over a series of snapshots in order. Each snapshot is
+    closed before the next is opened, so only one is held in memory.
+
+    Parameters
+    ----------
+    filenames : str or list
+        Glob pattern or list of hdf5 files.
+
+    fields : list
+        Fields available, all fields if None.
+
+    region : tuple
+        Lower and upper corner of box selecting particles.
+    '''
+    if isinstance(filenames, str):
+        filenames = sorted(glob.glob(filenames))
+
+    for filename in filenames:
+        with LazyContainer(filename, fields, region) as snapshot:
+            yield snapshot
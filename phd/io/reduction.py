@@ -0,0 +1,208 @@
+import os
+import numpy as np
+
+import phd
+
+from .io import real_particles
+from .simulation_time import SimulationOutputer
+
+class Reduction(SimulationOutputer):
+    '''
+    Compute reduced outputs in-situ every iteration_interval iterations
+    instead of writing particles. Volume weighted profiles binned in
+    radius or along an axis, global sums and extrema of real particles
+    are reduced across processors and appended as one row to the time
+    series file base_name_reduction.hdf5, written by processor 0.
+
+    Parameters
+    ----------
+    iteration_interval : int
+        Number of iterations between reductions.
+
+    param_profile_fields : list
+        Fields to bin, volume weighted mean in each bin.
+
+    param_sum_fields : list
+        Fields summed over all particles, conserative variables if None.
+
+    param_extrema_fields : list
+        Fields to find minimum and maximum.
+
+    param_axis : str
+        Coordinate binned, 'radius' or 'x', 'y', 'z'.
+
+    param_center : list
+        Center for radius, origin if None.
+
+    param_range : tuple
+        Lower and upper limit of bins.
+
+    param_num_bins : int
+        Number of bins.
+    '''
+    def __init__(self, iteration_interval, param_profile_fields=None,
+            param_sum_fields=None, param_extrema_fields=None, param_axis="radius",
+            param_center=None, param_range=(0., 0.5), param_num_bins=50,
+            **kwargs):
+        super(Reduction, self).__init__(**kwargs)
+
+        if param_axis not in ["radius", "x", "y", "z"]:
+            raise RuntimeError("Reduction: unknown axis %s" % param_axis)
+        if param_num_bins < 1 or param_range[1] <= param_range[0]:
+            raise RuntimeError("Reduction: bad bins")
+
+        self.iteration_interval = iteration_interval
+        self.param_profile_fields = param_profile_fields or ["density", "pressure"]
+        self.param_sum_fields = param_sum_fields
+        self.param_extrema_fields = param_extrema_fields or ["density", "pressure"]
+        self.param_axis = param_axis
+        self.param_center = param_center
+        self.param_range = param_range
+        self.param_num_bins = param_num_bins
+
+        self.bin_edges = np.linspace(param_range[0], param_range[1],
+                param_num_bins + 1)
+
+    def check_for_output(self, integrator):
+        return integrator.iteration % self.iteration_interval == 0
+
+    def coordinate(self, particles, selection, dim):
+        '''Return binned coordinate of the selected particles'''
+        if self.param_axis != "radius":
+            return particles["position-" + self.param_axis][selection]
+
+        center = self.param_center or [0., 0., 0.]
+        r2 = 0.
+        for i, axis in enumerate("xyz"[:dim]):
+            r2 = r2 + (particles["position-" + axis][selection] - center[i])**2
+        return np.sqrt(r2)
+
+    def reduce(self, integrator):
+        '''
+        Compute profiles, sums and extrema across all processors.
+
+        Returns
+        -------
+        dict
+            Reduced values, keyed by dataset name
+        '''
+        particles = integrator.particles
+        domain_manager = integrator.domain_manager
+        selection = real_particles(particles)
+        num_bins = self.param_num_bins
+        sum_fields = self.param_sum_fields or\
+                particles.named_groups["conserative"]
+
+        # bin index of each particle, outside particles are dropped
+        low, high = self.param_range
+        coord = self.coordinate(particles, selection, integrator.param_dim)
+        bins = np.floor((coord - low)*(num_bins/(high - low))).astype(np.int64)
+        inside = (bins >= 0) & (bins < num_bins)
+        bins = bins[inside]
+        volume = particles["volume"][selection][inside]
+
+        # count, volume and volume weighted field sums for each bin
+        num_profiles = len(self.param_profile_fields)
+        local = np.empty((num_profiles + 2)*num_bins, dtype=np.float64)
+        local[:num_bins] = np.bincount(bins, minlength=num_bins)
+        local[num_bins:2*num_bins] = np.bincount(bins, volume, num_bins)
+        for i, field in enumerate(self.param_profile_fields):
+            data = particles[field][selection][inside]
+            local[(i+2)*num_bins:(i+3)*num_bins] = np.bincount(bins,
+                    data*volume, num_bins)
+
+        sums = np.array([particles[field][selection].sum()
+            for field in sum_fields], dtype=np.float64)
+        minima = np.array([_minimum(particles[field][selection])
+            for field in self.param_extrema_fields], dtype=np.float64)
+        maxima = np.array([-_minimum(-particles[field][selection])
+            for field in self.param_extrema_fields], dtype=np.float64)
+
+        # reduce across processors
+        glb = np.empty_like(local)
+        domain_manager.reduction(send=local, rec=glb, op="sum")
+        glb_sums = np.empty_like(sums)
+        domain_manager.reduction(send=sums, rec=glb_sums, op="sum")
+        glb_minima = np.empty_like(minima)
+        domain_manager.reduction(send=minima, rec=glb_minima, op="min")
+        glb_maxima = np.empty_like(maxima)
+        domain_manager.reduction(send=maxima, rec=glb_maxima, op="max")
+
+        result = {
+                "time": integrator.time,
+                "iteration": integrator.iteration,
+                "count": glb[:num_bins],
+                "volume": glb[num_bins:2*num_bins],
+                }
+
+        volume = result["volume"]
+        filled = volume > 0.
+        for i, field in enumerate(self.param_profile_fields):
+            profile = np.full(num_bins, np.nan)
+            profile[filled] = glb[(i+2)*num_bins:(i+3)*num_bins][filled]/volume[filled]
+            result["profile-" + field] = profile
+
+        for i, field in enumerate(sum_fields):
+            result["sum-" + field] = glb_sums[i]
+        for i, field in enumerate(self.param_extrema_fields):
+            result["min-" + field] = glb_minima[i]
+            result["max-" + field] = glb_maxima[i]
+        return result
+
+    def output(self, output_directory, integrator, base_name="data"):
+        '''
+        Reduce and append row to time series file if flagged
+
+        Parameters
+        ----------
+        output_directory : str
+            Directory where data is written
+
+        integrator : phd.IntegrateBase
+            Integrator that solves the equations
+
+        base_name : str
+            Prefix of output file if param_base_name not set
+
+        Returns
+        -------
+        bool
+            True if data was written False otherwise
+        '''
+        if not self.check_for_output(integrator):
+            return False
+
+        result = self.reduce(integrator)
+        if phd._rank == 0:
+            filename = os.path.join(output_directory, "%s_reduction.hdf5" %\
+                    (self.param_base_name or base_name))
+            self.append(filename, result)
+        self.output_number += 1
+        return True
+
+    def append(self, filename, result):
+        '''Append reduced values as new row of each dataset'''
+        import h5py
+
+        # new file unless continuing after restart
+        mode = "a" if self.output_number else "w"
+        with h5py.File(filename, mode) as f:
+            if "bin_edges" not in f:
+                f.create_dataset("bin_edges", data=self.bin_edges)
+                f.attrs["axis"] = self.param_axis
+
+            for name, value in result.items():
+                value = np.asarray(value)
+                if name not in f:
+                    f.create_dataset(name, shape=(0,) + value.shape,
+                            maxshape=(None,) + value.shape, dtype=value.dtype,
+                            chunks=(64,) + value.shape)
+                dataset = f[name]
+                dataset.resize(dataset.shape[0] + 1, axis=0)
+                dataset[-1] = value
+
+def _minimum(data):
+    '''Minimum of data, inf if empty'''
+    if data.size == 0:
+        return np.inf
+    return data.min()
@@ -1,30 +1,23 @@
+import os
 import numpy as np
 
+from .io import Hdf5, ReaderWriterBase
 from ..utils.tools import check_class
 
-class SimulationTime(object):
+class SimulationFinisher(object):
     '''
-    Controller of signaling the simulation when to
-    data output and finish
+    Class that singals the simulation to stop evolving
     '''
-    def __int__(self):
-        self.outputs  = set()
-        self.finishes = set()
-
-    @check_class(SimulationOutputer)
-    def add_output(output):
-        '''Add output criteria to set'''
-        self.outputs.add(output)
-
-    @check_class(SimulationFinisher)
-    def add_finish(finish):
-        '''Add finish criteria criteria to set'''
-        self.finishes.add(finish)
+    def finished(self, integrator):
+        '''
+        Check for flag to end the simulation
+        '''
+        msg = "SimulationFinisher::finished called!"
+        raise NotImplementedError(msg)
 
-    def finish(self, integrator):
+    def modify_timestep(self, integrator):
         '''
-        Cycle through all finishers and check for flag to end
-        the simulation
+        Return consistent time step
 
         Parameters
         ----------
@@ -33,38 +26,107 @@ class SimulationTime(object):
 
         Returns
         -------
-        bool
-            True if simulation finished False otherwise
+        float
+            modified time step if needed otherwise integrator dt
         '''
-        finish_sim = False
-        for finish in self.finishes:
-            finish_sim = finish.finish(integrator) or finish_sim
-        return finish_sim
+        return integrator.dt
+
+class SimulationOutputer(object):
+    '''
+    Class that singals the simulation to write out
+    data at current time. Data is written by the writer
+    to files base_name_NNNN in the output directory.
+
+    Parameters
+    ----------
+    param_base_name : str
+        Prefix of output files, simulation name if None.
+
+    param_counter : int
+        Number of the first output.
+
+    param_fields : list
+        Fields written, all fields if None.
 
-    def output(self, integrator):
+    param_stride : int
+        Write every param_stride real particle.
+
+    param_sample_fraction : float
+        Fraction of particles randomly written, all if None.
+
+    The field and sample parameters configure the default Hdf5 writer,
+    so light outputs (few fields, subsampled) can be written often and
+    heavy outputs rarely by adding outputs with different parameters
+    and base names.
+    '''
+    def __init__(self, param_base_name=None, param_counter=0, param_fields=None,
+            param_stride=1, param_sample_fraction=None):
+        self.param_base_name = param_base_name
+        self.param_counter = param_counter
+        self.param_fields = param_fields
+        self.param_stride = param_stride
+        self.param_sample_fraction = param_sample_fraction
+
+        self.output_number = param_counter
+        self.writer = Hdf5(param_fields=param_fields, param_stride=param_stride,
+                param_sample_fraction=param_sample_fraction)
+
+    @check_class(ReaderWriterBase)
+    def set_writer(self, writer):
+        '''Set class that writes data to disk'''
+        self.writer = writer
+
+    def check_for_output(self, integrator):
         '''
-        Cycle through all outputs and check for flag to write out
-        simulation data
+        Check for flag to write out simulation data
+        '''
+        msg = "SimulationOutputer::check_for_output called!"
+        raise NotImplementedError(msg)
+
+    def output(self, output_directory, integrator, base_name="data"):
+        '''
+        Write simulation data if flagged
 
         Parameters
         ----------
+        output_directory : str
+            Directory where data is written
+
         integrator : phd.IntegrateBase
             Integrator that solves the equations
 
+        base_name : str
+            Prefix of output file if param_base_name not set
+
         Returns
         -------
         bool
-            True if should output False otherwise
+            True if data was written False otherwise
         '''
-        output_sim = False
-        for output in self.outputers:
-            output_sim = output.output(integrator) or output_sim
-        return output_sim
+        if not self.check_for_output(integrator):
+            return False
+
+        filename = os.path.join(output_directory, "%s_%04d" %\
+                (self.param_base_name or base_name, self.output_number))
+        self.writer.write(filename, integrator)
+        self.output_number += 1
+        return True
+
+    def close(self):
+        '''Finish pending writes of the writer'''
+        self.writer.close()
+
+    def get_state(self):
+        '''Return state needed to continue outputs after restart'''
+        return {"output_number": self.output_number}
+
+    def set_state(self, state):
+        '''Set state from get_state'''
+        self.output_number = state["output_number"]
 
     def modify_timestep(self, integrator):
         '''
-        Return the smallest time step from each finish and output
-        object in the simulation
+        Return consistent time step
 
         Parameters
         ----------
@@ -76,27 +138,36 @@ class SimulationTime(object):
         float
             modified time step if needed otherwise integrator dt
         '''
-        dt = integrator.dt
-        for finish in self.finishes:
-            dt = min(dt, finish.modify_timestep(integrate))
-        for output in self.outputs:
-            dt = min(dt, output.modify_timestep(integrate))
-        return dt
+        return integrator.dt
 
-class SimulationFinisher(object):
+class SimulationTime(object):
     '''
-    Class that singals the simulation to stop evolving
+    Controller of signaling the simulation when to
+    data output and finish
     '''
-    def finish(self, integrator):
-        '''
-        Check for flag to end the simulation
-        '''
-        msg = "SimulationFinisher::finish called!"
-        raise NotImplementedError(msg)
+    def __init__(self):
+        self.outputs  = []
+        self.finishes = []
+        self.base_name = "data"
 
-    def modify_timestep(self, integrator):
+    @check_class(SimulationOutputer)
+    def add_output(self, output):
+        '''Add output criteria to list'''
+        self.outputs.append(output)
+
+    @check_class(SimulationFinisher)
+    def add_finish(self, finish):
+        '''Add finish criteria criteria to list'''
+        self.finishes.append(finish)
+
+    def set_base_name(self, base_name):
+        '''Set default prefix of output files'''
+        self.base_name = base_name
+
+    def finished(self, integrator):
         '''
-        Return consistent time step
+        Cycle through all finishers and check for flag to end
+        the simulation
 
         Parameters
         ----------
@@ -105,26 +176,47 @@ class SimulationFinisher(object):
 
         Returns
         -------
-        float
-            modified time step if needed otherwise integrator dt
+        bool
+            True if simulation finished False otherwise
         '''
-        return integrator.dt
+        finish_sim = False
+        for finish in self.finishes:
+            finish_sim = finish.finished(integrator) or finish_sim
+        return finish_sim
 
-class SimulationOutputer(object):
-    '''
-    Class that singals the simulation to write out
-    data at current time.
-    '''
-    def output(self):
+    def output(self, output_directory, integrator):
         '''
-        Check for flag to write outsimulation data
+        Cycle through all outputs and check for flag to write out
+        simulation data
+
+        Parameters
+        ----------
+        output_directory : str
+            Directory where data is written
+
+        integrator : phd.IntegrateBase
+            Integrator that solves the equations
+
+        Returns
+        -------
+        bool
+            True if data was written False otherwise
         '''
-        msg = "SimulationOutputer::output called!"
-        raise NotImplementedError(msg)
+        output_sim = False
+        for output in self.outputs:
+            output_sim = output.output(output_directory, integrator,
+                    self.base_name) or output_sim
+        return output_sim
+
+    def close(self):
+        '''Finish pending writes of all outputs'''
+        for output in self.outputs:
+            output.close()
 
     def modify_timestep(self, integrator):
         '''
-        Return consistent time step
+        Return the smallest time step from each finish and output
+        object in the simulation
 
         Parameters
         ----------
@@ -136,7 +228,12 @@ class SimulationOutputer(object):
         float
             modified time step if needed otherwise integrator dt
         '''
-        return integrator.dt
+        dt = integrator.dt
+        for finish in self.finishes:
+            dt = min(dt, finish.modify_timestep(integrator))
+        for output in self.outputs:
+            dt = min(dt, output.modify_timestep(integrator))
+        return dt
 
 class Iteration(SimulationFinisher):
     '''
@@ -161,13 +258,14 @@ class Iteration(SimulationFinisher):
         bool
             True if simulation finished False otherwise
         '''
-        if integrator.iteration == self.iteration_max:
+        if integrator.iteration >= self.iteration_max:
             return True
         else:
             return False
 
 class IterationInterval(SimulationOutputer):
-    def __init__(self, iteration_interval):
+    def __init__(self, iteration_interval, **kwargs):
+        super(IterationInterval, self).__init__(**kwargs)
         self.iteration_interval = iteration_interval
 
     def check_for_output(self, integrator):
@@ -209,7 +307,7 @@ class Time(SimulationFinisher):
         bool
             True if simulation finished False otherwise
         '''
-        if self.time_max >= integrator.time:
+        if integrator.time >= self.time_max:
             return True
         else:
             return False
@@ -234,11 +332,12 @@ class Time(SimulationFinisher):
             return integrator.dt
 
 class TimeInterval(SimulationOutputer):
-    def __init__(self, time_interval, time_last_output=0):
+    def __init__(self, time_interval, time_last_output=0, **kwargs):
+        super(TimeInterval, self).__init__(**kwargs)
         self.time_interval = time_interval
         self.time_last_output = time_last_output
 
-    def output(self, integrator):
+    def check_for_output(self, integrator):
         '''
         Return True to signal the simulation has reached
         multiple of time_interval to ouput data
@@ -259,8 +358,18 @@ class TimeInterval(SimulationOutputer):
         else:
             return False
 
+    def get_state(self):
+        state = super(TimeInterval, self).get_state()
+        state["time_last_output"] = self.time_last_output
+        return state
+
+    def set_state(self, state):
+        super(TimeInterval, self).set_state(state)
+        self.time_last_output = state["time_last_output"]
+
 class SelectedTimes(SimulationOutputer):
-    def __init__(self, output_times):
+    def __init__(self, output_times, **kwargs):
+        super(SelectedTimes, self).__init__(**kwargs)
         self.output_times = np.asarray(output_times)
 
         self.remaining = self.output_times.size
@@ -268,7 +377,7 @@ class SelectedTimes(SimulationOutputer):
                 self.remaining,
                 dtype=bool)
 
-    def output(self):
+    def check_for_output(self, integrator):
         '''
         Return True to signal the simulation has reached
         selected time to ouptput data
@@ -284,15 +393,24 @@ class SelectedTimes(SimulationOutputer):
             True if should output False otherwise
         '''
         if self.remaining:
-            flag = integrator.time >= self.output_times[self.times_not_done]
-
-            self.times_not_done[flag] = False
-            self.remaining = self.times_not_done.sum()
-            return True
-        else:
-            return False
+            flag = self.times_not_done & (integrator.time >= self.output_times)
+            if flag.any():
+                self.times_not_done[flag] = False
+                self.remaining = self.times_not_done.sum()
+                return True
+        return False
+
+    def get_state(self):
+        state = super(SelectedTimes, self).get_state()
+        state["times_not_done"] = self.times_not_done.tolist()
+        return state
+
+    def set_state(self, state):
+        super(SelectedTimes, self).set_state(state)
+        self.times_not_done[:] = state["times_not_done"]
+        self.remaining = self.times_not_done.sum()
 
-    def modify_timestep(self, integrate):
+    def modify_timestep(self, integrator):
         '''
         Parameters
         ----------
@@ -306,6 +424,6 @@ class SelectedTimes(SimulationOutputer):
         '''
         if self.remaining:
             dt =  self.output_times[self.times_not_done] - integrator.time
-            return np.min(dt.min(), integrator.dt)
+            return min(dt.min(), integrator.dt)
         else:
-            return integrate.dt
+            return integrator.dt
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from phd.utils.particle_tags import ParticleTAGS
+from phd.containers.containers import CarrayContainer
+from phd.io.checkpoint import write_checkpoint, read_checkpoint
+from phd.io.simulation_time import SimulationTime, TimeInterval, SelectedTimes
+
+class Integrator(object):
+    """Stand in for integrator with state stored in checkpoint."""
+    def __init__(self, particles):
+        self.particles = particles
+        self.domain_manager = None
+        self.time = 0.
+        self.dt = 0.
+        self.iteration = 0
+        self.param_dim = 2
+
+    def set_iteration(self, iteration):
+        self.iteration = iteration
+
+def create_particles(num_items):
+    return CarrayContainer(num_items, {
+        "mass": "double", "position-x": "double",
+        "position-y": "double", "key": "longlong", "tag": "int"})
+
+def create_simulation_time():
+    simulation_time = SimulationTime()
+    simulation_time.add_output(TimeInterval(0.1))
+    simulation_time.add_output(SelectedTimes([0.2, 0.4, 0.6]))
+    return simulation_time
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "sod_checkpoint_0012")
+
+        particles = create_particles(20)
+        particles["mass"][:] = np.random.random(20)
+        particles["position-x"][:] = np.random.random(20)
+        particles["key"][:] = np.arange(20)**3
+        particles["tag"][:] = ParticleTAGS.Real
+        particles["tag"][15:] = ParticleTAGS.Ghost
+        self.particles = particles
+
+        self.integrator = Integrator(particles)
+        self.integrator.time = 0.1 + 0.2
+        self.integrator.dt = 1./3
+        self.integrator.iteration = 12
+
+        self.simulation_time = create_simulation_time()
+        self.simulation_time.outputs[0].time_last_output = 0.3
+        self.simulation_time.outputs[0].output_number = 3
+        self.simulation_time.outputs[1].check_for_output(self.integrator)
+
+        write_checkpoint(self.filename, self.integrator, self.simulation_time)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_restore(self):
+        integrator = Integrator(create_particles(0))
+        simulation_time = create_simulation_time()
+        read_checkpoint(self.filename, integrator, simulation_time)
+
+        # only real particles stored, bitwise identical
+        particles = integrator.particles
+        self.assertEqual(particles.get_number_of_items(), 15)
+        for field in particles.properties:
+            self.assertTrue(np.array_equal(particles[field],
+                self.particles[field][:15]))
+
+        self.assertEqual(integrator.time, 0.1 + 0.2)
+        self.assertEqual(integrator.dt, 1./3)
+        self.assertEqual(integrator.iteration, 12)
+
+        interval, selected = simulation_time.outputs
+        self.assertEqual(interval.output_number, 3)
+        self.assertEqual(interval.time_last_output, 0.3)
+        self.assertEqual(selected.remaining, 2)
+        self.assertEqual(selected.times_not_done.tolist(), [False, True, True])
+
+    def test_mismatch(self):
+        integrator = Integrator(create_particles(0))
+        self.assertRaises(RuntimeError, read_checkpoint, self.filename,
+                integrator, SimulationTime())
+
+        integrator.param_dim = 3
+        self.assertRaises(RuntimeError, read_checkpoint, self.filename,
+                integrator, create_simulation_time())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,249 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import numpy as np
+
+from phd.utils.particle_tags import ParticleTAGS
+from phd.containers.containers import CarrayContainer
+from phd.io.io import Hdf5, ParallelHdf5, ReaderWriterBase, AsyncWriter,\
+        Snapshot, real_particles, subsample
+from phd.io.simulation_time import SimulationTime, IterationInterval,\
+        SelectedTimes, Iteration
+
+class Integrator(object):
+    """Stand in for integrator holding state written to disk."""
+    def __init__(self, particles):
+        self.particles = particles
+        self.time = 0.5
+        self.dt = 0.01
+        self.iteration = 10
+        self.param_dim = 2
+
+class RecordWriter(ReaderWriterBase):
+    """Writer that only records file names."""
+    def __init__(self):
+        self.filenames = []
+
+    def write(self, filename, integrator):
+        self.filenames.append(filename)
+
+def create_particles(num_real, num_ghost):
+    particles = CarrayContainer(num_real + num_ghost, {
+        "density": "double", "position-x": "double",
+        "position-y": "double", "tag": "int"})
+    particles["density"][:] = np.arange(num_real + num_ghost)
+    particles["tag"][:] = ParticleTAGS.Real
+    particles["tag"][num_real:] = ParticleTAGS.Ghost
+    return particles
+
+class TestRealParticles(unittest.TestCase):
+    def test_selection(self):
+        particles = create_particles(8, 4)
+        self.assertEqual(real_particles(particles), slice(0, 8))
+
+        # reals not stored first
+        particles["tag"][0] = ParticleTAGS.Ghost
+        particles["tag"][-1] = ParticleTAGS.Real
+        self.assertTrue(np.array_equal(real_particles(particles),
+            list(range(1, 8)) + [11]))
+
+class TestSubsample(unittest.TestCase):
+    def test_stride(self):
+        self.assertEqual(subsample(slice(0, 10), 3), slice(0, 10, 3))
+        self.assertTrue(np.array_equal(subsample(np.arange(2, 9), 3), [2, 5, 8]))
+
+    def test_sample(self):
+        selection = subsample(slice(0, 100), 2, 0.2, 7)
+        self.assertEqual(selection.size, 10)
+        self.assertTrue(np.all(np.diff(selection) > 0))
+        self.assertTrue(np.all(selection % 2 == 0))
+
+        # same seed gives same sample
+        self.assertTrue(np.array_equal(selection, subsample(slice(0, 100), 2, 0.2, 7)))
+
+    def test_snapshot(self):
+        integrator = Integrator(create_particles(10, 4))
+        snapshot = Snapshot(integrator, ["density"], stride=4)
+        self.assertEqual(snapshot.num_particles, 3)
+        self.assertTrue(np.array_equal(snapshot.data["density"], [0, 4, 8]))
+
+        snapshot = Snapshot(integrator, ["density"], sample_fraction=0.5)
+        self.assertEqual(snapshot.num_particles, 5)
+        self.assertTrue(np.all(snapshot.data["density"] < 10))
+
+    def test_schedule(self):
+        output = IterationInterval(10, param_base_name="light",
+                param_fields=["density"], param_stride=2)
+        self.assertEqual(output.writer.param_fields, ["density"])
+        self.assertEqual(output.writer.param_stride, 2)
+        self.assertRaises(RuntimeError, IterationInterval, 1, param_stride=0)
+        self.assertRaises(RuntimeError, IterationInterval, 1,
+                param_sample_fraction=1.5)
+
+class TestSimulationTime(unittest.TestCase):
+    def setUp(self):
+        self.integrator = Integrator(create_particles(4, 0))
+        self.writer = RecordWriter()
+        self.simulation_time = SimulationTime()
+        self.simulation_time.set_base_name("sod")
+
+    def test_iteration_interval(self):
+        output = IterationInterval(5)
+        output.set_writer(self.writer)
+        self.simulation_time.add_output(output)
+        self.simulation_time.add_finish(Iteration(12))
+        self.integrator.iteration = 0
+
+        while not self.simulation_time.finished(self.integrator):
+            self.simulation_time.output("out", self.integrator)
+            self.integrator.iteration += 1
+
+        self.assertEqual(self.writer.filenames,
+                [os.path.join("out", "sod_%04d" % i) for i in range(3)])
+
+    def test_selected_times(self):
+        output = SelectedTimes([0.6, 0.8], param_base_name="light")
+        output.set_writer(self.writer)
+        self.simulation_time.add_output(output)
+
+        self.integrator.dt = 0.5
+        self.assertAlmostEqual(
+                self.simulation_time.modify_timestep(self.integrator), 0.1)
+
+        self.assertFalse(self.simulation_time.output("out", self.integrator))
+        self.integrator.time = 0.6
+        self.assertTrue(self.simulation_time.output("out", self.integrator))
+        self.assertFalse(self.simulation_time.output("out", self.integrator))
+        self.assertEqual(self.writer.filenames, [os.path.join("out", "light_0000")])
+
+    def test_bad_writer(self):
+        self.assertRaises(RuntimeError, IterationInterval(1).set_writer, None)
+
+class BlockedWriter(ReaderWriterBase):
+    """Writer that waits for a signal before each write."""
+    def __init__(self):
+        super(BlockedWriter, self).__init__(["density"])
+        self.release = threading.Semaphore(0)
+        self.snapshots = []
+
+    def write_snapshot(self, filename, snapshot):
+        self.release.acquire()
+        if filename == "fail":
+            raise IOError("disk full")
+        self.snapshots.append((filename, snapshot))
+
+class TestAsyncWriter(unittest.TestCase):
+    def setUp(self):
+        self.integrator = Integrator(create_particles(10, 5))
+        self.blocked = BlockedWriter()
+        self.writer = AsyncWriter(self.blocked, param_queue_size=1)
+
+    def test_staged_copy(self):
+        self.writer.write("a", self.integrator)
+
+        # integration continues and modifies particles
+        self.integrator.particles["density"][:] = -1
+        self.blocked.release.release()
+        self.writer.close()
+
+        filename, snapshot = self.blocked.snapshots[0]
+        self.assertEqual(filename, "a")
+        self.assertEqual(snapshot.iteration, 10)
+        self.assertTrue(np.array_equal(snapshot.data["density"], np.arange(10)))
+
+    def test_backpressure(self):
+        # one snapshot in writer and one in queue
+        self.writer.write("a", self.integrator)
+        self.writer.write("b", self.integrator)
+        thread = threading.Thread(target=self.writer.write,
+                args=("c", self.integrator))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+
+        for i in range(3):
+            self.blocked.release.release()
+        thread.join()
+        self.writer.close()
+        self.assertEqual([f for f, s in self.blocked.snapshots], ["a", "b", "c"])
+        self.assertEqual(self.writer.num_writes, 3)
+
+    def test_error(self):
+        self.writer.write("fail", self.integrator)
+        self.blocked.release.release()
+        self.assertRaises(IOError, self.writer.close)
+
+class TestHdf5(unittest.TestCase):
+    def setUp(self):
+        try:
+            import h5py
+        except ImportError:
+            raise unittest.SkipTest("h5py not installed")
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_write(self):
+        import h5py
+        integrator = Integrator(create_particles(100, 20))
+        writer = Hdf5(param_fields=["density", "tag"], param_chunk_size=32)
+
+        filename = os.path.join(self.path, "sod_0000")
+        writer.write(filename, integrator)
+
+        with h5py.File(filename + ".hdf5", "r") as f:
+            self.assertEqual(sorted(f.keys()), ["density", "parameters", "tag"])
+            self.assertEqual(f["density"].chunks, (32,))
+            self.assertEqual(f["density"].compression, "gzip")
+            self.assertTrue(np.array_equal(f["density"][:], np.arange(100)))
+            self.assertEqual(f.attrs["iteration"], 10)
+            self.assertEqual(f.attrs["dim"], 2)
+            self.assertEqual(f["parameters/integrator"].attrs["param_dim"], 2)
+
+    def test_bad_field(self):
+        integrator = Integrator(create_particles(10, 0))
+        writer = Hdf5(param_fields=["pressure"])
+        self.assertRaises(RuntimeError, writer.write,
+                os.path.join(self.path, "bad"), integrator)
+
+class TestParallelHdf5(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.integrator = Integrator(create_particles(10, 5))
+        self.writer = ParallelHdf5(param_fields=["density"])
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_prepare(self):
+        filename = os.path.join(self.path, "sedov_0105")
+        snapshot = Snapshot(self.integrator, ["density"])
+        self.writer.prepare(filename, snapshot)
+
+        self.assertTrue(os.path.isdir(filename))
+        self.assertEqual(snapshot.rank_sizes, [10])
+        self.assertEqual(self.writer.rank_filename(filename, 3),
+                os.path.join("sedov_0105", "data0105_cpu0003"))
+
+    def test_write(self):
+        try:
+            import h5py
+        except ImportError:
+            raise unittest.SkipTest("h5py not installed")
+
+        filename = os.path.join(self.path, "sedov_0000")
+        self.writer.write(filename, self.integrator)
+
+        rank_file = os.path.join(filename, "data0000_cpu0000.hdf5")
+        with h5py.File(rank_file, "r") as f:
+            self.assertTrue(np.array_equal(f["density"][:], np.arange(10)))
+        with h5py.File(filename + ".hdf5", "r") as f:
+            self.assertEqual(f.attrs["num_files"], 1)
+            if hasattr(h5py, "VirtualLayout"):
+                self.assertTrue(np.array_equal(f["density"][:], np.arange(10)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from phd.io.io import Hdf5
+from phd.io.reader import read_snapshot, iterate_snapshots
+from phd.utils.particle_tags import ParticleTAGS
+from phd.containers.containers import CarrayContainer
+
+class Integrator(object):
+    """Stand in for integrator holding state written to disk."""
+    def __init__(self, particles, iteration):
+        self.particles = particles
+        self.time = 0.1*iteration
+        self.dt = 0.1
+        self.iteration = iteration
+        self.param_dim = 2
+
+class TestLazyContainer(unittest.TestCase):
+    def setUp(self):
+        try:
+            import h5py
+        except ImportError:
+            raise unittest.SkipTest("h5py not installed")
+        self.path = tempfile.mkdtemp()
+
+        n = 100
+        particles = CarrayContainer(n, {"density": "double",
+            "position-x": "double", "position-y": "double", "tag": "int"})
+        particles["density"][:] = np.arange(n)
+        particles["position-x"][:] = np.linspace(0, 1, n, endpoint=False)
+        particles["position-y"][:] = 0.5
+        particles["tag"][:] = ParticleTAGS.Real
+
+        # contiguous and compressed snapshots
+        self.filenames = []
+        for i, writer in enumerate([Hdf5(param_compression=None, param_chunk_size=None),
+                Hdf5(param_chunk_size=16)]):
+            filename = os.path.join(self.path, "sod_%04d" % i)
+            writer.write(filename, Integrator(particles, i))
+            self.filenames.append(filename + ".hdf5")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_lazy(self):
+        with read_snapshot(self.filenames[0]) as snapshot:
+            self.assertEqual(snapshot.cache, {})
+            self.assertEqual(snapshot.get_number_of_items(), 100)
+
+            density = snapshot["density"]
+            self.assertTrue(isinstance(density, np.memmap))
+            self.assertTrue(np.array_equal(density, np.arange(100)))
+            self.assertEqual(list(snapshot.cache.keys()), ["density"])
+
+        with read_snapshot(self.filenames[1], fields=["density"]) as snapshot:
+            self.assertFalse(isinstance(snapshot["density"], np.memmap))
+            self.assertRaises(AttributeError, snapshot.__getitem__, "tag")
+
+    def test_region(self):
+        with read_snapshot(self.filenames[1], region=([0.25, 0], [0.5, 1])) as snapshot:
+            self.assertEqual(snapshot.get_number_of_items(), 25)
+            self.assertTrue(np.array_equal(snapshot["density"], np.arange(25, 50)))
+
+    def test_series(self):
+        pattern = os.path.join(self.path, "sod_*.hdf5")
+        iterations = [snapshot.attrs["iteration"]
+                for snapshot in iterate_snapshots(pattern, ["density"])]
+        self.assertEqual(iterations, [0, 1])
+
+    def test_bad_field(self):
+        self.assertRaises(RuntimeError, read_snapshot, self.filenames[0], ["pressure"])
+
+if __name__ == "__main__":
+    unittest.main()
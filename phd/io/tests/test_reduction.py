@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from phd.io.reduction import Reduction
+from phd.utils.particle_tags import ParticleTAGS
+from phd.containers.containers import CarrayContainer
+
+class DomainManager(object):
+    """Stand in for serial reduction."""
+    def reduction(self, send, rec, op):
+        rec[:] = send
+
+class Integrator(object):
+    def __init__(self, particles):
+        self.particles = particles
+        self.domain_manager = DomainManager()
+        self.time = 0.
+        self.iteration = 0
+        self.param_dim = 2
+
+class TestReduction(unittest.TestCase):
+    def setUp(self):
+        n = 12
+        particles = CarrayContainer(n, {"position-x": "double",
+            "position-y": "double", "volume": "double", "density": "double",
+            "mass": "double", "tag": "int"})
+        particles.named_groups["conserative"] = ["mass"]
+
+        # particles on x axis at radius 0.05, 0.15, ..., ghosts last
+        particles["position-x"][:] = 0.1*np.arange(n) + 0.05
+        particles["position-y"][:] = 0.
+        particles["volume"][:] = 1.
+        particles["volume"][1] = 3.
+        particles["density"][:] = np.arange(n)
+        particles["mass"][:] = 2.
+        particles["tag"][:] = ParticleTAGS.Real
+        particles["tag"][10:] = ParticleTAGS.Ghost
+
+        self.integrator = Integrator(particles)
+        self.reduction = Reduction(5, param_profile_fields=["density"],
+                param_extrema_fields=["density"], param_range=(0., 0.6),
+                param_num_bins=3)
+
+    def test_reduce(self):
+        result = self.reduction.reduce(self.integrator)
+
+        # two particles in each bin, ghosts and particles outside ignored
+        self.assertTrue(np.array_equal(result["count"], [2, 2, 2]))
+        self.assertTrue(np.array_equal(result["volume"], [4, 2, 2]))
+        self.assertTrue(np.allclose(result["profile-density"],
+            [(0 + 3*1)/4., 2.5, 4.5]))
+
+        self.assertEqual(result["sum-mass"], 20.)
+        self.assertEqual(result["min-density"], 0.)
+        self.assertEqual(result["max-density"], 9.)
+
+    def test_axis(self):
+        reduction = Reduction(1, param_profile_fields=["density"],
+                param_extrema_fields=["density"], param_axis="y",
+                param_range=(-1., 1.), param_num_bins=2)
+        result = reduction.reduce(self.integrator)
+        self.assertTrue(np.array_equal(result["count"], [0, 10]))
+        self.assertTrue(np.isnan(result["profile-density"][0]))
+
+    def test_bad_parameters(self):
+        self.assertRaises(RuntimeError, Reduction, 1, param_axis="theta")
+        self.assertRaises(RuntimeError, Reduction, 1, param_range=(1., 0.))
+
+    def test_append(self):
+        try:
+            import h5py
+        except ImportError:
+            raise unittest.SkipTest("h5py not installed")
+
+        path = tempfile.mkdtemp()
+        try:
+            for iteration in range(11):
+                self.integrator.iteration = iteration
+                self.reduction.output(path, self.integrator, "sedov")
+
+            with h5py.File(os.path.join(path, "sedov_reduction.hdf5"), "r") as f:
+                self.assertEqual(f["iteration"][:].tolist(), [0, 5, 10])
+                self.assertEqual(f["profile-density"].shape, (3, 3))
+                self.assertEqual(f["bin_edges"].size, 4)
+        finally:
+            shutil.rmtree(path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,6 +15,8 @@ cdef class LoadBalance:
     cdef public np.int32_t size
 
     cdef public np.int32_t order
+    cdef public int num_threads
+    cdef public list work_fields
 
     cdef public np.int32_t min_in_leaf
 
@@ -31,8 +33,9 @@ cdef class LoadBalance:
 
     cdef hilbert_type hilbert_func
 
-    cdef void _calculate_local_work(self, CarrayContainer pc, np.ndarray work)
-    cdef void _find_split_in_work(self, np.ndarray global_work)
+    cdef void _calculate_local_work(self, CarrayContainer pc, np.ndarray work,
+            np.ndarray count)
+    cpdef _find_split_in_work(self, np.ndarray global_work, np.ndarray global_count)
     cdef void _collect_particles_export(self, CarrayContainer pc, LongArray part_ids, LongArray part_pid,
             LongArray leaf_pid, int my_pid)
     cdef void _compute_hilbert_keys(self, CarrayContainer pc)
@@ -5,11 +5,12 @@ from ..utils.exchange_particles import exchange_particles
 
 from .tree cimport Node
 from ..domain.domain cimport DomainLimits
-from ..hilbert.hilbert cimport hilbert_key_2d, hilbert_key_3d
+from ..hilbert.hilbert cimport hilbert_key_table_2d, hilbert_key_table_3d, hilbert_keys_array
 
 
 cdef class LoadBalance:
-    def __init__(self, np.float64_t factor=0.1, int min_in_leaf=32, np.int32_t order=21, **kwargs):
+    def __init__(self, np.float64_t factor=0.1, int min_in_leaf=32, np.int32_t order=21,
+            int num_threads=1, list work_fields=None, **kwargs):
         """Constructor for load balance
 
         Parameters
@@ -20,8 +21,15 @@ cdef class LoadBalance:
             MPI communicator.
         order : int
             The number of bits per dimension for constructing hilbert keys.
+        num_threads : int
+            Number of threads computing hilbert keys.
+        work_fields : list
+            Particle fields summed as cost of each particle (i.e. work,
+            gravity_work), if None the cost of each particle is one.
         """
         self.order = order
+        self.num_threads = num_threads
+        self.work_fields = work_fields or []
         self.factor = factor
         self.min_in_leaf = min_in_leaf
 
@@ -56,9 +64,9 @@ cdef class LoadBalance:
             self.corner[i] = (self.domain.bounds[0][i] + self.domain.bounds[1][i])*0.5 - 0.5*self.box_length
 
         if dim == 2:
-            self.hilbert_func = hilbert_key_2d
+            self.hilbert_func = hilbert_key_table_2d
         elif dim == 3:
-            self.hilbert_func = hilbert_key_3d
+            self.hilbert_func = hilbert_key_table_3d
         else:
             raise RuntimeError("Wrong dimension for tree")
 
@@ -83,13 +91,14 @@ cdef class LoadBalance:
         self._compute_hilbert_keys(pc)
         self.tree.construct_global_tree(pc, self.comm)
 
-        local_work  = np.zeros(self.tree.number_leaves, dtype=np.int32)
-        global_work = np.zeros(self.tree.number_leaves, dtype=np.int32)
-        self._calculate_local_work(pc, local_work)
+        # row 0 is work and row 1 particle count of each leaf
+        local_work  = np.zeros((2, self.tree.number_leaves), dtype=np.float64)
+        global_work = np.zeros((2, self.tree.number_leaves), dtype=np.float64)
+        self._calculate_local_work(pc, local_work[0], local_work[1])
 
         # gather work across all processors
         self.comm.Allreduce(sendbuf=local_work, recvbuf=global_work, op=MPI.SUM)
-        self._find_split_in_work(global_work)
+        self._find_split_in_work(global_work[0], global_work[1])
 
         # collect particle for export
         self.export_ids.reset()
@@ -125,40 +134,64 @@ cdef class LoadBalance:
 
         pc['process'][:] = self.rank
 
-    cdef void _calculate_local_work(self, CarrayContainer pc, np.ndarray work):
+    cdef void _calculate_local_work(self, CarrayContainer pc, np.ndarray work,
+            np.ndarray count):
         """Calculate global work by calculating local work in each leaf. Then sum
-        work across all process. Currently the work is just the the number of
-        particles in each leaf.
+        work across all process. The work of a particle is the sum of the
+        work fields or one if no work fields are set. The number of local
+        particles in each leaf is stored in count.
         """
         cdef int i
+        cdef str field
         cdef Node* node
         cdef LongLongArray keys = pc.get_carray("key")
-
-        # work is the number of local particles in leaf
-        for i in range(pc.get_number_of_items()):
+        cdef long num_real = pc.get_number_of_items()
+        cdef np.float64_t[:] leaf_work = work
+        cdef np.float64_t[:] leaf_count = count
+        cdef np.float64_t[:] cost
+
+        if not self.work_fields:
+            # work is the number of local particles in leaf
+            for i in range(num_real):
+                node = self.tree.find_leaf(keys.data[i])
+                leaf_work[node.array_index] += 1.
+                leaf_count[node.array_index] += 1.
+            return
+
+        # work is the summed cost of local particles in leaf
+        cost = np.zeros(num_real, dtype=np.float64)
+        for field in self.work_fields:
+            np.add(cost, pc[field], out=np.asarray(cost))
+
+        for i in range(num_real):
             node = self.tree.find_leaf(keys.data[i])
-            work[node.array_index] += 1
+            leaf_work[node.array_index] += cost[i]
+            leaf_count[node.array_index] += 1.
 
-    cdef void _find_split_in_work(self, np.ndarray global_work):
+    cpdef _find_split_in_work(self, np.ndarray global_work, np.ndarray global_count):
         """Partition the global leaves amongst the process such that each process
-        has roughly equal work load.
+        has roughly equal work load. Leaves are in hilbert order, so each
+        process gets a contiguous segment of the curve. If no work has been
+        recorded yet (i.e. work fields before the first step) the leaves are
+        split by particle count.
         """
-        cdef int i, j, cum_sum
-        cdef int total_work, part_per_proc
+        cdef int i, j
+        cdef double cum_sum, total_work, work_per_proc
+        cdef np.float64_t[:] work = global_work
 
         self.leaf_pid.resize(global_work.size)
 
         total_work = global_work.sum()
-        if total_work%self.size == 0:
-            part_per_proc = total_work/self.size
-        else:
-            part_per_proc = total_work/self.size + 1
+        if total_work <= 0.:
+            work = global_count
+            total_work = global_count.sum()
+        work_per_proc = total_work/self.size
 
         j = 1
-        cum_sum = 0
-        for i in range(global_work.size):
-            cum_sum += global_work[i]
-            if cum_sum > j*part_per_proc:
+        cum_sum = 0.
+        for i in range(work.shape[0]):
+            cum_sum += work[i]
+            if cum_sum > j*work_per_proc and j < self.size:
                 j += 1
             self.leaf_pid.data[i] = j - 1
 
@@ -182,17 +215,26 @@ cdef class LoadBalance:
 
         """
         cdef Node *node
-        cdef int i, pid
+        cdef int i, pid, num_export
         cdef LongLongArray keys = pc.get_carray("key")
 
-        for i in range(pc.get_number_of_items()):
+        # worst case every particle is exported, grow buffers once
+        num_export = part_ids.length
+        part_ids.reserve(num_export + keys.length)
+        part_pid.reserve(num_export + keys.length)
+
+        for i in range(keys.length):
 
             node = self.tree.find_leaf(keys.data[i])
             pid  = leaf_pid.data[node.array_index]
 
             if pid != my_pid:
-                part_ids.append(i)
-                part_pid.append(pid)
+                part_ids.data[num_export] = i
+                part_pid.data[num_export] = pid
+                num_export += 1
+
+        part_ids.resize(num_export)
+        part_pid.resize(num_export)
 
     cdef void _compute_hilbert_keys(self, CarrayContainer pc):
         """Compute hilbert key for each particle. The container is assumed to only have
@@ -203,16 +245,17 @@ cdef class LoadBalance:
         pc : CarrayContainer
             Particle container holding all information of particles in the simulation.
         """
-        cdef int i, j
-        cdef Node* node
-        cdef np.int32_t xh[3]
+        cdef int j
         cdef np.float64_t *x[3]
+        cdef np.float64_t corner[3]
         cdef LongLongArray keys = pc.get_carray("key")
+        cdef long num_real = pc.get_number_of_items()
 
         pc.pointer_groups(x, pc.named_groups['position'])
+        for j in range(self.tree.dim):
+            corner[j] = self.corner[j]
 
-        for i in range(pc.get_number_of_items()):
-            for j in range(self.tree.dim):
-                xh[j] = <np.int32_t> ( (x[j][i] - self.corner[j])*self.fac )
-
-            keys.data[i] = self.hilbert_func(xh[0], xh[1], xh[2], self.order)
+        # all keys at once by table lookups without the gil
+        with nogil:
+            hilbert_keys_array(x, corner, self.fac, self.tree.dim, self.order,
+                    keys.data, num_real, self.num_threads)
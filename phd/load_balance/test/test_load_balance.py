@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+
+from phd.load_balance.load_balance import LoadBalance
+
+
+class TestFindSplitInWork(unittest.TestCase):
+    def setUp(self):
+        self.load_balance = LoadBalance(work_fields=["gravity_work"])
+        self.load_balance.size = 4
+
+        # particle count of each leaf in hilbert order
+        self.count = np.ones(8, dtype=np.float64)
+
+    def test_split_by_work(self):
+        work = np.array([2., 2., 1., 1., 1., 1., 0., 0.])
+        self.load_balance._find_split_in_work(work, self.count)
+        self.assertTrue(np.array_equal(
+            self.load_balance.leaf_pid.get_npy_array(),
+            [0, 1, 2, 2, 3, 3, 3, 3]))
+
+    def test_split_without_work(self):
+        # no work recorded before first gravity walk, split by count
+        work = np.zeros(8, dtype=np.float64)
+        self.load_balance._find_split_in_work(work, self.count)
+        self.assertTrue(np.array_equal(
+            self.load_balance.leaf_pid.get_npy_array(),
+            [0, 0, 1, 1, 2, 2, 3, 3]))
+
+if __name__ == "__main__":
+    unittest.main()
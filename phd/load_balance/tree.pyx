@@ -3,7 +3,7 @@ from mpi4py import MPI
 cimport libc.stdlib as stdlib
 
 from ..utils.particle_tags import ParticleTAGS
-from ..hilbert.hilbert cimport hilbert_key_2d, hilbert_key_3d
+from ..hilbert.hilbert cimport hilbert_key_table_2d, hilbert_key_table_3d
 
 cdef int Real = ParticleTAGS.Real
 cdef int Ghost = ParticleTAGS.Ghost
@@ -115,9 +115,9 @@ cdef class Tree:
 
         self.dim = dim
         if dim == 2:
-            self.hilbert_func = hilbert_key_2d
+            self.hilbert_func = hilbert_key_table_2d
         elif dim == 3:
-            self.hilbert_func = hilbert_key_3d
+            self.hilbert_func = hilbert_key_table_3d
         else:
             raise RuntimeError("Wrong dimension for tree")
 
@@ -4,6 +4,7 @@ from libcpp.vector cimport vector
 from ..mesh.pytess cimport PyTess
 from ..riemann.riemann cimport RiemannBase
 from ..domain.domain_manager cimport DomainManager
+from ..utils.carray cimport LongArray
 from ..containers.containers cimport CarrayContainer
 from ..equation_state.equation_state cimport EquationStateBase
 
@@ -25,6 +26,18 @@ cdef class Mesh:
 
     cdef public CarrayContainer faces
 
+    # face adjacency in compressed sparse row format, the faces of
+    # particle i are face_ids[face_start[i]:face_start[i+1]] and
+    # face_neighbors holds the particle across each of those faces
+    cdef public LongArray face_start
+    cdef public LongArray face_ids
+    cdef public LongArray face_neighbors
+
+    # statistics of last tessellation
+    cdef public int num_real
+    cdef public int num_ghost
+    cdef public int num_ghost_rounds
+
     cdef PyTess tess
     cdef nn_vec neighbors
 
@@ -32,6 +45,7 @@ cdef class Mesh:
     cpdef reset_mesh(self)
     cpdef tessellate(self, CarrayContainer pc, DomainManager domain_manager)
     cpdef build_geometry(self, CarrayContainer pc, DomainManager domain_manager)
+    cpdef build_face_adjacency(self, int num_particles)
     cpdef relax(self, CarrayContainer particles, DomainManager domain_manager)
 
     cpdef assign_generator_velocities(self, CarrayContainer particles, EquationStateBase equation_state)
@@ -93,6 +93,14 @@ cdef class Mesh:
         self.param_regularize = param_regularize
         self.param_num_neighbors = param_num_neighbors
 
+        self.face_start = LongArray()
+        self.face_ids = LongArray()
+        self.face_neighbors = LongArray()
+
+        self.num_real = 0
+        self.num_ghost = 0
+        self.num_ghost_rounds = 0
+
     def register_fields(self, CarrayContainer particles):
         """
         Register mesh fields into the particle container (i.e.
@@ -144,6 +152,9 @@ cdef class Mesh:
             self.faces = CarrayContainer(var_dict=face_vars_2d)
             self.faces.named_groups = named_group_2d
 
+        # faces are rebuilt every step, keep memory across steps
+        self.faces.set_capacity_policy()
+
         #elif self.dim == 3:
         #    self.tess = PyTess3d()
         #    self.faces = CarrayContainer(var_dict=face_vars_3d)
@@ -164,6 +175,8 @@ cdef class Mesh:
         # remove current ghost particles
         particles.remove_tagged_particles(ParticleTAGS.Ghost)
         start_new_ghost = stop_new_ghost = particles.get_number_of_items()
+        self.num_real = start_new_ghost
+        self.num_ghost_rounds = 0
 
         # reference position and radius 
         rp = r.get_data_ptr()
@@ -182,6 +195,7 @@ cdef class Mesh:
             # add ghost particles untill mesh is complete
             #start_new_ghost = particles.get_number_of_items()
             domain_manager.create_ghost_particles(particles)
+            self.num_ghost_rounds += 1
             stop_new_ghost = particles.get_number_of_items()
 
             # because of malloc
@@ -207,6 +221,8 @@ cdef class Mesh:
             if domain_manager.ghost_complete():
                 break
 
+        self.num_ghost = particles.get_number_of_items() - self.num_real
+
     cpdef build_geometry(self, CarrayContainer particles, DomainManager domain_manager):
         """
         Build the voronoi mesh and then extract mesh information, i.e
@@ -264,9 +280,64 @@ cdef class Mesh:
         # tmp for now
         self.faces.resize(fail)
 
+        # faces of each particle for gradient computations
+        self.build_face_adjacency(particles.get_number_of_items())
+
         # transfer particle information to ghost particles
         domain_manager.values_to_ghost(particles, self.update_ghost_fields)
 
+    cpdef build_face_adjacency(self, int num_particles):
+        """
+        Build the face adjacency of particles in compressed sparse row
+        format from the face pairs, by counting faces per particle and
+        then scattering each face to both of its particles.
+        """
+        cdef LongArray pair_i = self.faces.get_carray("pair-i")
+        cdef LongArray pair_j = self.faces.get_carray("pair-j")
+
+        cdef int i, j, n
+        cdef int num_faces = self.faces.get_number_of_items()
+        cdef np.int32_t *start, *ids, *neighbors
+
+        self.face_start.resize(num_particles + 1)
+        self.face_ids.resize(2*num_faces)
+        self.face_neighbors.resize(2*num_faces)
+
+        start = self.face_start.get_data_ptr()
+        ids = self.face_ids.get_data_ptr()
+        neighbors = self.face_neighbors.get_data_ptr()
+
+        with nogil:
+
+            # count faces of each particle
+            for i in range(num_particles + 1):
+                start[i] = 0
+            for n in range(num_faces):
+                start[pair_i.data[n] + 1] += 1
+                start[pair_j.data[n] + 1] += 1
+
+            # offsets from counts
+            for i in range(num_particles):
+                start[i + 1] += start[i]
+
+            # scatter faces, start[i] is used as cursor of particle i
+            for n in range(num_faces):
+                i = pair_i.data[n]
+                j = pair_j.data[n]
+
+                ids[start[i]] = n
+                neighbors[start[i]] = j
+                start[i] += 1
+
+                ids[start[j]] = n
+                neighbors[start[j]] = i
+                start[j] += 1
+
+            # cursors now point to the next particle, shift back
+            for i in range(num_particles, 0, -1):
+                start[i] = start[i - 1]
+            start[0] = 0
+
     cpdef reset_mesh(self):
         self.tess.reset_tess()
 
@@ -316,6 +387,8 @@ cdef class Mesh:
         cdef int i, k, dim
         cdef double c, d, R
         cdef double eta = self.param_eta
+        cdef int num_particles = particles.get_number_of_items()
+        cdef DoubleArray cs
         cdef np.float64_t *x[3], *v[3], *wx[3], *dcx[3]
 
         dim = len(particles.named_groups['position'])
@@ -325,7 +398,13 @@ cdef class Mesh:
         particles.pointer_groups(wx,  particles.named_groups['w'])
         particles.pointer_groups(dcx, particles.named_groups['dcom'])
 
-        for i in range(particles.get_number_of_items()):
+        # sound speed of all cells in one batch
+        if self.param_regularize:
+            cs = DoubleArray(num_particles)
+            equation_state.energy_array(r.data, p.data, cs.data, num_particles, 0)
+            equation_state.sound_speed_array(r.data, cs.data, cs.data, num_particles, 0)
+
+        for i in range(num_particles):
 
             for k in range(dim):
                 wx[k][i] = v[k][i]
@@ -333,7 +412,7 @@ cdef class Mesh:
             if self.param_regularize:
 
                 # sound speed 
-                c = equation_state.sound_speed(r.data[i], p.data[i])
+                c = cs.data[i]
 
                 # distance form cell com to particle position
                 d = 0.0
@@ -3,6 +3,7 @@ cimport numpy as np
 from ..mesh.mesh cimport Mesh
 from ..riemann.riemann cimport RiemannBase
 from ..domain.domain_manager cimport DomainManager
+from ..utils.carray cimport DoubleArray
 from ..containers.containers cimport CarrayContainer
 from ..equation_state.equation_state cimport EquationStateBase
 
@@ -14,6 +15,7 @@ cdef class ReconstructionBase:
 #    cdef np.float64_t** colr
 
     cdef bint registered_fields
+    cdef public EquationStateBase equation_state
     cdef public CarrayContainer left_states
     cdef public CarrayContainer right_states
 
@@ -21,24 +23,61 @@ cdef class ReconstructionBase:
     cdef public dict reconstruct_field_groups
 #    cdef public dict reconstruct_grad_groups
 
+    # fused face pipeline, set in begin_face_states
+    cdef int face_dim
+    cdef bint face_boost
+    cdef np.float64_t* face_wx[3]
+
     cpdef compute_states(self, CarrayContainer particles, Mesh mesh,
             bint boost, DomainManager domain_manager, double dt)
 
+    cpdef begin_face_states(self, CarrayContainer particles, Mesh mesh,
+            bint boost, DomainManager domain_manager, double dt)
+    cdef int face_states(self, int m, int i, int j,
+            np.float64_t* ql, np.float64_t* qr) nogil
+
 cdef class PieceWiseConstant(ReconstructionBase):
-    pass
-
-#cdef class PieceWiseLinear(ReconstructionBase):
-#
-#    cdef public int param_limiter
-#    cdef public CarrayContainer grad
-#
-#    cdef np.float64_t** prim_ptr
-#    cdef np.float64_t** grad_ptr
-#
-#    cdef np.float64_t* phi_max
-#    cdef np.float64_t* phi_min
-#
-#    cdef np.float64_t* alpha
-#    cdef np.float64_t* df
-#
-#    cdef compute_gradients(self, CarrayContainer pc, CarrayContainer faces, Mesh mesh)
+
+    cdef int num_fields
+    cdef np.float64_t** cell_ptr
+
+cdef class PieceWiseLinear(ReconstructionBase):
+
+    cdef public int param_limiter
+    cdef public bint param_scatter_gradients
+
+    cdef public int num_fields
+    cdef public int num_first_order     # faces reverted to constant states
+
+    # primitive fields and gradients of all particles stored as one
+    # block, field n of particle i is prim[n*N + i] and its derivative
+    # along axis k is grad[(n*dim + k)*N + i]
+    cdef public DoubleArray prim
+    cdef public DoubleArray grad
+
+    # density times sound speed squared of each particle
+    cdef public DoubleArray bulk
+
+    cdef int density_index
+    cdef int pressure_index
+    cdef int* field_axis                # velocity axis of field or -1
+
+    # neighbor extrema of each field, same layout as prim
+    cdef public DoubleArray phi_max
+    cdef public DoubleArray phi_min
+    cdef np.float64_t* alpha
+
+    cdef np.float64_t** left_ptr
+    cdef np.float64_t** right_ptr
+    cdef np.float64_t* q
+
+    # fused face pipeline, set in begin_face_states
+    cdef int face_N
+    cdef double face_fac
+    cdef np.float64_t* face_x[3]
+    cdef np.float64_t* face_dcx[3]
+    cdef np.float64_t* face_fij[3]
+
+    cpdef compute_gradients(self, CarrayContainer particles, Mesh mesh,
+            DomainManager domain_manager)
+    cdef compute_bulk_modulus(self, CarrayContainer particles)
@@ -5,9 +5,12 @@ cimport numpy as np
 cimport libc.stdlib as stdlib
 from libc.math cimport sqrt, fmax, fmin
 
+from ..domain.boundary import Reflective
 from ..utils.particle_tags import ParticleTAGS
 from ..utils.carray cimport DoubleArray, IntArray, LongArray
 
+cdef int REAL = ParticleTAGS.Real
+
 cdef class ReconstructionBase:
     def __init__(self):
         self.registered_fields = False
@@ -49,6 +52,10 @@ cdef class ReconstructionBase:
         self.reconstruct_fields = fields_to_add
         self.reconstruct_field_groups = named_groups
 
+    def set_equation_state(self, EquationStateBase equation_state):
+        """Set equation of state used for time extrapolation"""
+        self.equation_state = equation_state
+
     cpdef compute_states(self, CarrayContainer particles, Mesh mesh,
             bint boost, DomainManager domain_manager, double dt):
         """
@@ -58,9 +65,32 @@ cdef class ReconstructionBase:
         msg = "Reconstruction::compute called!"
         raise NotImplementedError(msg)
 
+    cpdef begin_face_states(self, CarrayContainer particles, Mesh mesh,
+            bint boost, DomainManager domain_manager, double dt):
+        """
+        Prepare reconstruction of single faces with face_states, used by
+        the fused face pipeline instead of compute_states.
+        """
+        msg = "Reconstruction::begin_face_states called!"
+        raise NotImplementedError(msg)
+
+    cdef int face_states(self, int m, int i, int j,
+            np.float64_t* ql, np.float64_t* qr) nogil:
+        """
+        Reconstruct left and right state of face m made by particles i
+        and j in primitive order. Returns the number of states reverted
+        to piecewise constant.
+        """
+        return 0
+
 cdef class PieceWiseConstant(ReconstructionBase):
     def __init__(self):
         super(PieceWiseConstant, self).__init__()
+        self.cell_ptr = NULL
+
+    def __dealloc__(self):
+        """Release pointers"""
+        stdlib.free(self.cell_ptr)
 
     def initialize(self):
         if not self.registered_fields:
@@ -75,6 +105,37 @@ cdef class PieceWiseConstant(ReconstructionBase):
         self.left_states.named_groups  = self.reconstruct_field_groups
         self.right_states.named_groups = self.reconstruct_field_groups
 
+        # states are resized every step, keep memory across steps
+        self.left_states.set_capacity_policy()
+        self.right_states.set_capacity_policy()
+
+        self.num_fields = len(self.reconstruct_field_groups["primitive"])
+        self.cell_ptr = <np.float64_t**> stdlib.malloc(self.num_fields*sizeof(void*))
+
+    cpdef begin_face_states(self, CarrayContainer particles, Mesh mesh,
+            bint boost, DomainManager domain_manager, double dt):
+        """Store particle primitive and face velocity pointers"""
+        self.face_boost = boost
+        self.face_dim = len(particles.named_groups["position"])
+        particles.pointer_groups(self.cell_ptr,
+                self.reconstruct_field_groups["primitive"])
+        mesh.faces.pointer_groups(self.face_wx, mesh.faces.named_groups["velocity"])
+
+    cdef int face_states(self, int m, int i, int j,
+            np.float64_t* ql, np.float64_t* qr) nogil:
+        """Copy particle values, velocities follow density in primitive order"""
+        cdef int k, n
+
+        for n in range(self.num_fields):
+            ql[n] = self.cell_ptr[n][i]
+            qr[n] = self.cell_ptr[n][j]
+
+        if self.face_boost:
+            for k in range(self.face_dim):
+                ql[1+k] -= self.face_wx[k][m]
+                qr[1+k] -= self.face_wx[k][m]
+        return 0
+
     cpdef compute_states(self, CarrayContainer particles, Mesh mesh,
             bint boost, DomainManager domain_manager, double dt):
         """Construct left and right states for riemann solver for each face"""
@@ -137,405 +198,582 @@ cdef class PieceWiseConstant(ReconstructionBase):
                     vl[k][n] = v[k][i]
                     vr[k][n] = v[k][j]
 
-#cdef class PieceWiseLinear(ReconstructionBase):
-#    def __init__(self, int param_limiter = 0):
-#        self.param_limiter = param_limiter
-#
-#    def __dealloc__(self):
-#        """Release pointers"""
-#
-#        stdlib.free(self.prim_ptr)
-#        stdlib.free(self.grad_ptr)
-#
-#        if self.do_colors:
-#            stdlib.free(self.col)
-#            stdlib.free(self.coll)
-#            stdlib.free(self.colr)
-#            stdlib.free(self.dc)
-#
-#        stdlib.free(self.phi_max)
-#        stdlib.free(self.phi_min)
-#
-#        stdlib.free(self.alpha)
-#        stdlib.free(self.df)
-#
-#    def set_fields_to_reconstruct(CarrayContainer particles):
-#        """
-#        Create lists of variables to reconstruct and setup containers for
-#        gradients and reconstructions
-#        """
-#        cdef str field, grad_name
-#        cdef int i, num_fields, dim
-#        cdef list axis = ["x", "y", "z"]
-#        cdef dict grad_groups = defaultdict([])
-#        cdef dict state_vars = {}, grad_vars = {}
-#
-#        dim = particles.info["dim"]
-#
-#        # add primitive fields
-#        for field in particles.named_groups["primitive"]:
-#            state_vars[field] = "double"
-#            for i in range(dim):
-#
-#                # store gradient of field
-#                grad_name = field + "_" + axis[i]               # field name
-#                grad_vars[grad_name] = "double"                 # creation list
-#                grad_groups[field].append(grad_name)            # gradient vector list
-#                grad_groups["primitive"].append(grad_name)      # main list
-#
-#                # store velocity gradient matrix
-#                if "vel" in field:
-#                    grad_groups["velocity"].append(grad_name)
-#
-#        # add species fields
-#        if "species" in particles.named_groups.keys():
-#            for field in particles.named_groups["species"]:
-#                state_vars[field] = "double"
-#                for i in range(dim):
-#
-#                    # store gradient of field
-#                    grad_name = field + "_" + axis[i]           # field name
-#                    grad_vars[grad_name] = "double"             # creation list
-#                    grad_groups[field].append(grad_name)        # gradient vector list
-#                    grad_groups["primitive"].append(grad_name)  # main list
-#                    grad_groups["species"].append(gradd_name)
-#
-#        # add species fields
-#        if "passive-scalars" in particles.named_groups.keys():
-#            for field in particles.named_groups["passive-scalars"]:
-#                state_vars[field] = "double"
-#                for i in range(dim):
-#
-#                    # store gradient of field
-#                    grad_name = field + "_" + axis[i]           # field name
-#                    state_vars[grad_name] = "double"            # creation list
-#                    grad_groups[field].append(grad_name)        # gradient vector list
-#                    grad_groups["primitive"].append(grad_name)  # main list
-#                    grad_groups["passive-scalars"].append(grad_name)
-#
-#        # store fields
-#        self.reconstruct_fields = state_vars
-#        self.reconstruct_grad_groups = grad_vars
-#        self.reconstruct_field_groups = named_groups
-#
-#    def initialize(self):
-#        """Setup initial arrays and routines for computation"""
-#
-#        if self.fields_to_reconstruct or\
-#                self.fields_to_reconstruct_grad or\
-#                self.fields_to_reconstruct_groups:
-#            raise RuntimeError("fields to reconstruct not specified")
-#
-#        # create states
-#        self.left_state  = CarrayContainer(var_dict=self.fields_to_reconstruct)
-#        self.right_state = CarrayContainer(var_dict=self.fields_to_reconstruct)
-#        self.grad = CarrayContainer(var_dict=self.grad_state_vars)
-#
-#        # allocate helper pointers
-#        dim = len(named_groups["velocity"])
-#        num_fields = len(self.fields_to_reconstruct_groups["primitive"])
-#
-#        if self.do_colors:
-#            num_colors = len(self.fields_to_reconstruct_groups["colors"])
-#            self.cl = <np.float64_t**> stdlib.malloc(num_colors*sizeof(void*))
-#            self.cr = <np.float64_t**> stdlib.malloc(num_colors*sizeof(void*))
-#            self.dc = <np.flota64_t**> stdlib.malloc((num_colors*dim)*sizeof(void*))
-#
-#        # primitive values and gradient
-#        self.prim_ptr = <np.float64_t**> stdlib.malloc(num_fields*sizeof(void*))
-#        self.grad_ptr = <np.float64_t**> stdlib.malloc((num_fields*dim)*sizeof(void*))
-#
-#        # min/max of field value of particle
-#        self.phi_max = <np.float64_t*> stdlib.malloc(num_fields*sizeof(np.float64))
-#        self.phi_min = <np.float64_t*> stdlib.malloc(num_fields*sizeof(np.float64))
-#        self.alpha   = <np.float64_t*> stdlib.malloc(num_fields*sizeof(np.float64))
-#
-#        # difference of field value at paticle position to face position
-#        self.df = <np.float64_t*> stdlib.malloc((num_fields*dim)*sizeof(np.float64))
-#
-#    cdef compute_gradients(self, CarrayContainer particles, Mesh mesh):
-#        """Compute gradients for each primitive variable"""
-#
-#        # particle information
-#        cdef IntArray flags = particles.get_carray("flag")
-#        cdef DoubleArray vol = particles.get_carray("volume")
-#
-#        cdef DoubleArray face_area = mesh.faces.get_carray("area")
-#        cdef LongArray pair_i = mesh.faces.get_carray("pair-i")
-#        cdef LongArray pair_j = mesh.faces.get_carray("pair-j")
-#
-#        cdef int limiter = self.param_limiter
-#
-#        cdef double dph, psi, d_dif, d_sum
-#        cdef int i, j, k, n, m, fid, dim = particles.info["dim"]
-#
-#        cdef double *x[3], *dcx[3]
-#        cdef double cfx[3], *fij[3], area
-#        cdef double xi[3], xj[3], dr[3], cx[3], r, _vol
-#
-#        cdef int num_fields = len(particles.named_groups['primitive'])
-#
-#        cdef np.float64_t** prim = self.prim_ptr
-#        cdef np.float64_t** grad = self.grad_ptr
-#
-#        cdef np.float64_t* phi_max = self.phi_max
-#        cdef np.float64_t* phi_min = self.phi_min
-#        cdef np.float64_t* alpha   = self.alpha
-#        cdef np.float64_t* df      = self.df
-#
-#        # pointer to particle information
-#        particles.pointer_groups(x, particles.named_groups['position'])
-#        particles.pointer_groups(dcx, particles.named_groups['dcom'])
-#        particles.pointer_groups(prim, particles.named_groups['primitive'])
-#
-#        # pointer to face center of mass
-#        mesh.faces.pointer_groups(fij, mesh.faces.named_groups['com'])
-#
-#        # pointer to primitive gradients with dimension stacked
-#        self.grad.pointer_groups(grad, self.grad.named_groups['primitive'])
-#
-#        # calculate gradients
-#        for i in range(particles.get_number_of_items()):
-#            if(flags.data[i] & Real):
-#
-#                # store particle position
-#                for k in range(dim):
-#                    xi[k] = x[k][i]
-#                    cx[k] = xi[k] + dcx[k][i]
-#                _vol = vol.data[i]
-#
-#                for n in range(num_fields):
-#
-#                    # set min/max primitive values
-#                    phi_max[n] = phi_min[n] = prim[n][i]
-#                    alpha[n]   = 1.0
-#
-#                    # zero out gradients
-#                    for k in range(dim):
-#                        df[dim*n+k] = 0
-#
-#                # loop over faces of particle
-#                for m in range(mesh.neighbors[i].size()):
-#
-#                    # index of face neighbor
-#                    fid = mesh.neighbors[i][m]
-#                    area = face_area.data[fid]
-#
-#                    # extract neighbor from face
-#                    if i == pair_i.data[fid]:
-#                        j = pair_j.data[fid]
-#                    elif i == pair_j.data[fid]:
-#                        j = pair_i.data[fid]
-#                    else:
-#                        print 'error in neighobr'
-#
-#                    r = 0.0
-#                    for k in range(dim):
-#
-#                        # neighbor position
-#                        xj[k] = x[k][j]
-#
-#                        # face center mass relative to midpoint of particles
-#                        cfx[k] = fij[k][fid] - 0.5*(xi[k] + xj[k])
-#
-#                        # separation vector of particles
-#                        dr[k] = xi[k] - xj[k]
-#                        r += dr[k]**2
-#
-#                    r = sqrt(r)
-#
-#                    # extrapolate each field to face
-#                    for n in range(num_fields):
-#
-#                        # add neighbor values to max and min
-#                        phi_max[n] = fmax(phi_max[n], prim[n][j])
-#                        phi_min[n] = fmin(phi_min[n], prim[n][j])
-#
-#                        d_dif = prim[n][j] - prim[n][i]
-#                        d_sum = prim[n][j] + prim[n][i]
-#
-#                        # gradient estimate eq. 21
-#                        for k in range(dim):
-#                            df[dim*n+k] += area*(d_dif*cfx[k] - 0.5*d_sum*dr[k])/(r*_vol)
-#
-#                # limit gradients eq. 30
-#                for m in range(mesh.neighbors[i].size()):
-#
-#                    # index of face neighbor
-#                    fid = mesh.neighbors[i][m]
-#
-#                    if limiter == 0: # AREPO limiter
-#
-#                        for n in range(num_fields):
-#
-#                            dphi = 0
-#                            for k in range(dim):
-#                                dphi += df[dim*n+k]*(fij[k][fid] - cx[k])
-#
-#                            if dphi > 0.0:
-#                                psi = (phi_max[n] - prim[n][i])/dphi
-#                            elif dphi < 0.0:
-#                                psi = (phi_min[n] - prim[n][i])/dphi
-#                            else:
-#                                psi = 1.0
-#
-#                            alpha[n] = fmin(alpha[n], psi)
-#
-#                    elif limiter == 1: # TESS limiter
-#
-#                        for n in range(num_fields):
-#
-#                            # extract neighbor from face
-#                            if i == pair_i.data[fid]:
-#                                j = pair_j.data[fid]
-#                            elif i == pair_j.data[fid]:
-#                                j = pair_i.data[fid]
-#
-#                            dphi = 0
-#                            for k in range(dim):
-#                                dphi += df[dim*n+k]*(fij[k][fid] - cx[k])
-#
-#                            if dphi > 0.0:
-#                                psi = max((prim[n][j] - prim[n][i])/dphi, 0.)
-#                            elif dphi < 0.0:
-#                                psi = max((prim[n][j] - prim[n][i])/dphi, 0.)
-#                            else:
-#                                psi = 1.0
-#
-#                            alpha[n] = fmin(alpha[n], psi)
-#
-#                # store the gradients
-#                for n in range(num_fields):
-#                    for k in range(dim):
-#                        grad[dim*n+k][i] = alpha[n]*df[dim*n+k]
-#
-#        # transfer gradients to ghost particles
-#        domain_manager.update_gradients(particles, self.grad, self.grad.named_groups['primitive'])
-#
-#    def compute_states(self, CarrayContainer particles, Mesh mesh,
-#            RiemannBase riemann, double dt):
-#        """
-#        compute linear reconstruction. Method taken from Springel (2009)
-#        """
-#        cdef double fac = 0.5*dt
-#        cdef bint boost = riemann.param_boost
-#        cdef double sepi, sepj, gamma = eos.get_gamma()
-#        cdef int i, j, k, m, n, dim = particles.info["dim"]
-#
-#        cdef np.float64_t vi[3], vj[3]
-#        cdef np.float64_t *fij[3], *wx[3]
-#        cdef np.float64_t *vl[3], *vr[3]
-#        cdef np.float64_t *x[3], *v[3], *dcx[3]
-#        cdef np.float64_t *dd[3], *dv[9], *dp[3]
-#
-#        cdef LongArray pair_i = mesh.faces.get_carray("pair-i")
-#        cdef LongArray pair_j = mesh.faces.get_carray("pair-j")
-#
-#        # particle primitive variables
-#        cdef DoubleArray d = particles.get_carray("density")
-#        cdef DoubleArray p = particles.get_carray("pressure")
-#
-#        # left state primitive variables
-#        cdef DoubleArray dl = self.left_state.get_carray("density")
-#        cdef DoubleArray pl = self.left_state.get_carray("pressure")
-#
-#        # right state primitive variables
-#        cdef DoubleArray dr = self.right_state.get_carray("density")
-#        cdef DoubleArray pr = self.right_state.get_carray("pressure")
-#
-#        # extract pointers
-#        particles.pointer_groups(x, particles.named_groups['position'])
-#        particles.pointer_groups(dcx, particles.named_groups['dcom'])
-#        particles.pointer_groups(v, particles.named_groups['velocity'])
-#
-#        self.left_state.pointer_groups(vl,  self.left_state.named_groups['velocity'])
-#        self.right_state.pointer_groups(vr, self.right_state.named_groups['velocity'])
-#
-#        mesh.faces.pointer_groups(fij, mesh.faces.named_groups['com'])
-#        mesh.faces.pointer_groups(wx,  mesh.faces.named_groups['velocity'])
-#
-#        # allocate space and compute gradients
-#        self.grad.resize(particles.get_number_of_items())
-#        self.compute_gradients(particles, mesh.faces)
-#
-#        self.grad.pointer_groups(dd, self.reconstruct_grad_groups['density'])
-#        self.grad.pointer_groups(dv, self.reconstruct_grad_groups['velocity'])
-#        self.grad.pointer_groups(dp, self.reconstruct_grad_groups['pressure'])
-#
-#        if do_colors:
-#            self.particles(self.col, particles.named_groups["colors"])
-#            self.left_state.pointer_groups(self.coll,  self.named_groups['colors'])
-#            self.right_state.pointer_groups(self.colr, self.named_groups['colors'])
-#            self.grad.pointer_groups(dc, self.reconstruct_grad_groups['colors'])
-#
-#        # create left/right states for each face
-#        for m in range(mesh.faces.get_number_of_items()):
-#
-#            i = pair_i.data[m]
-#            j = pair_j.data[m]
-#
-#            # density
-#            dl.data[m] = d.data[i]
-#            dr.data[m] = d.data[j]
-#
-#            if do_colors:
-#                for c in range(num_colors):
-#                    self.coll[c][m] = self.col[c][i]
-#                    self.colr[c][m] = self.col[c][j]
-#
-#            # pressure
-#            pl.data[m] = p.data[i]
-#            pr.data[m] = p.data[j]
-#
-#            # velocity - add pressure gradient component
-#            for k in range(dim):
-#
-#                # copy velocities
-#                if boost:
-#                    vi[k] = v[k][i] - wx[k][m]
-#                    vj[k] = v[k][j] - wx[k][m]
-#                else:
-#                    vi[k] = v[k][i]
-#                    vj[k] = v[k][j]
-#
-#                vl[k][m] = vi[k] - fac*dp[k][i]/d.data[i]
-#                vr[k][m] = vj[k] - fac*dp[k][j]/d.data[j]
-#
-#            # MUSCL schemem eq. 36
-#            for k in range(dim): # dot products
-#
-#                # distance from particle to com of face
-#                sepi = fij[k][m] - (x[k][i] + dcx[k][i])
-#                sepj = fij[k][m] - (x[k][j] + dcx[k][j])
-#
-#                # add gradient (eq. 21) and time extrapolation (eq. 37)
-#                # the trace of dv is div of velocity
-#                dl.data[m] += dd[k][i]*(sepi - fac*vi[k]) - fac*d.data[i]*dv[(dim+1)*k][i]
-#                dr.data[m] += dd[k][j]*(sepj - fac*vj[k]) - fac*d.data[j]*dv[(dim+1)*k][j]
-#
-#                if do_colors:
-#                    for c in range(num_colors):
-#                        self.coll[c][m] += self.dc[c*num_colors+k]*(sepi - fac*vi[k]) -\
-#                                fac*self.col[c][i]*dv[(dim+1)*k][i]
-#                        self.colr[c][m] += self.dc[c*num_colors+k]*(sepj - fac*vj[k]) -\
-#                                fac*self.col[c][j]*dv[(dim+1)*k][j]
-#
-#                pl.data[m] += dp[k][i]*(sepi - fac*vi[k]) - fac*gamma*p.data[i]*dv[(dim+1)*k][i]
-#                pr.data[m] += dp[k][j]*(sepj - fac*vj[k]) - fac*gamma*p.data[j]*dv[(dim+1)*k][j]
-#
-#                # pressure term already added before loop 
-#                for n in range(dim): # over velocity components
-#                    vl[n][m] += dv[n*dim+k][i]*(sepi - fac*vi[k])
-#                    vr[n][m] += dv[n*dim+k][j]*(sepj - fac*vj[k])
-#
-#            if dl.data[m] <= 0.0:
-#                raise RuntimeError('left density less than zero...... id: %d (%f, %f)' %(i, x[0][i], x[1][i]))
-#            if dr.data[m] <= 0.0:
-#                raise RuntimeError('right density less than zero..... id: %d (%f, %f)' %(j, x[0][j], x[1][j]))
-#            if pl.data[m] <= 0.0:
-#                raise RuntimeError('left pressure less than zero..... id: %d (%f, %f)' %(i, x[0][i], x[1][i]))
-#            if pr.data[m] <= 0.0:
-#                raise RuntimeError('right pressure less than zero.... id: %d (%f, %f)' %(j, x[0][j], x[1][j]))
+cdef void gather_gradients(int num_particles, int num_fields, int dim,
+        np.int8_t* tags, np.float64_t** x, np.float64_t* vol,
+        np.float64_t* area, np.float64_t** fij, np.int32_t* face_start,
+        np.int32_t* face_ids, np.int32_t* face_neighbors, np.float64_t* prim,
+        np.float64_t* grad, np.float64_t* phi_max, np.float64_t* phi_min) nogil:
+    """
+    Unlimited gradient estimate (eq. 21 of Springel 2010) and neighbor
+    extrema of all fields of real particles by looping over the faces
+    of each particle. Interior faces are visited once from each side.
+    Ghost particles are left with zero gradients as in scatter_gradients.
+    """
+    cdef int N = num_particles
+    cdef int i, j, k, m, n, fid
+    cdef double r, fac, d_dif, d_sum
+    cdef double xi[3], dr[3], cfx[3]
+
+    for n in range(num_fields):
+        for i in range(N):
+
+            # set min/max primitive values
+            phi_max[n*N + i] = phi_min[n*N + i] = prim[n*N + i]
+
+            # zero out gradients
+            for k in range(dim):
+                grad[(n*dim + k)*N + i] = 0.0
+
+    for i in range(N):
+        if tags[i] != REAL:
+            continue
+
+        for k in range(dim):
+            xi[k] = x[k][i]
+
+        for m in range(face_start[i], face_start[i+1]):
+
+            fid = face_ids[m]
+            j = face_neighbors[m]
+
+            r = 0.0
+            for k in range(dim):
+
+                # face center mass relative to midpoint of particles
+                cfx[k] = fij[k][fid] - 0.5*(xi[k] + x[k][j])
+
+                # separation vector of particles
+                dr[k] = xi[k] - x[k][j]
+                r += dr[k]*dr[k]
+
+            fac = area[fid]/(sqrt(r)*vol[i])
+            for n in range(num_fields):
+
+                # add neighbor values to max and min
+                phi_max[n*N + i] = fmax(phi_max[n*N + i], prim[n*N + j])
+                phi_min[n*N + i] = fmin(phi_min[n*N + i], prim[n*N + j])
+
+                d_dif = prim[n*N + j] - prim[n*N + i]
+                d_sum = prim[n*N + j] + prim[n*N + i]
+
+                for k in range(dim):
+                    grad[(n*dim + k)*N + i] += fac*(d_dif*cfx[k] - 0.5*d_sum*dr[k])
+
+cdef void scatter_gradients(int num_particles, int num_faces, int num_fields,
+        int dim, np.int8_t* tags, np.float64_t** x, np.float64_t* vol,
+        np.float64_t* area, np.float64_t** fij, np.int32_t* pair_i,
+        np.int32_t* pair_j, np.float64_t* prim, np.float64_t* grad,
+        np.float64_t* phi_max, np.float64_t* phi_min) nogil:
+    """
+    Same result as gather_gradients but with a single loop over faces.
+    The geometry of each face is computed once and its contribution is
+    added to both particles, the contribution to j is the one to i with
+    the separation and field difference reversed.
+    """
+    cdef int N = num_particles
+    cdef int i, j, k, m, n
+    cdef bint real_i, real_j
+    cdef double r, fac, d_dif, d_sum, dg
+    cdef double dr[3], cfx[3]
+
+    for n in range(num_fields):
+        for i in range(N):
+
+            # set min/max primitive values
+            phi_max[n*N + i] = phi_min[n*N + i] = prim[n*N + i]
+
+            # zero out gradients
+            for k in range(dim):
+                grad[(n*dim + k)*N + i] = 0.0
+
+    for m in range(num_faces):
+
+        i = pair_i[m]
+        j = pair_j[m]
+
+        real_i = tags[i] == REAL
+        real_j = tags[j] == REAL
+
+        r = 0.0
+        for k in range(dim):
+
+            # face center mass relative to midpoint of particles
+            cfx[k] = fij[k][m] - 0.5*(x[k][i] + x[k][j])
+
+            # separation vector of particles
+            dr[k] = x[k][i] - x[k][j]
+            r += dr[k]*dr[k]
+
+        fac = area[m]/sqrt(r)
+        for n in range(num_fields):
+
+            # add neighbor values to max and min
+            phi_max[n*N + i] = fmax(phi_max[n*N + i], prim[n*N + j])
+            phi_min[n*N + i] = fmin(phi_min[n*N + i], prim[n*N + j])
+            phi_max[n*N + j] = fmax(phi_max[n*N + j], prim[n*N + i])
+            phi_min[n*N + j] = fmin(phi_min[n*N + j], prim[n*N + i])
+
+            d_dif = prim[n*N + j] - prim[n*N + i]
+            d_sum = prim[n*N + j] + prim[n*N + i]
+
+            # volume is divided out per particle afterwards
+            for k in range(dim):
+                dg = fac*(d_dif*cfx[k] - 0.5*d_sum*dr[k])
+                if real_i:
+                    grad[(n*dim + k)*N + i] += dg
+                if real_j:
+                    grad[(n*dim + k)*N + j] -= dg
+
+    for i in range(N):
+        if tags[i] == REAL:
+            for n in range(num_fields*dim):
+                grad[n*N + i] /= vol[i]
+
+cdef void limit_gradients(int num_particles, int num_fields, int dim,
+        int limiter, np.int8_t* tags, np.float64_t** x, np.float64_t** dcx,
+        np.float64_t** fij, np.int32_t* face_start, np.int32_t* face_ids,
+        np.int32_t* face_neighbors, np.float64_t* prim, np.float64_t* grad,
+        np.float64_t* phi_max, np.float64_t* phi_min, np.float64_t* alpha) nogil:
+    """
+    Slope limit gradients of real particles (eq. 30 of Springel 2010)
+    such that the extrapolated value at each face stays within the
+    extrema of the neighbors (AREPO) or the neighbor value (TESS).
+    """
+    cdef int N = num_particles
+    cdef int i, j, k, m, n, fid
+    cdef double dphi, psi
+    cdef double cx[3]
+
+    for i in range(N):
+        if tags[i] != REAL:
+            continue
+
+        # particle center of mass
+        for k in range(dim):
+            cx[k] = x[k][i] + dcx[k][i]
+
+        for n in range(num_fields):
+            alpha[n] = 1.0
+
+        for m in range(face_start[i], face_start[i+1]):
+
+            fid = face_ids[m]
+            j = face_neighbors[m]
+
+            for n in range(num_fields):
+
+                # change of field from center of mass to face
+                dphi = 0.0
+                for k in range(dim):
+                    dphi += grad[(n*dim + k)*N + i]*(fij[k][fid] - cx[k])
+
+                if dphi == 0.0:
+                    psi = 1.0
+                elif limiter == 0: # AREPO limiter
+                    if dphi > 0.0:
+                        psi = (phi_max[n*N + i] - prim[n*N + i])/dphi
+                    else:
+                        psi = (phi_min[n*N + i] - prim[n*N + i])/dphi
+                else: # TESS limiter
+                    psi = fmax((prim[n*N + j] - prim[n*N + i])/dphi, 0.0)
+
+                alpha[n] = fmin(alpha[n], psi)
+
+        # store the limited gradients
+        for n in range(num_fields):
+            for k in range(dim):
+                grad[(n*dim + k)*N + i] *= alpha[n]
+
+cdef bint extrapolate_state(int i, int m, int N, int num_fields, int dim,
+        bint boost, double fac, int density_index, int pressure_index,
+        int* field_axis, np.float64_t** x, np.float64_t** dcx,
+        np.float64_t** fij, np.float64_t** wx, np.float64_t* prim,
+        np.float64_t* grad, np.float64_t* bulk, np.float64_t* q) nogil:
+    """
+    MUSCL-Hancock extrapolation of particle i to the center of mass of
+    face m, half a time step forward (eq. 36-37 of Springel 2010), the
+    state is stored in q in primitive order. The pressure source uses
+    the bulk modulus of the particle, gamma*p for an ideal gas. If
+    density or pressure are not positive the constant state is used
+    and False is returned.
+    """
+    cdef int k, n, a
+    cdef double rho, div, val
+    cdef double vel[3], sep[3]
+
+    rho = prim[density_index*N + i]
+
+    div = 0.0
+    for k in range(dim):
+
+        # velocity in frame of the face
+        vel[k] = prim[field_axis[num_fields + k]*N + i]
+        if boost:
+            vel[k] -= wx[k][m]
+
+        # distance from particle center of mass to face
+        sep[k] = fij[k][m] - (x[k][i] + dcx[k][i])
+
+        # trace of velocity gradient is the divergence
+        div += grad[(field_axis[num_fields + k]*dim + k)*N + i]
+
+    for n in range(num_fields):
+
+        # spatial and advective time extrapolation
+        val = prim[n*N + i]
+        for k in range(dim):
+            val += grad[(n*dim + k)*N + i]*(sep[k] - fac*vel[k])
+
+        # source terms of primitive equations
+        a = field_axis[n]
+        if n == density_index:
+            val -= fac*rho*div
+        elif n == pressure_index:
+            val -= fac*bulk[i]*div
+        elif a >= 0:
+            val -= fac*grad[(pressure_index*dim + a)*N + i]/rho
+            if boost:
+                val -= wx[a][m]
+
+        q[n] = val
+
+    if q[density_index] > 0.0 and q[pressure_index] > 0.0:
+        return True
+
+    # revert to piecewise constant
+    for n in range(num_fields):
+        q[n] = prim[n*N + i]
+        a = field_axis[n]
+        if a >= 0 and boost:
+            q[n] -= wx[a][m]
+    return False
+
+cdef class PieceWiseLinear(ReconstructionBase):
+    """
+    Linear reconstruction with slope limited gradients and MUSCL-Hancock
+    time extrapolation, taken from Springel (2010).
+
+    Attributes
+    ----------
+    param_limiter : int
+        Slope limiter, 0 for AREPO, 1 for TESS and 2 for unlimited
+        gradients.
+
+    param_scatter_gradients : bool
+        If True gradients are accumulated in a single loop over faces,
+        otherwise by looping over the faces of each particle.
+
+    num_first_order : int
+        Number of face states that were not positive after extrapolation
+        in the last call and reverted to piecewise constant.
+
+    """
+    def __init__(self, int param_limiter=0, bint param_scatter_gradients=True):
+        super(PieceWiseLinear, self).__init__()
+
+        if param_limiter not in [0, 1, 2]:
+            raise RuntimeError("Reconstruction: unknown limiter %d" % param_limiter)
+        self.param_limiter = param_limiter
+        self.param_scatter_gradients = param_scatter_gradients
+
+        self.prim = DoubleArray()
+        self.grad = DoubleArray()
+        self.bulk = DoubleArray()
+
+        self.field_axis = NULL
+        self.phi_max = DoubleArray()
+        self.phi_min = DoubleArray()
+        self.alpha = NULL
+        self.left_ptr = NULL
+        self.right_ptr = NULL
+        self.q = NULL
+
+    def __dealloc__(self):
+        """Release pointers"""
+        stdlib.free(self.field_axis)
+        stdlib.free(self.alpha)
+        stdlib.free(self.left_ptr)
+        stdlib.free(self.right_ptr)
+        stdlib.free(self.q)
+
+    def initialize(self):
+        """Setup initial arrays and routines for computation"""
+        cdef int n, k, dim
+        cdef list fields, velocity
+
+        if not self.registered_fields:
+            raise RuntimeError(
+                    "Reconstruction did not set fields to reconstruct!")
+
+        if not self.equation_state:
+            raise RuntimeError(
+                    "Reconstruction did not set equation of state!")
+
+        # initialize left/right face states for riemann solver
+        self.left_states  = CarrayContainer(var_dict=self.reconstruct_fields)
+        self.right_states = CarrayContainer(var_dict=self.reconstruct_fields)
+
+        # add groups
+        self.left_states.named_groups  = self.reconstruct_field_groups
+        self.right_states.named_groups = self.reconstruct_field_groups
+
+        # states are resized every step, keep memory across steps
+        self.left_states.set_capacity_policy()
+        self.right_states.set_capacity_policy()
+
+        fields = self.reconstruct_field_groups["primitive"]
+        velocity = self.reconstruct_field_groups["velocity"]
+        dim = len(velocity)
+
+        self.num_fields = len(fields)
+        self.density_index = fields.index("density")
+        self.pressure_index = fields.index("pressure")
+
+        # velocity axis of each field, followed by field index of each
+        # velocity component
+        self.field_axis = <int*> stdlib.malloc((self.num_fields + dim)*sizeof(int))
+        for n in range(self.num_fields):
+            self.field_axis[n] = -1
+        for k in range(dim):
+            n = fields.index(velocity[k])
+            self.field_axis[n] = k
+            self.field_axis[self.num_fields + k] = n
+
+        # scratch space for limiter
+        self.alpha = <np.float64_t*> stdlib.malloc(self.num_fields*sizeof(np.float64_t))
+
+        # left/right state pointers in primitive order
+        self.left_ptr  = <np.float64_t**> stdlib.malloc(self.num_fields*sizeof(void*))
+        self.right_ptr = <np.float64_t**> stdlib.malloc(self.num_fields*sizeof(void*))
+        self.q = <np.float64_t*> stdlib.malloc(self.num_fields*sizeof(np.float64_t))
+
+    def get_gradients(self):
+        """
+        Return gradients as numpy array of shape (num_fields, dim, N)
+        in primitive field order.
+        """
+        cdef int dim = len(self.reconstruct_field_groups["velocity"])
+        return self.grad.get_npy_array().reshape(self.num_fields, dim, -1)
+
+    cpdef compute_gradients(self, CarrayContainer particles, Mesh mesh,
+            DomainManager domain_manager):
+        """
+        Compute limited gradients of every primitive field for real
+        particles, followed by one limiter pass over the face adjacency
+        of the mesh unless gradients are unlimited. Ghost particles take
+        the gradients of their image.
+        """
+        cdef IntArray tags = particles.get_carray("tag")
+        cdef DoubleArray vol = particles.get_carray("volume")
+        cdef DoubleArray area = mesh.faces.get_carray("area")
+        cdef LongArray pair_i = mesh.faces.get_carray("pair-i")
+        cdef LongArray pair_j = mesh.faces.get_carray("pair-j")
+
+        cdef int n, dim
+        cdef int N = particles.get_number_of_items()
+        cdef int num_faces = mesh.faces.get_number_of_items()
+        cdef int num_fields = self.num_fields, limiter = self.param_limiter
+        cdef np.float64_t *x[3], *dcx[3], *fij[3]
+        cdef np.float64_t *prim, *grad, *phi_max, *phi_min
+
+        cdef np.int32_t* face_start = mesh.face_start.get_data_ptr()
+        cdef np.int32_t* face_ids = mesh.face_ids.get_data_ptr()
+        cdef np.int32_t* face_neighbors = mesh.face_neighbors.get_data_ptr()
+
+        dim = len(particles.named_groups["position"])
+        particles.pointer_groups(x, particles.named_groups["position"])
+        particles.pointer_groups(dcx, particles.named_groups["dcom"])
+        mesh.faces.pointer_groups(fij, mesh.faces.named_groups["com"])
+
+        if mesh.face_start.length != N + 1:
+            raise RuntimeError("Reconstruction: face adjacency out of date")
+
+        # copy primitive fields into contiguous block
+        self.prim.resize(num_fields*N)
+        self.grad.resize(num_fields*dim*N)
+        self.phi_max.resize(num_fields*N)
+        self.phi_min.resize(num_fields*N)
+        for n, field in enumerate(self.reconstruct_field_groups["primitive"]):
+            particles.get_carray(field).paste_block(n*N, self.prim)
+
+        prim = self.prim.get_data_ptr()
+        grad = self.grad.get_data_ptr()
+        phi_max = self.phi_max.get_data_ptr()
+        phi_min = self.phi_min.get_data_ptr()
+
+        with nogil:
+            if self.param_scatter_gradients:
+                scatter_gradients(N, num_faces, num_fields, dim, tags.data,
+                        x, vol.data, area.data, fij, pair_i.data, pair_j.data,
+                        prim, grad, phi_max, phi_min)
+            else:
+                gather_gradients(N, num_fields, dim, tags.data, x, vol.data,
+                        area.data, fij, face_start, face_ids, face_neighbors,
+                        prim, grad, phi_max, phi_min)
+
+            if limiter != 2:
+                limit_gradients(N, num_fields, dim, limiter, tags.data, x, dcx,
+                        fij, face_start, face_ids, face_neighbors, prim, grad,
+                        phi_max, phi_min, self.alpha)
+
+        self.gradients_to_ghost(particles, domain_manager)
+
+    def gradients_to_ghost(self, CarrayContainer particles,
+            DomainManager domain_manager):
+        """
+        Copy gradients from image particles to ghost particles. For
+        reflective boundaries the derivatives normal to the reflecting
+        wall change sign, as does each velocity component normal to it.
+        """
+        cdef int n, k, m, dim
+        cdef np.ndarray ghosts, maps, grad, sign
+
+        ghosts = np.where(particles["type"] == ParticleTAGS.Exterior)[0]
+        if ghosts.size == 0:
+            return
+
+        maps = particles["map"][ghosts]
+        dim = len(particles.named_groups["position"])
+        grad = self.get_gradients()
+
+        # -1 along axes where ghost is mirrored of image
+        sign = np.ones((dim, ghosts.size))
+        if isinstance(domain_manager.boundary_condition, Reflective):
+            for k, axis in enumerate(particles.named_groups["position"]):
+                sign[k] = np.where(particles[axis][ghosts] !=
+                        particles[axis][maps], -1.0, 1.0)
+
+        for n in range(self.num_fields):
+            m = self.field_axis[n]
+            for k in range(dim):
+                if m >= 0:
+                    grad[n, k, ghosts] = grad[n, k, maps]*sign[k]*sign[m]
+                else:
+                    grad[n, k, ghosts] = grad[n, k, maps]*sign[k]
+
+    cdef compute_bulk_modulus(self, CarrayContainer particles):
+        """
+        Density times sound speed squared of each particle from the
+        equation of state, the pressure source of the MUSCL-Hancock
+        prediction.
+        """
+        cdef DoubleArray d = particles.get_carray("density")
+        cdef DoubleArray p = particles.get_carray("pressure")
+
+        cdef int i
+        cdef int N = particles.get_number_of_items()
+        cdef np.float64_t* bulk
+
+        self.bulk.resize(N)
+        bulk = self.bulk.get_data_ptr()
+
+        with nogil:
+            self.equation_state.energy_array(d.data, p.data, bulk, N, 0)
+            self.equation_state.sound_speed_array(d.data, bulk, bulk, N, 0)
+            for i in range(N):
+                bulk[i] = d.data[i]*bulk[i]*bulk[i]
+
+    cpdef compute_states(self, CarrayContainer particles, Mesh mesh,
+            bint boost, DomainManager domain_manager, double dt):
+        """
+        Compute linear reconstruction to the left and right side of each
+        face extrapolated half a time step (MUSCL-Hancock).
+        """
+        cdef LongArray pair_i = mesh.faces.get_carray("pair-i")
+        cdef LongArray pair_j = mesh.faces.get_carray("pair-j")
+
+        cdef int i, j, m, n, dim, num_first_order = 0
+        cdef int N = particles.get_number_of_items()
+        cdef int num_faces = mesh.faces.get_number_of_items()
+        cdef int num_fields = self.num_fields
+        cdef double fac = 0.5*dt
+        cdef np.float64_t *x[3], *dcx[3], *fij[3], *wx[3]
+        cdef np.float64_t *prim, *grad, *bulk
+        cdef np.float64_t **ql = self.left_ptr, **qr = self.right_ptr
+        cdef np.float64_t *q = self.q
+        cdef int *field_axis = self.field_axis
+        cdef int density_index = self.density_index
+        cdef int pressure_index = self.pressure_index
+
+        # allocate space and compute gradients
+        self.compute_gradients(particles, mesh, domain_manager)
+        self.compute_bulk_modulus(particles)
+        prim = self.prim.get_data_ptr()
+        grad = self.grad.get_data_ptr()
+        bulk = self.bulk.get_data_ptr()
+
+        dim = len(particles.named_groups["position"])
+        particles.pointer_groups(x, particles.named_groups["position"])
+        particles.pointer_groups(dcx, particles.named_groups["dcom"])
+        mesh.faces.pointer_groups(fij, mesh.faces.named_groups["com"])
+        mesh.faces.pointer_groups(wx, mesh.faces.named_groups["velocity"])
+
+        # resize left/right states to hold each face
+        self.left_states.resize(num_faces)
+        self.right_states.resize(num_faces)
+
+        self.left_states.pointer_groups(ql, self.reconstruct_field_groups["primitive"])
+        self.right_states.pointer_groups(qr, self.reconstruct_field_groups["primitive"])
+
+        with nogil:
+            for m in range(num_faces):
+
+                i = pair_i.data[m]
+                j = pair_j.data[m]
+
+                if not extrapolate_state(i, m, N, num_fields, dim, boost, fac,
+                        density_index, pressure_index, field_axis,
+                        x, dcx, fij, wx, prim, grad, bulk, q):
+                    num_first_order += 1
+                for n in range(num_fields):
+                    ql[n][m] = q[n]
+
+                if not extrapolate_state(j, m, N, num_fields, dim, boost, fac,
+                        density_index, pressure_index, field_axis,
+                        x, dcx, fij, wx, prim, grad, bulk, q):
+                    num_first_order += 1
+                for n in range(num_fields):
+                    qr[n][m] = q[n]
+
+        self.num_first_order = num_first_order
+
+    cpdef begin_face_states(self, CarrayContainer particles, Mesh mesh,
+            bint boost, DomainManager domain_manager, double dt):
+        """Compute gradients and store pointers for face_states"""
+        self.compute_gradients(particles, mesh, domain_manager)
+        self.compute_bulk_modulus(particles)
+        self.num_first_order = 0
+
+        self.face_boost = boost
+        self.face_fac = 0.5*dt
+        self.face_N = particles.get_number_of_items()
+        self.face_dim = len(particles.named_groups["position"])
+
+        particles.pointer_groups(self.face_x, particles.named_groups["position"])
+        particles.pointer_groups(self.face_dcx, particles.named_groups["dcom"])
+        mesh.faces.pointer_groups(self.face_fij, mesh.faces.named_groups["com"])
+        mesh.faces.pointer_groups(self.face_wx, mesh.faces.named_groups["velocity"])
+
+    cdef int face_states(self, int m, int i, int j,
+            np.float64_t* ql, np.float64_t* qr) nogil:
+        """MUSCL-Hancock states of face m, see compute_states"""
+        cdef int reverted = 0
+
+        if not extrapolate_state(i, m, self.face_N, self.num_fields,
+                self.face_dim, self.face_boost, self.face_fac,
+                self.density_index, self.pressure_index, self.field_axis,
+                self.face_x, self.face_dcx, self.face_fij, self.face_wx,
+                self.prim.data, self.grad.data, self.bulk.data, ql):
+            reverted += 1
+
+        if not extrapolate_state(j, m, self.face_N, self.num_fields,
+                self.face_dim, self.face_boost, self.face_fac,
+                self.density_index, self.pressure_index, self.field_axis,
+                self.face_x, self.face_dcx, self.face_fij, self.face_wx,
+                self.prim.data, self.grad.data, self.bulk.data, qr):
+            reverted += 1
+
+        return reverted
 
 
 # ---------------------------------- color fields functions ----------------------------------
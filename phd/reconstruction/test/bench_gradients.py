@@ -0,0 +1,73 @@
+"""
+Benchmark of the gradient computation of PieceWiseLinear, looping over
+the faces of each particle against a single loop over faces. Run
+directly:
+
+    python bench_gradients.py
+"""
+import timeit
+import numpy as np
+
+from phd.mesh.mesh import Mesh
+from phd.domain.domain_manager import DomainManager
+from phd.utils.particle_creator import HydroParticleCreator
+from phd.equation_state.equation_state import IdealGas
+from phd.reconstruction.reconstruction import PieceWiseLinear
+
+def cartesian_mesh(n):
+    """Create n by n unit cells with faces hard coded in the mesh."""
+    particles = HydroParticleCreator(num=n*n, dim=2)
+
+    mesh = Mesh()
+    mesh.register_fields(particles)
+    mesh.initialize()
+
+    x, y = np.meshgrid(np.arange(n) + 0.5, np.arange(n) + 0.5, indexing="ij")
+    particles["position-x"][:] = x.ravel()
+    particles["position-y"][:] = y.ravel()
+    particles["volume"][:] = 1.0
+    particles["tag"][:] = 0
+
+    # random fields so the limiter is active
+    for field in particles.named_groups["primitive"]:
+        particles[field][:] = 1.0 + np.random.rand(n*n)
+
+    # faces between neighbors along x and y
+    ids = np.arange(n*n).reshape(n, n)
+    pair_i = np.concatenate([ids[:-1, :].ravel(), ids[:, :-1].ravel()])
+    pair_j = np.concatenate([ids[1:, :].ravel(), ids[:, 1:].ravel()])
+
+    mesh.faces.resize(pair_i.size)
+    mesh.faces["pair-i"][:] = pair_i
+    mesh.faces["pair-j"][:] = pair_j
+    mesh.faces["area"][:] = 1.0
+    mesh.faces["com-x"][:] = 0.5*(particles["position-x"][pair_i] +\
+            particles["position-x"][pair_j])
+    mesh.faces["com-y"][:] = 0.5*(particles["position-y"][pair_i] +\
+            particles["position-y"][pair_j])
+    mesh.build_face_adjacency(n*n)
+
+    return particles, mesh
+
+def bench_gradients(n=512, repeat=5):
+    """Time gradient computation of both methods."""
+    particles, mesh = cartesian_mesh(n)
+    domain_manager = DomainManager(0.2)
+
+    results = {}
+    for scatter in [False, True]:
+        reconstruction = PieceWiseLinear(param_scatter_gradients=scatter)
+        reconstruction.set_fields_for_reconstruction(particles)
+        reconstruction.set_equation_state(IdealGas())
+        reconstruction.initialize()
+
+        def compute():
+            reconstruction.compute_gradients(particles, mesh, domain_manager)
+
+        results[scatter] = min(timeit.repeat(compute, number=1, repeat=repeat))
+    return results
+
+if __name__ == "__main__":
+    results = bench_gradients()
+    print("cell loop: %.2e s  face loop: %.2e s  speedup: %6.2fx" %\
+            (results[False], results[True], results[False]/results[True]))
@@ -2,10 +2,14 @@ import unittest
 import numpy as np
 
 from phd.mesh.mesh import Mesh
+from phd.domain.domain import DomainLimits
+from phd.domain.boundary import Reflective
 from phd.domain.domain_manager import DomainManager
 from phd.containers.containers import CarrayContainer
+from phd.utils.particle_tags import ParticleTAGS
 from phd.utils.particle_creator import HydroParticleCreator
-from phd.reconstruction.reconstruction import PieceWiseConstant
+from phd.equation_state.equation_state import IdealGas
+from phd.reconstruction.reconstruction import PieceWiseConstant, PieceWiseLinear
 
 from phd.riemann.riemann import RiemannBase
 
@@ -110,7 +114,6 @@ class TestPieceWiseConstantComputeStates(unittest.TestCase):
         # construct left/right faces
         self.reconstruction.compute_states(self.particles, mesh, False,
                 domain_manager, dt=1.0)
-        self.assertTrue(True)
 
         # left and right states should be the same
         for field in self.reconstruction.left_states.properties.keys():
@@ -119,6 +122,148 @@ class TestPieceWiseConstantComputeStates(unittest.TestCase):
             self.assertAlmostEqual(self.reconstruction.right_states[field][0],
                     self.particles[field][1])
 
+class TestPieceWiseLinearComputeStates(unittest.TestCase):
+    def setUp(self):
+
+        # create 2 particles with constant values
+        self.particles = HydroParticleCreator(num=2, dim=2)
+        for field in self.particles.named_groups["primitive"]:
+            self.particles[field][:] = 1.0
+
+        # reconstruction class
+        self.reconstruction = PieceWiseLinear()
+        self.reconstruction.set_fields_for_reconstruction(
+                self.particles)
+
+    def test_initialize_errors(self):
+        # equation of state not set
+        self.assertRaises(RuntimeError, self.reconstruction.initialize)
+
+        # unknown limiter
+        self.assertRaises(RuntimeError, PieceWiseLinear, 3)
+
+    def test_compute_states(self):
+        """Test linear field is recovered exactly on a lattice."""
+        n = 8
+        a = np.array([0.5, -0.25])
+        particles = HydroParticleCreator(num=n*n, dim=2)
+
+        # lattice of unit box, interior cells only have real neighbors
+        x, y = np.meshgrid((np.arange(n) + 0.5)/n, (np.arange(n) + 0.5)/n,
+                indexing="ij")
+        particles["position-x"][:] = x.ravel()
+        particles["position-y"][:] = y.ravel()
+
+        # linear density, other fields constant
+        for field in particles.named_groups["primitive"]:
+            particles[field][:] = 1.0
+        particles["velocity-x"][:] = 0.0
+        particles["velocity-y"][:] = 0.0
+        particles["density"][:] = 1.0 + a[0]*particles["position-x"] +\
+                a[1]*particles["position-y"]
+
+        domain_manager = DomainManager(param_initial_radius=0.1,
+                param_search_radius_factor=1.25)
+        domain_manager.set_domain_limits(DomainLimits(np.zeros(2), np.ones(2)))
+        domain_manager.register_fields(particles)
+        domain_manager.set_boundary_condition(Reflective())
+        domain_manager.initialize()
+
+        mesh = Mesh()
+        mesh.register_fields(particles)
+        mesh.initialize()
+        mesh.build_geometry(particles, domain_manager)
+
+        tags = particles["tag"]
+        interior = (tags == ParticleTAGS.Real) &\
+                (np.abs(particles["position-x"] - 0.5) < 0.5 - 1./n) &\
+                (np.abs(particles["position-y"] - 0.5) < 0.5 - 1./n)
+        self.assertEqual(np.sum(interior), (n - 2)**2)
+
+        pair_i = mesh.faces["pair-i"]
+        pair_j = mesh.faces["pair-j"]
+        faces = interior[pair_i] & interior[pair_j]
+        self.assertTrue(np.sum(faces) > 0)
+
+        com = np.array([mesh.faces["com-x"], mesh.faces["com-y"]])
+        pos = np.array([particles["position-x"] + particles["dcom-x"],
+            particles["position-y"] + particles["dcom-y"]])
+
+        # AREPO, TESS and no limiter
+        for limiter in [0, 1, 2]:
+            reconstruction = PieceWiseLinear(param_limiter=limiter)
+            reconstruction.set_fields_for_reconstruction(particles)
+            reconstruction.set_equation_state(IdealGas())
+            reconstruction.initialize()
+            reconstruction.compute_states(particles, mesh, False,
+                    domain_manager, dt=0.0)
+            self.assertEqual(reconstruction.num_first_order, 0)
+
+            # exact gradient of interior cells
+            fields = reconstruction.reconstruct_field_groups["primitive"]
+            grad = reconstruction.get_gradients()
+            for m, field in enumerate(fields):
+                ans = a if field == "density" else np.zeros(2)
+                for k in range(2):
+                    self.assertTrue(np.allclose(grad[m, k, interior], ans[k]))
+
+            # face values extrapolated from center of mass
+            for states, ids in [(reconstruction.left_states, pair_i),
+                    (reconstruction.right_states, pair_j)]:
+                ans = particles["density"][ids] +\
+                        a[0]*(com[0] - pos[0][ids]) + a[1]*(com[1] - pos[1][ids])
+                self.assertTrue(np.allclose(states["density"][faces], ans[faces]))
+                self.assertTrue(np.allclose(states["pressure"][faces], 1.0))
+
+    def test_scatter_gradients(self):
+        """Test loop over faces gives same gradients as loop over particles."""
+        domain_manager = DomainManager(0.2)
+
+        # two real cells with different density and two ghosts that are
+        # not exterior, ghosts keep no gradients from earlier calls
+        particles = HydroParticleCreator(num=4, dim=2)
+        for field in particles.named_groups["primitive"]:
+            particles[field][:] = 1.0
+        particles["position-x"][:] = [0.5, 1.5, 2.5, 0.5]
+        particles["position-y"][:] = [0.5, 0.6, 0.5, 1.5]
+        particles["density"][:] = [1.0, 2.0, 3.0, 1.5]
+        particles["volume"][:] = [1.0, 0.5, 1.0, 1.0]
+        particles["tag"][:] = ParticleTAGS.Real
+        particles["type"][:] = ParticleTAGS.Interior
+
+        mesh = Mesh()
+        mesh.register_fields(particles)
+        mesh.initialize()
+
+        mesh.faces.resize(3)
+        mesh.faces["pair-i"][:] = [0, 1, 0]
+        mesh.faces["pair-j"][:] = [1, 2, 3]
+        mesh.faces["area"][:] = 1.0
+        mesh.faces["com-x"][:] = [1.0, 2.0, 0.5]
+        mesh.faces["com-y"][:] = [0.5, 0.5, 1.0]
+        mesh.build_face_adjacency(4)
+
+        # unlimited, cells with one neighbor are clamped to zero otherwise
+        gradients = []
+        for scatter in [False, True]:
+            reconstruction = PieceWiseLinear(param_limiter=2,
+                    param_scatter_gradients=scatter)
+            reconstruction.set_fields_for_reconstruction(particles)
+            reconstruction.set_equation_state(IdealGas())
+            reconstruction.initialize()
+
+            particles["tag"][2:] = ParticleTAGS.Real
+            reconstruction.compute_gradients(particles, mesh, domain_manager)
+            self.assertTrue(np.any(reconstruction.get_gradients()[:, :, 2:] != 0.))
+
+            particles["tag"][2:] = ParticleTAGS.Ghost
+            reconstruction.compute_gradients(particles, mesh, domain_manager)
+            gradients.append(reconstruction.get_gradients().copy())
+
+        self.assertTrue(np.any(gradients[0][:, :, :2] != 0.))
+        self.assertTrue(np.all(gradients[0][:, :, 2:] == 0.))
+        self.assertTrue(np.allclose(gradients[0], gradients[1]))
+
 if __name__ == "__main__":
     unittest.main()
 
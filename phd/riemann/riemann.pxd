@@ -1,53 +1,94 @@
+cimport numpy as np
+
+from ..utils.carray cimport DoubleArray, IntArray, LongArray
+
 from ..mesh.mesh cimport Mesh
+from ..domain.domain_manager cimport DomainManager
 from ..containers.containers cimport CarrayContainer
 from ..equation_state.equation_state cimport EquationStateBase
 from ..reconstruction.reconstruction cimport ReconstructionBase
 
+# left/right states, geometry and fluxes of all faces
+cdef struct FaceStates:
+    np.float64_t *dl
+    np.float64_t *pl
+    np.float64_t *dr
+    np.float64_t *pr
+    np.float64_t *vl[3]
+    np.float64_t *vr[3]
+    np.float64_t *cl        # sound speed and specific internal
+    np.float64_t *cr        # energy from equation of state
+    np.float64_t *el
+    np.float64_t *er
+    np.float64_t *nx[3]
+    np.float64_t *wx[3]
+    np.float64_t *fm
+    np.float64_t *fe
+    np.float64_t *fmv[3]
 
 cdef class RiemannBase:
 
     cdef public bint param_boost
     cdef public double param_cfl
+    cdef public int param_num_threads
 
     cdef public registered_fields
     cdef public dict flux_fields
     cdef public dict flux_field_groups
     cdef public CarrayContainer fluxes
+    cdef bint has_face_flux
+    cdef bint needs_gamma               # solver assumes an ideal gas
+    cdef DoubleArray face_thermo        # sound speed and energy of face states
 
     cpdef compute_fluxes(self, CarrayContainer particles, Mesh mesh, ReconstructionBase reconstruction,
             EquationStateBase eos)
 
-    cdef riemann_solver(self, Mesh mesh, ReconstructionBase reconstruction, double gamma, int dim)
+    cdef double eos_gamma(self, EquationStateBase eos) except? -1
+    cdef riemann_solver(self, Mesh mesh, ReconstructionBase reconstruction,
+            EquationStateBase eos, double gamma, int dim)
+    cdef load_face_states(self, FaceStates* fs, Mesh mesh, ReconstructionBase reconstruction,
+            EquationStateBase eos)
+    cdef void solve_faces(self, FaceStates* fs, int start, int end,
+            double gamma, int dim, bint boost) nogil
 
-    cpdef double compute_time_step(self, CarrayContainer particles, EquationStateBase eos)
+    cdef void face_flux(self, double* ql, double* qr, double* th, double* n,
+            double wn, double gamma, int dim, double* f) nogil
 
-    cdef deboost(self, CarrayContainer fluxes, CarrayContainer faces, int dim)
+    cpdef fused_update(self, CarrayContainer particles, Mesh mesh,
+            ReconstructionBase reconstruction, EquationStateBase eos,
+            DomainManager domain_manager, bint boost, double dt)
+
+    cpdef double compute_time_step(self, CarrayContainer particles, EquationStateBase eos)
 
 cdef class HLL(RiemannBase):
 
-    cdef inline void get_waves(self, double dl, double ul, double pl,
-            double dr, double ur, double pr,
-            double gamma, double *sl, double *sc, double *sr)
+    cdef inline void get_waves(self, double dl, double ul, double pl, double cl,
+            double dr, double ur, double pr, double cr,
+            double *sl, double *sc, double *sr) nogil
 
 cdef class HLLC(HLL):
     pass
-#
-#cdef class Exact(RiemannBase):
-#
-#    cdef inline double p_guess(self, double dl, double ul, double pl, double cl,
-#            double dr, double ur, double pr, double cr, double gamma) nogil
-#
-#    cdef inline double p_func(self, double d, double u, double p,
-#            double c, double gamma, double p_old) nogil
-#
-#    cdef inline double p_func_deriv(self, double d, double u, double p,
-#            double c, double gamma, double p_old) nogil
-#
-#    cdef inline double get_pstar(self, double dl, double ul, double pl, double cl,
-#            double dr, double ur, double pr, double cr, double gamma) nogil
-#
-#    cdef inline void vacuum(self,
-#            double dl, double vl[3], double pl, double vnl, double cl,
-#            double dr, double vr[3], double pr, double vnr, double cr,
-#            double *d, double  v[3], double *p, double *vn, double *vsq,
-#            double gamma, double n[3], int dim) nogil
+
+cdef class Exact(RiemannBase):
+
+    cdef public int num_unconverged
+    cdef public int max_iterations
+
+cdef class Adaptive(RiemannBase):
+
+    cdef public double param_smooth_jump
+    cdef public double param_strong_jump
+
+    cdef public HLL hll
+    cdef public HLLC hllc
+    cdef public Exact exact
+
+    cdef public IntArray face_class
+    cdef LongArray face_order
+    cdef DoubleArray batch
+
+    cdef long num_class[3]
+    cdef double time_class[3]
+    cdef double time_classify
+
+    cdef void batch_states(self, FaceStates* bs, int num_faces, int dim)
@@ -1,23 +1,45 @@
+import time
 import numpy as np
 from collections import defaultdict
 
 cimport cython
+cimport openmp
 cimport numpy as np
-from libc.math cimport sqrt, pow, fmin, fmax, fabs
+from cython.parallel cimport parallel, prange
+cimport libc.stdlib as stdlib
+from libc.math cimport sqrt, pow, fmin, fmax, fabs, INFINITY
 
 from ..utils.particle_tags import ParticleTAGS
-from ..utils.carray cimport DoubleArray, IntArray
+from ..utils.carray cimport DoubleArray, IntArray, LongArray
+from ..reconstruction.reconstruction cimport PieceWiseLinear
 
 cdef int Real = ParticleTAGS.Real
 
+# number of faces solved by a thread at a time
+cdef enum:
+    FACE_BLOCK = 1024
+
+# number of cells reduced by a thread at a time
+cdef enum:
+    CELL_BLOCK = 4096
+
+# newton iteration of exact riemann solver
+cdef double EXACT_TOL = 1.0e-6
+cdef int EXACT_MAX_ITER = 1000
+
 cdef class RiemannBase:
     """
     Riemann base that all riemann solvers need to inherit.
     """
-    def __init__(self, double param_cfl=0.5, bint param_boost=True):
+    def __init__(self, double param_cfl=0.5, bint param_boost=True,
+            int param_num_threads=1):
         self.param_cfl = param_cfl
         self.param_boost = param_boost
+        self.param_num_threads = param_num_threads
         self.registered_fields = False
+        self.has_face_flux = False
+        self.needs_gamma = False
+        self.face_thermo = DoubleArray()
 
     def initialize(self):
         """
@@ -58,223 +80,412 @@ cdef class RiemannBase:
             EquationStateBase eos):
         """Compute fluxes for each face in the mesh"""
         cdef int dim = len(particles.named_groups['position'])
+        cdef double gamma = self.eos_gamma(eos)
 
         # resize to hold fluxes for each face in mesh
         self.fluxes.resize(mesh.faces.get_number_of_items())
-        self.riemann_solver(mesh, reconstruction, eos.get_gamma(), dim)
-
-    cdef riemann_solver(self, Mesh mesh, ReconstructionBase reconstruction, double gamma, int dim):
-        """Riemann solver"""
-        msg = "RiemannBase::riemann_solver called!"
-        raise NotImplementedError(msg)
+        self.riemann_solver(mesh, reconstruction, eos, gamma, dim)
 
-    cpdef double compute_time_step(self, CarrayContainer particles, EquationStateBase eos):
+    cdef double eos_gamma(self, EquationStateBase eos) except? -1:
         """
-        Compute time step for next integration step.
+        Adiabatic index passed to face_flux, zero if the equation of
+        state has none. Solvers built on the ideal gas relations refuse
+        other equations of state.
         """
-        cdef IntArray tags   = particles.get_carray("tag")
-        cdef DoubleArray vol = particles.get_carray("volume")
-
-        cdef DoubleArray d = particles.get_carray("density")
-        cdef DoubleArray p = particles.get_carray("pressure")
+        if eos.has_gamma():
+            return eos.get_gamma()
+        if self.needs_gamma:
+            raise RuntimeError("Riemann: %s needs an ideal gas equation of state" %\
+                    self.__class__.__name__)
+        return 0.
+
+    def get_num_threads(self):
+        """
+        Number of threads used by the solver, all available threads if
+        param_num_threads is not positive.
+        """
+        if self.param_num_threads > 0:
+            return self.param_num_threads
+        return openmp.omp_get_max_threads()
 
-        cdef int i, k, dim
-        cdef np.float64_t* v[3]
-        cdef double c, R, dt, vsq
+    cdef riemann_solver(self, Mesh mesh, ReconstructionBase reconstruction,
+            EquationStateBase eos, double gamma, int dim):
+        """
+        Solve the riemann problem of every face with face_flux. Faces are
+        split in blocks that are solved in parallel without the gil.
+        """
+        cdef FaceStates fs
+        cdef int c, num_blocks, num_threads
         cdef bint boost = self.param_boost
+        cdef int num_faces = mesh.faces.get_number_of_items()
 
-        dim = len(particles.named_groups['position'])
-        particles.pointer_groups(v, particles.named_groups['velocity'])
+        if not self.has_face_flux:
+            msg = "RiemannBase::riemann_solver called!"
+            raise NotImplementedError(msg)
 
-        # calculate first value for min
-        c = eos.sound_speed(d.data[0], p.data[0])
+        self.load_face_states(&fs, mesh, reconstruction, eos)
 
-        if dim == 2:
-            R = sqrt(vol.data[0]/np.pi)
-        elif dim == 3:
-            R = pow(3.0*vol.data[0]/(4.0*np.pi), 1.0/3.0)
+        num_threads = self.get_num_threads()
+        num_blocks = (num_faces + FACE_BLOCK - 1)/FACE_BLOCK
 
-        if boost:
-            dt = R/c
-        else:
-            vsq = 0.0
-            for k in range(dim):
-                vsq += v[k][0]*v[k][0]
-            dt = R/(c + sqrt(vsq))
+        with nogil, parallel(num_threads=num_threads):
+            for c in prange(num_blocks, schedule="dynamic"):
+                self.solve_faces(&fs, c*FACE_BLOCK,
+                        min((c + 1)*FACE_BLOCK, num_faces), gamma, dim, boost)
+
+    cdef load_face_states(self, FaceStates* fs, Mesh mesh, ReconstructionBase reconstruction,
+            EquationStateBase eos):
+        """
+        Point face states to the reconstructed states, face geometry and
+        flux arrays. Sound speed and specific internal energy of the
+        states are computed from the equation of state.
+        """
+        cdef int num_faces = mesh.faces.get_number_of_items()
 
-        for i in range(particles.get_number_of_items()):
-            if tags.data[i] == Real:
+        # left/right state primitive variables
+        fs.dl = (<DoubleArray> reconstruction.left_states.get_carray("density")).data
+        fs.pl = (<DoubleArray> reconstruction.left_states.get_carray("pressure")).data
+        fs.dr = (<DoubleArray> reconstruction.right_states.get_carray("density")).data
+        fs.pr = (<DoubleArray> reconstruction.right_states.get_carray("pressure")).data
 
-                # sound speed
-                c = eos.sound_speed(d.data[i], p.data[i])
+        reconstruction.left_states.pointer_groups(fs.vl,
+                reconstruction.left_states.named_groups['velocity'])
+        reconstruction.right_states.pointer_groups(fs.vr,
+                reconstruction.right_states.named_groups['velocity'])
 
-                # calculate approx radius of each voronoi cell
-                if dim == 2:
-                    R = sqrt(vol.data[i]/np.pi)
-                elif dim == 3:
-                    R = pow(3.0*vol.data[i]/(4.0*np.pi), 1.0/3.0)
+        # face states are not particles
+        self.face_thermo.resize(4*num_faces)
+        fs.cl = self.face_thermo.data
+        fs.cr = fs.cl + num_faces
+        fs.el = fs.cl + 2*num_faces
+        fs.er = fs.cl + 3*num_faces
+        with nogil:
+            eos.energy_array(fs.dl, fs.pl, fs.el, num_faces, -1)
+            eos.sound_speed_array(fs.dl, fs.el, fs.cl, num_faces, -1)
+            eos.energy_array(fs.dr, fs.pr, fs.er, num_faces, -1)
+            eos.sound_speed_array(fs.dr, fs.er, fs.cr, num_faces, -1)
+
+        # face mass, momentum and energy fluxes
+        fs.fm = (<DoubleArray> self.fluxes.get_carray("mass")).data
+        fs.fe = (<DoubleArray> self.fluxes.get_carray("energy")).data
+        self.fluxes.pointer_groups(fs.fmv, self.fluxes.named_groups['momentum'])
 
-                if boost:
-                    dt = fmin(R/c, dt)
-                else:
-                    vsq = 0.0
-                    for k in range(dim):
-                        vsq += v[k][i]*v[k][i]
-                    dt = fmin(R/(c + sqrt(vsq)), dt)
-        return self.param_cfl*dt
+        # face normal and velocity
+        mesh.faces.pointer_groups(fs.nx, mesh.faces.named_groups['normal'])
+        mesh.faces.pointer_groups(fs.wx, mesh.faces.named_groups['velocity'])
 
-    cdef deboost(self, CarrayContainer fluxes, CarrayContainer faces, int dim):
+    cdef void solve_faces(self, FaceStates* fs, int start, int end,
+            double gamma, int dim, bint boost) nogil:
         """
-        Deboost riemann solution of fluxes from face reference to lab frame.
+        Solve the riemann problem of faces start to end and store the
+        fluxes in the lab frame.
         """
-        cdef DoubleArray fm = fluxes.get_carray("mass")
-        cdef DoubleArray fe = fluxes.get_carray("energy")
+        cdef int i, k
+        cdef double wn
+        cdef double ql[5], qr[5], th[4], n[3], f[5]
 
-        cdef int m, k
-        cdef np.float64_t *fmv[3], *wx[3]
+        for i in range(start, end):
 
-        fluxes.pointer_groups(fmv, fluxes.named_groups['momentum'])
-        faces.pointer_groups(wx, faces.named_groups['velocity'])
+            # left/right state in primitive order
+            ql[0] = fs.dl[i]; ql[dim+1] = fs.pl[i]
+            qr[0] = fs.dr[i]; qr[dim+1] = fs.pr[i]
 
-        # return flux to lab frame (Pakmor 2011)
-        for m in range(faces.get_number_of_items()):
+            th[0] = fs.cl[i]; th[1] = fs.el[i]
+            th[2] = fs.cr[i]; th[3] = fs.er[i]
+
+            wn = 0.0
             for k in range(dim):
-                fe.data[m] += wx[k][m]*(0.5*wx[k][m]*fm.data[m] + fmv[k][m])
-                fmv[k][m]  += wx[k][m]*fm.data[m]
+                ql[1+k] = fs.vl[k][i]
+                qr[1+k] = fs.vr[k][i]
+                n[k] = fs.nx[k][i]
 
-cdef class HLL(RiemannBase):
-    def __init__(self, double param_cfl=0.5, bint param_boost=True):
-        super(HLL, self).__init__(param_cfl, param_boost)
+                # project face velocity to face normal
+                wn += fs.wx[k][i]*n[k]
 
-    def initialize(self):
-        if not self.registered_fields:
-            raise RuntimeError("Riemann did not set fields for flux!")
+            # in face frame
+            if boost:
+                wn = 0.
 
-        self.fluxes = CarrayContainer(var_dict=self.flux_fields)
-        self.fluxes.named_groups = self.flux_field_groups
+            self.face_flux(ql, qr, th, n, wn, gamma, dim, f)
 
-    cdef riemann_solver(self, Mesh mesh, ReconstructionBase reconstruction, double gamma, int dim):
+            # return flux to lab frame (Pakmor 2011)
+            if boost:
+                for k in range(dim):
+                    f[dim+1] += fs.wx[k][i]*(0.5*fs.wx[k][i]*f[0] + f[1+k])
+                    f[1+k]   += fs.wx[k][i]*f[0]
 
-        # left state primitive variables
-        cdef DoubleArray dl = reconstruction.left_states.get_carray("density")
-        cdef DoubleArray pl = reconstruction.left_states.get_carray("pressure")
+            fs.fm[i] = f[0]
+            fs.fe[i] = f[dim+1]
+            for k in range(dim):
+                fs.fmv[k][i] = f[1+k]
 
-        # right state primitive variables
-        cdef DoubleArray dr = reconstruction.right_states.get_carray("density")
-        cdef DoubleArray pr = reconstruction.right_states.get_carray("pressure")
+    cdef void face_flux(self, double* ql, double* qr, double* th, double* n,
+            double wn, double gamma, int dim, double* f) nogil:
+        """
+        Flux of a single face. States are in primitive order (density,
+        velocity, pressure) and the flux in conservative order (mass,
+        momentum, energy). th holds sound speed and specific internal
+        energy of the left and right state from the equation of state,
+        gamma is only valid for solvers that set needs_gamma. Subclasses
+        that implement it set has_face_flux.
+        """
+        pass
 
-        # face mass and energy flux
-        cdef DoubleArray fm = self.fluxes.get_carray("mass")
-        cdef DoubleArray fe = self.fluxes.get_carray("energy")
+    cpdef fused_update(self, CarrayContainer particles, Mesh mesh,
+            ReconstructionBase reconstruction, EquationStateBase eos,
+            DomainManager domain_manager, bint boost, double dt):
+        """
+        Reconstruct, solve, deboost and update conservative variables
+        face by face in one loop. Gives the same result as
+        compute_states, compute_fluxes and update_from_fluxes without
+        storing face states and fluxes.
+        """
+        cdef IntArray tags = particles.get_carray("tag")
+        cdef DoubleArray m = particles.get_carray("mass")
+        cdef DoubleArray e = particles.get_carray("energy")
 
-        cdef int i, k
-        cdef double _dl, _pl
-        cdef double _dr, _pr
-        cdef double fac1, fac2, el, er
-        cdef double wn, Vnl, Vnr, sl, sr, s_contact
-        cdef double vl_tmp, vr_tmp, nx_tmp, vl_sq, vr_sq
-        cdef np.float64_t *vl[3], *vr[3], *fmv[3], *nx[3], *wx[3]
+        cdef DoubleArray area = mesh.faces.get_carray("area")
+        cdef LongArray pair_i = mesh.faces.get_carray("pair-i")
+        cdef LongArray pair_j = mesh.faces.get_carray("pair-j")
 
-        cdef bint boost = self.param_boost
+        cdef int i, j, k, fid, dim, num_first_order = 0
         cdef int num_faces = mesh.faces.get_number_of_items()
+        cdef int num_fields = len(reconstruction.reconstruct_field_groups["primitive"])
+        cdef double a, wn, gamma
+        cdef double n[3], th[4], f[5]
+        cdef np.float64_t *ql, *qr
+        cdef np.float64_t *mv[3], *nx[3], *wx[3]
 
-        # particle velocities left/right face
-        reconstruction.left_states.pointer_groups(vl,
-                reconstruction.left_states.named_groups['velocity'])
-        reconstruction.right_states.pointer_groups(vr,
-                reconstruction.right_states.named_groups['velocity'])
+        if not self.has_face_flux:
+            raise NotImplementedError("Riemann: %s has no face flux" %\
+                    self.__class__.__name__)
 
-        # face momentum fluxes
-        self.fluxes.pointer_groups(fmv, self.fluxes.named_groups['momentum'])
+        # face states are passed in primitive order
+        dim = len(particles.named_groups["position"])
+        if reconstruction.reconstruct_field_groups["primitive"][:dim+2] !=\
+                ["density"] + particles.named_groups["velocity"] + ["pressure"]:
+            raise RuntimeError("Riemann: primitive fields out of order")
 
-        # face normal and velocity
-        mesh.faces.pointer_groups(nx, mesh.faces.named_groups['normal'])
-        mesh.faces.pointer_groups(wx, mesh.faces.named_groups['velocity'])
+        gamma = self.eos_gamma(eos)
+        reconstruction.begin_face_states(particles, mesh, boost, domain_manager, dt)
 
-        # solve riemann for each face
-        for i in range(num_faces):
+        particles.pointer_groups(mv, particles.named_groups["momentum"])
+        mesh.faces.pointer_groups(nx, mesh.faces.named_groups["normal"])
+        mesh.faces.pointer_groups(wx, mesh.faces.named_groups["velocity"])
 
-            # left state
-            _dl = dl.data[i]
-            _pl = pl.data[i]
+        ql = <np.float64_t*> stdlib.malloc(2*num_fields*sizeof(np.float64_t))
+        qr = ql + num_fields
 
-            # right state
-            _dr = dr.data[i]
-            _pr = pr.data[i]
+        with nogil:
+            for fid in range(num_faces):
 
-            Vnl = Vnr = 0.0
-            vl_sq = vr_sq = wn = 0.0
-            for k in range(dim):
+                i = pair_i.data[fid]
+                j = pair_j.data[fid]
 
-                vl_tmp = vl[k][i]; vr_tmp = vr[k][i]
-                nx_tmp = nx[k][i]
+                num_first_order += reconstruction.face_states(fid, i, j, ql, qr)
 
-                # left/right velocity square
-                vl_sq += vl_tmp*vl_tmp
-                vr_sq += vr_tmp*vr_tmp
+                # face states are not particles
+                eos.energy_array(ql, ql + dim + 1, th + 1, 1, -1)
+                eos.sound_speed_array(ql, th + 1, th, 1, -1)
+                eos.energy_array(qr, qr + dim + 1, th + 3, 1, -1)
+                eos.sound_speed_array(qr, th + 3, th + 2, 1, -1)
 
-                # project left/righ velocity to face normal
-                Vnl += vl_tmp*nx_tmp
-                Vnr += vr_tmp*nx_tmp
+                wn = 0.0
+                for k in range(dim):
+                    n[k] = nx[k][fid]
+                    wn += wx[k][fid]*n[k]
 
-                # project face velocity to face normal
-                wn += wx[k][i]*nx_tmp
+                # in face frame
+                if boost:
+                    wn = 0.
 
-            # in face frame
-            if boost:
-                wn = 0.
+                self.face_flux(ql, qr, th, n, wn, gamma, dim, f)
 
-            self.get_waves(_dl, Vnl, _pl, _dr, Vnr, _pr, gamma,
-                    &sl, &s_contact, &sr)
+                # return flux to lab frame (Pakmor 2011)
+                if boost:
+                    for k in range(dim):
+                        f[dim+1] += wx[k][fid]*(0.5*wx[k][fid]*f[0] + f[1+k])
+                        f[1+k]   += wx[k][fid]*f[0]
 
-            # calculate interface flux - eq. 10.21
-            if(wn <= sl):
+                a = dt*area.data[fid]
 
-                # left state
-                fm.data[i]  = _dl*(Vnl - wn)
-                fe.data[i]  = (0.5*_dl*vl_sq + _pl/(gamma - 1.0))*(Vnl - wn) + _pl*Vnl
+                # flux entering cell defined by particle i
+                if tags.data[i] == Real:
+                    m.data[i] -= a*f[0]
+                    e.data[i] -= a*f[dim+1]
+                    for k in range(dim):
+                        mv[k][i] -= a*f[1+k]
 
-                for k in range(dim):
-                    fmv[k][i] = _dl*vl[k][i]*(Vnl - wn) + _pl*nx[k][i]
+                # flux leaving cell defined by particle j
+                if tags.data[j] == Real:
+                    m.data[j] += a*f[0]
+                    e.data[j] += a*f[dim+1]
+                    for k in range(dim):
+                        mv[k][j] += a*f[1+k]
 
-            elif((sl < wn) and (wn <= sr)):
+        stdlib.free(ql)
 
-                fac1 = sr - wn
-                fac2 = sl - wn
-                fac3 = sr - sl
+        if isinstance(reconstruction, PieceWiseLinear):
+            (<PieceWiseLinear> reconstruction).num_first_order = num_first_order
 
-                # eqs. 10.20 and 10.13
-                fm.data[i] = (_dl*Vnl*fac1 - _dr*Vnr*fac2 - sl*_dl*fac1 + sr*_dr*fac2)/fac3
+    cpdef double compute_time_step(self, CarrayContainer particles, EquationStateBase eos):
+        """
+        Compute time step for next integration step. Uses the sound speeds
+        and cell radii of the last primitive update if available, the
+        minimum over real particles is found in parallel blocks.
+        """
+        cdef IntArray tags = particles.get_carray("tag")
 
-                for k in range(dim):
-                    fmv[k][i] = ((_dl*vl[k][i]*Vnl + _pl*nx[k][i])*fac1 - (_dr*vr[k][i]*Vnr + _pr*nx[k][i])*fac2 \
-                            - sl*(_dl*vl[k][i])*fac1 + sr*(_dr*vr[k][i])*fac2)/fac3
+        cdef int c, dim, num_blocks, num_threads
+        cdef int num_particles = particles.get_number_of_items()
+        cdef np.float64_t* v[3]
+        cdef np.float64_t* block_dt
+        cdef double dt = INFINITY
+        cdef bint boost = self.param_boost
 
-                el = 0.5*_dl*vl_sq + _pl/(gamma - 1.0)
-                er = 0.5*_dr*vr_sq + _pr/(gamma - 1.0)
-                fe.data[i]  = ((el + _pl)*Vnl*fac1 - (er + _pr)*Vnr*fac2 - sl*el*fac1 + sr*er*fac2)/fac3
+        dim = len(particles.named_groups['position'])
+        particles.pointer_groups(v, particles.named_groups['velocity'])
 
-            else:
+        if not eos.signal_speeds_valid or\
+                eos.sound_speeds.length != num_particles:
+            eos.compute_signal_speeds(particles)
+
+        # cached values are only valid for one time step
+        eos.signal_speeds_valid = False
 
-                # right state
-                fm.data[i]  = _dr*(Vnr - wn)
-                fe.data[i]  = (0.5*_dr*vr_sq + _pr/(gamma - 1.0))*(Vnr - wn) + _pr*Vnr
+        num_threads = self.get_num_threads()
+        num_blocks = (num_particles + CELL_BLOCK - 1)/CELL_BLOCK
+        block_dt = <np.float64_t*> stdlib.malloc(max(num_blocks, 1)*sizeof(np.float64_t))
 
+        with nogil, parallel(num_threads=num_threads):
+            for c in prange(num_blocks, schedule="static"):
+                block_dt[c] = min_time_step(c*CELL_BLOCK,
+                        min((c + 1)*CELL_BLOCK, num_particles), tags.data,
+                        eos.sound_speeds.data, eos.cell_radius.data, v, dim, boost)
+
+        for c in range(num_blocks):
+            dt = fmin(dt, block_dt[c])
+        stdlib.free(block_dt)
+
+        return self.param_cfl*dt
+
+@cython.cdivision(True)
+cdef inline double min_time_step(int start, int end, np.int8_t* tags,
+        np.float64_t* cs, np.float64_t* R, np.float64_t** v, int dim, bint boost) nogil:
+    """Smallest signal crossing time of real particles start to end"""
+    cdef int i, k
+    cdef double vsq, dt = INFINITY
+
+    for i in range(start, end):
+        if tags[i] == Real:
+            if boost:
+                dt = fmin(R[i]/cs[i], dt)
+            else:
+                vsq = 0.0
                 for k in range(dim):
-                    fmv[k][i] = _dr*vr[k][i]*(Vnr - wn) + _pr*nx[k][i]
+                    vsq += v[k][i]*v[k][i]
+                dt = fmin(R[i]/(cs[i] + sqrt(vsq)), dt)
+    return dt
+
+cdef class HLL(RiemannBase):
+    def __init__(self, double param_cfl=0.5, bint param_boost=True,
+            int param_num_threads=1):
+        super(HLL, self).__init__(param_cfl, param_boost, param_num_threads)
+        self.has_face_flux = True
+
+    def initialize(self):
+        if not self.registered_fields:
+            raise RuntimeError("Riemann did not set fields for flux!")
+
+        self.fluxes = CarrayContainer(var_dict=self.flux_fields)
+        self.fluxes.named_groups = self.flux_field_groups
+
+        # fluxes are resized every step, keep memory across steps
+        self.fluxes.set_capacity_policy()
+
+    cdef void face_flux(self, double* ql, double* qr, double* th, double* n,
+            double wn, double gamma, int dim, double* f) nogil:
+        """
+        HLL flux of a single face, see RiemannBase.face_flux. Energies
+        and wave speeds come from the equation of state in th.
+        """
+        cdef int k
+        cdef double _dl, _pl
+        cdef double _dr, _pr
+        cdef double fac1, fac2, fac3, el, er
+        cdef double Vnl, Vnr, sl, sr, s_contact
+        cdef double vl_tmp, vr_tmp, vl_sq, vr_sq
+
+        # left state
+        _dl = ql[0]
+        _pl = ql[dim+1]
+
+        # right state
+        _dr = qr[0]
+        _pr = qr[dim+1]
+
+        Vnl = Vnr = 0.0
+        vl_sq = vr_sq = 0.0
+        for k in range(dim):
+
+            vl_tmp = ql[1+k]; vr_tmp = qr[1+k]
+
+            # left/right velocity square
+            vl_sq += vl_tmp*vl_tmp
+            vr_sq += vr_tmp*vr_tmp
+
+            # project left/righ velocity to face normal
+            Vnl += vl_tmp*n[k]
+            Vnr += vr_tmp*n[k]
+
+        self.get_waves(_dl, Vnl, _pl, th[0], _dr, Vnr, _pr, th[2],
+                &sl, &s_contact, &sr)
+
+        # calculate interface flux - eq. 10.21
+        if(wn <= sl):
+
+            # left state
+            f[0]     = _dl*(Vnl - wn)
+            f[dim+1] = (0.5*_dl*vl_sq + _dl*th[1])*(Vnl - wn) + _pl*Vnl
+
+            for k in range(dim):
+                f[1+k] = _dl*ql[1+k]*(Vnl - wn) + _pl*n[k]
+
+        elif((sl < wn) and (wn <= sr)):
 
-        if boost:
-            self.deboost(self.fluxes, mesh.faces, dim)
+            fac1 = sr - wn
+            fac2 = sl - wn
+            fac3 = sr - sl
 
-    cdef inline void get_waves(self, double dl, double ul, double pl,
-            double dr, double ur, double pr,
-            double gamma, double *sl, double *sc, double *sr):
+            # eqs. 10.20 and 10.13
+            f[0] = (_dl*Vnl*fac1 - _dr*Vnr*fac2 - sl*_dl*fac1 + sr*_dr*fac2)/fac3
+
+            for k in range(dim):
+                f[1+k] = ((_dl*ql[1+k]*Vnl + _pl*n[k])*fac1 - (_dr*qr[1+k]*Vnr + _pr*n[k])*fac2 \
+                        - sl*(_dl*ql[1+k])*fac1 + sr*(_dr*qr[1+k])*fac2)/fac3
+
+            el = 0.5*_dl*vl_sq + _dl*th[1]
+            er = 0.5*_dr*vr_sq + _dr*th[3]
+            f[dim+1] = ((el + _pl)*Vnl*fac1 - (er + _pr)*Vnr*fac2 - sl*el*fac1 + sr*er*fac2)/fac3
+
+        else:
+
+            # right state
+            f[0]     = _dr*(Vnr - wn)
+            f[dim+1] = (0.5*_dr*vr_sq + _dr*th[3])*(Vnr - wn) + _pr*Vnr
+
+            for k in range(dim):
+                f[1+k] = _dr*qr[1+k]*(Vnr - wn) + _pr*n[k]
+
+    cdef inline void get_waves(self, double dl, double ul, double pl, double cl,
+            double dr, double ur, double pr, double cr,
+            double *sl, double *sc, double *sr) nogil:
 
         cdef double p_star, u_star
         cdef double d_avg, c_avg
 
         cdef double _sl, _sr, _sc
-        cdef double cl, cr
+        cdef double gamma
 
         cdef double z, plr
         cdef double Q = 2.
@@ -284,9 +495,19 @@ cdef class HLL(RiemannBase):
         cdef double p_min
         cdef double p_max
         cdef double c_floor = 1.0E-10
+        cdef double p_floor = 1.0E-10
+        cdef double gamma_floor = 1.0E-6
+
+        cl = fmax(cl, c_floor)
+        cr = fmax(cr, c_floor)
+
+        # first order states can have zero pressure
+        pl = fmax(pl, p_floor)
+        pr = fmax(pr, p_floor)
 
-        cl = fmax(sqrt(gamma*pl/dl), c_floor)
-        cr = fmax(sqrt(gamma*pr/dr), c_floor)
+        # effective adiabatic index of the face for the star state
+        # estimates, constant gamma of an ideal gas
+        gamma = fmax((dl*cl*cl + dr*cr*cr)/(pl + pr), 1. + gamma_floor)
 
         d_avg = .5*(dl + dr)
         c_avg = .5*(cl + cr)
@@ -313,9 +534,10 @@ cdef class HLL(RiemannBase):
             u_star = (plr*ul/cl + ur/cr + 2.*(plr - 1.)/(gamma - 1.))/\
                     (plr/cl + 1./cr)
 
-            # estimate p* from two rarefaction aprroximation - eq. 9.36
-            p_star  = .5*pl*pow(1. + (gamma - 1.)*(ul - u_star)/(2.*cl), 1./z)
-            p_star += .5*pr*pow(1. + (gamma - 1.)*(u_star - ur)/(2.*cr), 1./z)
+            # estimate p* from two rarefaction aprroximation - eq. 9.36,
+            # zero if rarefactions generate vacuum
+            p_star  = .5*pl*pow(fmax(0., 1. + (gamma - 1.)*(ul - u_star)/(2.*cl)), 1./z)
+            p_star += .5*pr*pow(fmax(0., 1. + (gamma - 1.)*(u_star - ur)/(2.*cr)), 1./z)
 
         else:
 
@@ -362,688 +584,749 @@ cdef class HLL(RiemannBase):
 
 cdef class HLLC(HLL):
 
-    cdef riemann_solver(self, Mesh mesh, ReconstructionBase reconstruction, double gamma, int dim):
+    cdef void face_flux(self, double* ql, double* qr, double* th, double* n,
+            double wn, double gamma, int dim, double* f) nogil:
+        """
+        HLLC flux of a single face, see HLL.face_flux.
+        """
+        cdef int k
+        cdef double _dl, _pl, el
+        cdef double _dr, _pr, er
 
-        # left state primitive variables
-        cdef DoubleArray dl = reconstruction.left_states.get_carray("density")
-        cdef DoubleArray pl = reconstruction.left_states.get_carray("pressure")
+        cdef double factor_1, factor_2, frho
+        cdef double Vnl, Vnr, sl, sr, s_contact
+        cdef double vl_sq, vr_sq
 
-        # left state primitive variables
-        cdef DoubleArray dr = reconstruction.right_states.get_carray("density")
-        cdef DoubleArray pr = reconstruction.right_states.get_carray("pressure")
+        # left state
+        _dl = ql[0]
+        _pl = ql[dim+1]
 
-        cdef DoubleArray fm = self.fluxes.get_carray("mass")
-        cdef DoubleArray fe = self.fluxes.get_carray("energy")
+        # right state
+        _dr = qr[0]
+        _pr = qr[dim+1]
 
-        # local variables
-        cdef int i, k
+        Vnl = Vnr = 0.0
+        vl_sq = vr_sq = 0.0
+        for k in range(dim):
 
-        cdef double _dl, _pl, _vl[3], el, cl
-        cdef double _dr, _pr, _vr[3], er, cr
-        cdef double d, p, v[3], n[3], vn, vsq
+            # left/right velocity square
+            vl_sq += ql[1+k]*ql[1+k]
+            vr_sq += qr[1+k]*qr[1+k]
 
-        cdef double factor_1, factor_2, frho
-        cdef double wn, Vnl, Vnr, sl, sr, s_contact
-        cdef double vl_tmp, vr_tmp, nx_tmp, vl_sq, vr_sq
-        cdef np.float64_t *vl[3], *vr[3], *fmv[3], *nx[3], *wx[3]
+            # project left/righ velocity to face normal
+            Vnl += ql[1+k]*n[k]
+            Vnr += qr[1+k]*n[k]
 
-        cdef double fac1, fac2, fac3
+        self.get_waves(_dl, Vnl, _pl, th[0], _dr, Vnr, _pr, th[2],
+                &sl, &s_contact, &sr)
 
-        cdef int boost = self.param_boost
-        cdef int num_faces = mesh.faces.get_number_of_items()
+        # calculate interface flux - eq. 10.71
+        if(wn <= sl):
 
-        # particle velocities left/right face
-        reconstruction.left_states.pointer_groups(vl,
-                reconstruction.left_states.named_groups['velocity'])
-        reconstruction.right_states.pointer_groups(vr,
-                reconstruction.right_states.named_groups['velocity'])
+            # left state
+            f[0]     = _dl*(Vnl - wn)
+            f[dim+1] = (0.5*_dl*vl_sq + _dl*th[1])*(Vnl - wn) + _pl*Vnl
+
+            for k in range(dim):
+                f[1+k] = _dl*ql[1+k]*(Vnl - wn) + _pl*n[k]
 
-        # face momentum fluxes
-        self.fluxes.pointer_groups(fmv, self.fluxes.named_groups['momentum'])
+        elif((sl < wn) and (wn <= sr)):
 
-        # face normal and velocity
-        mesh.faces.pointer_groups(nx, mesh.faces.named_groups['normal'])
-        mesh.faces.pointer_groups(wx, mesh.faces.named_groups['velocity'])
+            # intermediate state
+            if(wn <= s_contact):
 
-        for i in range(num_faces):
+                # left star state - eq. 10.38 and 10.39
+                factor_1 = _dl*(sl - Vnl)/(sl - s_contact)
+                factor_2 = factor_1*(sl - wn)*(s_contact - Vnl) + _pl
+                frho = _dl*(Vnl - sl) + factor_1*(sl - wn)
 
-            # left state
-            _dl = dl.data[i]
-            _pl = pl.data[i]
+                # total energy
+                el = 0.5*_dl*vl_sq + _dl*th[1]
 
-            # right state
-            _dr = dr.data[i]
-            _pr = pr.data[i]
+                f[0] = frho
+                f[dim+1] = (el + _pl)*Vnl - sl*el +\
+                        (sl - wn)*factor_1*(el/_dl + (s_contact - Vnl)*\
+                        (s_contact + _pl/(_dl*(sl - Vnl))))
 
-            cl = sqrt(gamma*_pl/_dl)
-            cr = sqrt(gamma*_pr/_dr)
+                for k in range(dim):
+                    f[1+k] = frho*ql[1+k] + factor_2*n[k]
+
+            else:
+
+                # right star state
+                factor_1 = _dr*(sr - Vnr)/(sr - s_contact)
+                factor_2 = factor_1*(sr - wn)*(s_contact - Vnr) + _pr
+                frho = _dr*(Vnr - sr) + factor_1*(sr - wn)
+
+                # total energy
+                er = 0.5*_dr*vr_sq + _dr*th[3]
+
+                f[0] = frho
+                f[dim+1] = (er + _pr)*Vnr - sr*er +\
+                        (sr - wn)*factor_1*(er/_dr + (s_contact - Vnr)*\
+                        (s_contact + _pr/(_dr*(sr - Vnr))))
+
+                for k in range(dim):
+                    f[1+k] = frho*qr[1+k] + factor_2*n[k]
+
+        else:
+
+            # right state
+            f[0]     = _dr*(Vnr - wn)
+            f[dim+1] = (0.5*_dr*vr_sq + _dr*th[3])*(Vnr - wn) + _pr*Vnr
 
-            Vnl = Vnr = 0.0
-            vl_sq = vr_sq = wn = 0.0
             for k in range(dim):
+                f[1+k] = _dr*qr[1+k]*(Vnr - wn) + _pr*n[k]
+
+@cython.cdivision(True)
+cdef inline void pressure_function(double p, double d, double pk, double ck,
+        double gamma, double *f, double *df) nogil:
+    """
+    Pressure jump across a rarefaction or shock wave and its derivative.
+    Reference: Toro (2009): Chapter 4, eqs. 4.6-4.7 and 4.37
+    """
+    cdef double Ak, Bk
+
+    if p <= pk: # rarefaction wave
+        f[0]  = 2.*ck/(gamma - 1.)*(pow(p/pk, (gamma - 1.)/(2.*gamma)) - 1.)
+        df[0] = pow(p/pk, -(gamma + 1.)/(2.*gamma))/(d*ck)
 
-                _vl[k] = vl[k][i]
-                _vr[k] = vr[k][i]
+    else: # shock wave
+        Ak = 2./(d*(gamma + 1.))
+        Bk = pk*(gamma - 1.)/(gamma + 1.)
+        f[0]  = (p - pk)*sqrt(Ak/(p + Bk))
+        df[0] = sqrt(Ak/(p + Bk))*(1. - .5*(p - pk)/(Bk + p))
 
-                n[k] = nx[k][i]
+@cython.cdivision(True)
+cdef inline double p_guess(double dl, double ul, double pl, double cl,
+        double dr, double ur, double pr, double cr, double gamma) nogil:
+    """
+    Calculate starting pressure for iterative exact scheme.
+    Reference: Toro (2009): Chapter 4
+    """
+    cdef double ppv, u_star
+    cdef double p_lr, p_tl, p_tr
+    cdef double gl, gr, p_max, p_min
+
+    # initial guess for pressure eq: 4.47
+    ppv = fmax(0., .5*(pl + pr) - .125*(ur - ul)*(dl + dr)*(cl + cr))
+
+    p_max = fmax(pl, pr)
+    p_min = fmin(pl, pr)
+
+    if ((p_max/p_min <= 2.) and (p_min <= ppv) and (ppv <= p_max)):
+        return ppv
+
+    elif (ppv < p_min): # two rarefaction
+        p_lr   = pow(pl/pr, (gamma - 1.)/(2.*gamma))
+        u_star = (p_lr*ul/cl + ur/cr + 2.*(p_lr - 1.)/(gamma - 1.))/\
+                (p_lr/cl + 1./cr)
+        p_tl   = pow(1. + (gamma - 1.)*(ul - u_star)/(2.*cl), 2.*gamma/(gamma - 1.))
+        p_tr   = pow(1. + (gamma - 1.)*(u_star - ur)/(2.*cr), 2.*gamma/(gamma - 1.))
+        return .5*(pl*p_tl + pr*p_tr)
+
+    else: # two shock
+        gl = sqrt((2./(dl*(gamma + 1.)))/((gamma - 1.)*pl/(gamma + 1.) + ppv))
+        gr = sqrt((2./(dr*(gamma + 1.)))/((gamma - 1.)*pr/(gamma + 1.) + ppv))
+        return (gl*pl + gr*pr - (ur - ul))/(gr + gl)
+
+@cython.cdivision(True)
+cdef inline double newton_step(double p_old, double dl, double ul, double pl,
+        double cl, double dr, double ur, double pr, double cr, double gamma) nogil:
+    """Newton-Raphson update of star pressure, Toro (2009) eq. 4.44"""
+    cdef double fl, fr, dfl, dfr, p_new
+
+    pressure_function(p_old, dl, pl, cl, gamma, &fl, &dfl)
+    pressure_function(p_old, dr, pr, cr, gamma, &fr, &dfr)
+
+    p_new = p_old - (fl + fr + ur - ul)/(dfl + dfr)
+    if p_new < 0.:
+        p_new = EXACT_TOL
+    return p_new
+
+@cython.cdivision(True)
+cdef inline void exact_flux(double* ql, double* qr, double* n, double wn,
+        double p_star, double gamma, int dim, double* f) nogil:
+    """
+    Sample exact solution at the face velocity wn and compute the flux
+    through the face. States are in primitive order, p_star less than
+    zero denotes vacuum generation.
+    Reference: Toro (2009): Chapter 4.5 and 4.6
+    """
+    cdef int k
+    cdef bint left
+    cdef double dl, ul, pl, cl, dr, ur, pr, cr
+    cdef double fl, fr, dfl, dfr, u_star
+    cdef double d, u, p, c, s, e, vsq, v[3]
+    cdef double g1 = (gamma - 1.)/(2.*gamma)
+    cdef double g2 = (gamma + 1.)/(2.*gamma)
+    cdef double g4 = 2./(gamma - 1.)
+    cdef double g5 = 2./(gamma + 1.)
+    cdef double g6 = (gamma - 1.)/(gamma + 1.)
+    cdef double g7 = (gamma - 1.)/2.
+
+    dl = ql[0]; pl = ql[dim+1]
+    dr = qr[0]; pr = qr[dim+1]
+
+    ul = ur = 0.
+    for k in range(dim):
+        ul += ql[1+k]*n[k]
+        ur += qr[1+k]*n[k]
+
+    cl = sqrt(gamma*pl/dl)
+    cr = sqrt(gamma*pr/dr)
+
+    # sample point is the face
+    s = wn
+
+    if p_star < 0.: # vacuum generation
+
+        u_star = 0.
+        if s <= ul + g4*cl:
+            left = True
+            if s <= ul - cl: # left state
+                d = dl; u = ul; p = pl
+            else: # left fan
+                c = g5*(cl + g7*(ul - s))
+                u = g5*(cl + g7*ul + s)
+                d = dl*pow(c/cl, g4)
+                p = pl*pow(c/cl, 1./g1)
+
+        elif s >= ur - g4*cr:
+            left = False
+            if s >= ur + cr: # right state
+                d = dr; u = ur; p = pr
+            else: # right fan
+                c = g5*(cr - g7*(ur - s))
+                u = g5*(-cr + g7*ur + s)
+                d = dr*pow(c/cr, g4)
+                p = pr*pow(c/cr, 1./g1)
+
+        else: # vacuum
+            for k in range(dim+2):
+                f[k] = 0.
+            return
+
+    else:
+
+        # contact wave speed
+        pressure_function(p_star, dl, pl, cl, gamma, &fl, &dfl)
+        pressure_function(p_star, dr, pr, cr, gamma, &fr, &dfr)
+        u_star = .5*(ul + ur) + .5*(fr - fl)
+
+        if s <= u_star: # left of contact discontinuity
+            left = True
+            if p_star > pl: # left shock
+                if s <= ul - cl*sqrt(g2*p_star/pl + g1): # left state
+                    d = dl; u = ul; p = pl
+                else: # star left state
+                    d = dl*(p_star/pl + g6)/(g6*p_star/pl + 1.)
+                    u = u_star; p = p_star
+
+            else: # left rarefaction
+                if s <= ul - cl: # left state
+                    d = dl; u = ul; p = pl
+                elif s > u_star - cl*pow(p_star/pl, g1): # star left state
+                    d = dl*pow(p_star/pl, 1./gamma)
+                    u = u_star; p = p_star
+                else: # inside left fan
+                    c = g5*(cl + g7*(ul - s))
+                    u = g5*(cl + g7*ul + s)
+                    d = dl*pow(c/cl, g4)
+                    p = pl*pow(c/cl, 1./g1)
+
+        else: # right of contact discontinuity
+            left = False
+            if p_star > pr: # right shock
+                if s >= ur + cr*sqrt(g2*p_star/pr + g1): # right state
+                    d = dr; u = ur; p = pr
+                else: # star right state
+                    d = dr*(p_star/pr + g6)/(g6*p_star/pr + 1.)
+                    u = u_star; p = p_star
+
+            else: # right rarefaction
+                if s >= ur + cr: # right state
+                    d = dr; u = ur; p = pr
+                elif s < u_star + cr*pow(p_star/pr, g1): # star right state
+                    d = dr*pow(p_star/pr, 1./gamma)
+                    u = u_star; p = p_star
+                else: # inside right fan
+                    c = g5*(cr - g7*(ur - s))
+                    u = g5*(-cr + g7*ur + s)
+                    d = dr*pow(c/cr, g4)
+                    p = pr*pow(c/cr, 1./g1)
+
+    # tangential velocity is advected with the contact
+    vsq = 0.
+    for k in range(dim):
+        if left:
+            v[k] = ql[1+k] + (u - ul)*n[k]
+        else:
+            v[k] = qr[1+k] + (u - ur)*n[k]
+        vsq += v[k]*v[k]
 
-                # left/right velocity square
-                vl_sq += _vl[k]*_vl[k]
-                vr_sq += _vr[k]*_vr[k]
+    e = 0.5*d*vsq + p/(gamma - 1.)
 
-                # project left/righ velocity to face normal
-                Vnl += _vl[k]*n[k]
-                Vnr += _vr[k]*n[k]
+    f[0]     = d*(u - wn)
+    f[dim+1] = e*(u - wn) + p*u
+    for k in range(dim):
+        f[1+k] = d*v[k]*(u - wn) + p*n[k]
 
-                # project face velocity to face normal
-                wn += wx[k][i]*n[k]
+cdef class Exact(RiemannBase):
+    """
+    Exact riemann solver for an ideal gas, Toro (2009) chapter 4. The
+    star pressure of all faces of a block are iterated together, faces
+    that converged are removed from the active list so each sweep only
+    touches faces that still need work.
 
-            # if boosted we are in face frame
-            if boost == 1:
-                wn = 0.
+    Attributes
+    ----------
+    num_unconverged : int
+        Number of faces that did not converge in the last solve.
 
-            self.get_waves(_dl, Vnl, _pl, _dr, Vnr, _pr, gamma,
-                    &sl, &s_contact, &sr)
+    max_iterations : int
+        Largest number of newton iterations of a block in the last solve.
 
-            # calculate interface flux - eq. 10.71
-            if(wn <= sl):
+    """
+    def __init__(self, double param_cfl=0.5, bint param_boost=True,
+            int param_num_threads=1):
+        super(Exact, self).__init__(param_cfl, param_boost, param_num_threads)
+        self.has_face_flux = True
+        self.needs_gamma = True
 
-                # left state
-                fm.data[i]  = _dl*(Vnl - wn)
-                fe.data[i]  = (0.5*_dl*vl_sq + _pl/(gamma - 1.0))*(Vnl - wn) + _pl*Vnl
+    def initialize(self):
+        if not self.registered_fields:
+            raise RuntimeError("Riemann did not set fields for flux!")
 
+        self.fluxes = CarrayContainer(var_dict=self.flux_fields)
+        self.fluxes.named_groups = self.flux_field_groups
+
+        # fluxes are resized every step, keep memory across steps
+        self.fluxes.set_capacity_policy()
+
+    cdef riemann_solver(self, Mesh mesh, ReconstructionBase reconstruction,
+            EquationStateBase eos, double gamma, int dim):
+        self.num_unconverged = 0
+        self.max_iterations = 0
+
+        RiemannBase.riemann_solver(self, mesh, reconstruction, eos, gamma, dim)
+        if self.num_unconverged:
+            raise RuntimeError("No convergence in Exact Riemann Solver, %d faces" %\
+                    self.num_unconverged)
+
+    cpdef fused_update(self, CarrayContainer particles, Mesh mesh,
+            ReconstructionBase reconstruction, EquationStateBase eos,
+            DomainManager domain_manager, bint boost, double dt):
+        self.num_unconverged = 0
+        self.max_iterations = 0
+
+        RiemannBase.fused_update(self, particles, mesh, reconstruction, eos,
+                domain_manager, boost, dt)
+        if self.num_unconverged:
+            raise RuntimeError("No convergence in Exact Riemann Solver, %d faces" %\
+                    self.num_unconverged)
+
+    @cython.cdivision(True)
+    cdef void solve_faces(self, FaceStates* fs, int start, int end,
+            double gamma, int dim, bint boost) nogil:
+        """
+        Solve faces start to end, the star pressure of all faces in the
+        block are found by simultaneous newton iteration.
+        """
+        cdef int i, k, m, a, num_active, it
+        cdef int active[FACE_BLOCK]
+        cdef double dl[FACE_BLOCK], ul[FACE_BLOCK], pl[FACE_BLOCK], cl[FACE_BLOCK]
+        cdef double dr[FACE_BLOCK], ur[FACE_BLOCK], pr[FACE_BLOCK], cr[FACE_BLOCK]
+        cdef double p_star[FACE_BLOCK]
+        cdef double p_new, wn
+        cdef double ql[5], qr[5], n[3], f[5]
+
+        # normal states and initial guess of each face
+        num_active = 0
+        for m in range(end - start):
+            i = start + m
+
+            dl[m] = fs.dl[i]; pl[m] = fs.pl[i]
+            dr[m] = fs.dr[i]; pr[m] = fs.pr[i]
+
+            ul[m] = ur[m] = 0.
+            for k in range(dim):
+                ul[m] += fs.vl[k][i]*fs.nx[k][i]
+                ur[m] += fs.vr[k][i]*fs.nx[k][i]
+
+            cl[m] = sqrt(gamma*pl[m]/dl[m])
+            cr[m] = sqrt(gamma*pr[m]/dr[m])
+
+            # pressure positivity condition, eq. 4.40
+            if 2.*(cl[m] + cr[m])/(gamma - 1.) <= ur[m] - ul[m]:
+                p_star[m] = -1.
+            else:
+                p_star[m] = p_guess(dl[m], ul[m], pl[m], cl[m],
+                        dr[m], ur[m], pr[m], cr[m], gamma)
+                active[num_active] = m
+                num_active += 1
+
+        # iterate all unconverged faces together
+        it = 0
+        while num_active > 0 and it < EXACT_MAX_ITER:
+            a = 0
+            for k in range(num_active):
+                m = active[k]
+                p_new = newton_step(p_star[m], dl[m], ul[m], pl[m], cl[m],
+                        dr[m], ur[m], pr[m], cr[m], gamma)
+
+                # keep face if not converged
+                if 2.*fabs((p_new - p_star[m])/(p_new + p_star[m])) > EXACT_TOL:
+                    active[a] = m
+                    a += 1
+                p_star[m] = p_new
+
+            num_active = a
+            it += 1
+
+        if num_active or it > self.max_iterations:
+            with gil:
+                self.num_unconverged += num_active
+                self.max_iterations = max(self.max_iterations, it)
+
+        # sample solution at each face
+        for m in range(end - start):
+            i = start + m
+
+            ql[0] = dl[m]; ql[dim+1] = pl[m]
+            qr[0] = dr[m]; qr[dim+1] = pr[m]
+
+            wn = 0.0
+            for k in range(dim):
+                ql[1+k] = fs.vl[k][i]
+                qr[1+k] = fs.vr[k][i]
+                n[k] = fs.nx[k][i]
+                wn += fs.wx[k][i]*n[k]
+
+            # in face frame
+            if boost:
+                wn = 0.
+
+            exact_flux(ql, qr, n, wn, p_star[m], gamma, dim, f)
+
+            # return flux to lab frame (Pakmor 2011)
+            if boost:
                 for k in range(dim):
-                    fmv[k][i] = _dl*vl[k][i]*(Vnl - wn) + _pl*nx[k][i]
+                    f[dim+1] += fs.wx[k][i]*(0.5*fs.wx[k][i]*f[0] + f[1+k])
+                    f[1+k]   += fs.wx[k][i]*f[0]
 
-            elif((sl < wn) and (wn <= sr)):
+            fs.fm[i] = f[0]
+            fs.fe[i] = f[dim+1]
+            for k in range(dim):
+                fs.fmv[k][i] = f[1+k]
 
-                # intermediate state
-                if(wn <= s_contact):
+    @cython.cdivision(True)
+    cdef void face_flux(self, double* ql, double* qr, double* th, double* n,
+            double wn, double gamma, int dim, double* f) nogil:
+        """
+        Exact flux of a single face for an ideal gas, see
+        RiemannBase.face_flux.
+        """
+        cdef int k, it = 0
+        cdef double dl, ul, pl, cl, dr, ur, pr, cr
+        cdef double p_old, p_star = -1.
+
+        dl = ql[0]; pl = ql[dim+1]
+        dr = qr[0]; pr = qr[dim+1]
+
+        ul = ur = 0.
+        for k in range(dim):
+            ul += ql[1+k]*n[k]
+            ur += qr[1+k]*n[k]
+
+        cl = sqrt(gamma*pl/dl)
+        cr = sqrt(gamma*pr/dr)
+
+        # pressure positivity condition, eq. 4.40
+        if 2.*(cl + cr)/(gamma - 1.) > ur - ul:
+            p_star = p_guess(dl, ul, pl, cl, dr, ur, pr, cr, gamma)
+            while it < EXACT_MAX_ITER:
+                p_old = p_star
+                p_star = newton_step(p_old, dl, ul, pl, cl, dr, ur, pr, cr, gamma)
+                it += 1
+                if 2.*fabs((p_star - p_old)/(p_star + p_old)) <= EXACT_TOL:
+                    break
+
+            if it == EXACT_MAX_ITER:
+                with gil:
+                    self.num_unconverged += 1
+
+        exact_flux(ql, qr, n, wn, p_star, gamma, dim, f)
+
+# face classes of adaptive riemann solver
+cdef enum:
+    SMOOTH = 0
+    CONTACT = 1
+    STRONG = 2
+
+@cython.cdivision(True)
+cdef inline int classify_face(HLL hll, double dl, double ul, double pl,
+        double cl, double dr, double ur, double pr, double cr, double gamma,
+        double smooth_jump, double strong_jump) nogil:
+    """
+    Classify face by the jumps of the riemann problem. The pressure jump
+    across the outer waves is found from the wave speed estimates of
+    get_waves and the shock relations, Toro (2009) eq. 3.53.
+    """
+    cdef double sl, sc, sr
+    cdef double ml, mr, mach_sq, p_jump, d_jump
 
-                    # left star state - eq. 10.38 and 10.39
-                    factor_1 = _dl*(sl - Vnl)/(sl - s_contact)
-                    factor_2 = factor_1*(sl - wn)*(s_contact - Vnl) + _pl
-                    frho = _dl*(Vnl - sl) + factor_1*(sl - wn)
+    # pressure positivity condition, eq. 4.40
+    if 2.*(cl + cr)/(gamma - 1.) <= ur - ul:
+        return STRONG
 
-                    # total energy
-                    el = 0.5*_dl*vl_sq + _pl/(gamma-1.0)
+    hll.get_waves(dl, ul, pl, cl, dr, ur, pr, cr, &sl, &sc, &sr)
 
-                    fm.data[i] = frho
-                    fe.data[i] = (el + _pl)*Vnl - sl*el +\
-                            (sl - wn)*factor_1*(el/_dl + (s_contact - Vnl)*\
-                            (s_contact + _pl/(_dl*(sl - Vnl))))
+    # mach number of outer waves relative to upstream
+    ml = (ul - sl)/cl
+    mr = (sr - ur)/cr
+    mach_sq = fmax(fmax(ml*ml, mr*mr), 1.)
+    p_jump = 1. + 2.*gamma*(mach_sq - 1.)/(gamma + 1.)
+    p_jump = fmax(p_jump, fmax(pl, pr)/fmin(pl, pr))
 
-                    for k in range(dim):
-                        fmv[k][i] = frho*vl[k][i] + factor_2*nx[k][i]
+    if p_jump > strong_jump:
+        return STRONG
 
-                else:
+    d_jump = fmax(dl, dr)/fmin(dl, dr)
+    if p_jump < 1. + smooth_jump and d_jump < 1. + smooth_jump:
+        return SMOOTH
 
-                    # right star state
-                    factor_1 = _dr*(sr - Vnr)/(sr - s_contact)
-                    factor_2 = factor_1*(sr - wn)*(s_contact - Vnr) + _pr
-                    frho = _dr*(Vnr - sr) + factor_1*(sr - wn)
+    return CONTACT
 
-                    # total energy
-                    er = 0.5*_dr*vr_sq + _pr/(gamma-1.0)
+cdef class Adaptive(RiemannBase):
+    """
+    Hybrid riemann solver that picks a solver per face. Faces with small
+    jumps are solved with HLL, faces with contacts or moderate shocks
+    with HLLC and strong shocks or vacuum generating faces with the
+    exact solver, which needs an ideal gas. In compute_fluxes each class
+    is gathered into a contiguous batch that is solved in parallel blocks.
 
-                    fm.data[i] = frho
-                    fe.data[i] = (er + _pr)*Vnr - sr*er +\
-                            (sr - wn)*factor_1*(er/_dr + (s_contact - Vnr)*\
-                            (s_contact + _pr/(_dr*(sr - Vnr))))
+    Attributes
+    ----------
+    param_smooth_jump : double
+        Faces with relative pressure and density jump below this value
+        are solved with HLL.
 
-                    for k in range(dim):
-                        fmv[k][i] = frho*vr[k][i] + factor_2*nx[k][i]
+    param_strong_jump : double
+        Faces with pressure ratio across a wave above this value are
+        solved with the exact solver.
 
-            else:
+    face_class : IntArray
+        Class of each face from the last compute_fluxes.
+
+    """
+    def __init__(self, double param_cfl=0.5, bint param_boost=True,
+            int param_num_threads=1, double param_smooth_jump=0.1,
+            double param_strong_jump=5.0):
+        super(Adaptive, self).__init__(param_cfl, param_boost, param_num_threads)
+        self.has_face_flux = True
+        self.needs_gamma = True
+
+        if param_smooth_jump < 0. or param_strong_jump < 1. + param_smooth_jump:
+            raise RuntimeError("Adaptive: inconsistent jump thresholds")
+
+        self.param_smooth_jump = param_smooth_jump
+        self.param_strong_jump = param_strong_jump
 
-                # right state
-                fm.data[i]  = _dr*(Vnr - wn)
-                fe.data[i]  = (0.5*_dr*vr_sq + _pr/(gamma - 1.0))*(Vnr - wn) + _pr*Vnr
+        self.hll = HLL(param_cfl, param_boost)
+        self.hllc = HLLC(param_cfl, param_boost)
+        self.exact = Exact(param_cfl, param_boost)
 
+        self.face_class = IntArray()
+        self.face_order = LongArray()
+        self.batch = DoubleArray()
+        self.reset_statistics()
+
+    def initialize(self):
+        if not self.registered_fields:
+            raise RuntimeError("Riemann did not set fields for flux!")
+
+        self.fluxes = CarrayContainer(var_dict=self.flux_fields)
+        self.fluxes.named_groups = self.flux_field_groups
+
+        # fluxes are resized every step, keep memory across steps
+        self.fluxes.set_capacity_policy()
+
+    def reset_statistics(self):
+        """Zero face counts and timers of all classes."""
+        cdef int c
+        for c in range(3):
+            self.num_class[c] = 0
+            self.time_class[c] = 0.
+        self.time_classify = 0.
+
+    def get_statistics(self):
+        """
+        Return number of faces and time spent in each solver since last
+        reset. Faces solved in fused_update are counted but not timed,
+        time of classify includes sorting faces into batches.
+        """
+        cdef int c
+        stats = {}
+        for c, name in enumerate(["hll", "hllc", "exact"]):
+            stats[name] = {"faces": self.num_class[c], "time": self.time_class[c]}
+        stats["classify"] = {"faces": sum(self.num_class[c] for c in range(3)),
+                "time": self.time_classify}
+        return stats
+
+    cdef riemann_solver(self, Mesh mesh, ReconstructionBase reconstruction,
+            EquationStateBase eos, double gamma, int dim):
+        """
+        Classify every face, sort faces by class into a batch buffer and
+        solve each class with its solver.
+        """
+        cdef FaceStates fs, bs
+        cdef RiemannBase solver
+        cdef int i, k, m, c, b, num_blocks, num_threads
+        cdef int num_faces = mesh.faces.get_number_of_items()
+        cdef int offset[4]
+        cdef bint boost = self.param_boost
+        cdef double smooth_jump = self.param_smooth_jump
+        cdef double strong_jump = self.param_strong_jump
+        cdef double ul, ur
+        cdef np.int8_t* face_class
+        cdef np.int32_t* face_order
+
+        self.load_face_states(&fs, mesh, reconstruction, eos)
+        num_threads = self.get_num_threads()
+
+        self.face_class.resize(num_faces)
+        self.face_order.resize(num_faces)
+        self.batch.resize(num_faces*(10 + 5*dim))
+        face_class = self.face_class.data
+        face_order = self.face_order.data
+
+        t_start = time.time()
+        with nogil, parallel(num_threads=num_threads):
+            for i in prange(num_faces, schedule="static"):
+                ul = ur = 0.
+                for k in range(dim):
+                    ul = ul + fs.vl[k][i]*fs.nx[k][i]
+                    ur = ur + fs.vr[k][i]*fs.nx[k][i]
+
+                face_class[i] = classify_face(self.hll, fs.dl[i], ul, fs.pl[i],
+                        fs.cl[i], fs.dr[i], ur, fs.pr[i], fs.cr[i], gamma,
+                        smooth_jump, strong_jump)
+
+        # counting sort of faces by class
+        for c in range(4):
+            offset[c] = 0
+        for i in range(num_faces):
+            offset[face_class[i] + 1] += 1
+        for c in range(3):
+            offset[c+1] += offset[c]
+            self.num_class[c] += offset[c+1] - offset[c]
+        for i in range(num_faces):
+            c = face_class[i]
+            face_order[offset[c]] = i
+            offset[c] += 1
+        for c in range(2, -1, -1):
+            offset[c+1] = offset[c]
+        offset[0] = 0
+
+        # gather face states in class order
+        self.batch_states(&bs, num_faces, dim)
+        with nogil, parallel(num_threads=num_threads):
+            for m in prange(num_faces, schedule="static"):
+                i = face_order[m]
+                bs.dl[m] = fs.dl[i]; bs.pl[m] = fs.pl[i]
+                bs.dr[m] = fs.dr[i]; bs.pr[m] = fs.pr[i]
+                bs.cl[m] = fs.cl[i]; bs.el[m] = fs.el[i]
+                bs.cr[m] = fs.cr[i]; bs.er[m] = fs.er[i]
                 for k in range(dim):
-                    fmv[k][i] = _dr*vr[k][i]*(Vnr - wn) + _pr*nx[k][i]
-
-        if boost:
-            self.deboost(self.fluxes, mesh.faces, dim)
-
-#cdef class Exact(RiemannBase):
-#    def __init__(self ):
-#        # self.reconstruction = None
-#        pass
-#
-#    cdef riemann_solver(self, CarrayContainer fluxes, CarrayContainer left_faces, CarrayContainer right_faces,
-#            CarrayContainer faces, double gamma, int dim):
-#
-#        # left state primitive variables
-#        cdef DoubleArray dl = left_faces.get_carray("density")
-#        cdef DoubleArray pl = left_faces.get_carray("pressure")
-#
-#        # left state primitive variables
-#        cdef DoubleArray dr = right_faces.get_carray("density")
-#        cdef DoubleArray pr = right_faces.get_carray("pressure")
-#
-#        cdef DoubleArray fm  = fluxes.get_carray("mass")
-#        cdef DoubleArray fe  = fluxes.get_carray("energy")
-#
-#        cdef int i, k
-#        cdef np.float64_t *vl[3], *vr[3], *fmv[3], *nx[3]
-#        cdef np.float64_t _vl[3], _vr[3], n[3]
-#
-#        # state values
-#        cdef double _dl, _pl
-#        cdef double _dr, _pr
-#        cdef double _d, v[3], _p, vn, v_sq
-#
-#        cdef double vnl, vnr, vl_sq, vr_sq
-#
-#        # wave estimates
-#        cdef double fr, fl, u_tmp
-#        cdef double p_star, u_star
-#        cdef double s_hl, s_tl, sl, sr
-#        cdef double c, cl, cr, c_star_l, c_star_r
-#
-#        cdef int num_faces = faces.get_number_of_items()
-#
-#        left_faces.pointer_groups(vl,  left_faces.named_groups['velocity'])
-#        right_faces.pointer_groups(vr, right_faces.named_groups['velocity'])
-#        fluxes.pointer_groups(fmv, fluxes.named_groups['momentum'])
-#        faces.pointer_groups(nx, faces.named_groups['normal'])
-#
-#        for i in range(num_faces):
-#
-#            # left state
-#            _dl = dl.data[i]
-#            _pl = pl.data[i]
-#
-#            # right state
-#            _dr = dr.data[i]
-#            _pr = pr.data[i]
-#
-#            # sound speed
-#            cl = sqrt(gamma*_pl/_dl)
-#            cr = sqrt(gamma*_pr/_dr)
-#
-#            vnl = vnr = 0.0
-#            vl_sq = vr_sq = 0.0
-#            for k in range(dim):
-#
-#                _vl[k] = vl[k][i]
-#                _vr[k] = vr[k][i]
-#                n[k]   = nx[k][i]
-#
-#                # project left/righ velocity to face normal
-#                vnl += _vl[k]*n[k]
-#                vnr += _vr[k]*n[k]
-#
-#                # left/right velocity square
-#                vl_sq += _vl[k]*_vl[k]
-#                vr_sq += _vr[k]*_vr[k]
-#
-#            # hack - delete later >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-#            if _dl < 0. or _dr < 0.:
-#
-#                print 'vacuum left/right'
-#
-#                self.vacuum(_dl, _vl, _pl, vnl, cl,\
-#                       _dr, _vr, _pr, vnr, cr,\
-#                       &_d,  v, &_p, &vn, &v_sq,\
-#                       gamma, n, dim)
-#
-#                fm.data[i] = _d*vn
-#                fe.data[i] = (0.5*_d*v_sq + gamma*_p/(gamma - 1.0))*vn
-#                for k in range(dim):
-#                    fmv[k][i] = _d*v[k]*vn + _p*nx[k][i]
-#
-#                continue
-#
-#            if (2.*cl/(gamma-1.) + 2.*cr/(gamma-1.)) <= (vnr - vnl):
-#
-#                print 'vacuum generation'
-#
-#                self.vacuum(_dl, _vl, _pl, vnl, cl,\
-#                       _dr, _vr, _pr, vnr, cr,\
-#                       &_d,  v, &_p, &vn, &v_sq,\
-#                       gamma, n, dim)
-#
-#                fm.data[i] = _d*vn
-#                fe.data[i] = (0.5*_d*v_sq + gamma*_p/(gamma - 1.0))*vn
-#                for k in range(dim):
-#                    fmv[k][i] = _d*v[k]*vn + _p*nx[k][i]
-#
-#                continue
-#            # hack - delete later <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< 
-#
-#            # newton rhapson 
-#            p_star = self.get_pstar(_dl, vnl, _pl, cl,
-#                    _dr, vnr, _pr, cr, gamma)
-#
-#            # calculate the contact wave speed
-#            fl = self.p_func(_dl, vnl, _pl, cl, gamma, p_star)
-#            fr = self.p_func(_dr, vnr, _pr, cr, gamma, p_star)
-#            u_star = 0.5*(vnl + vnr + fr - fl)
-#
-#            if(0.0 <= u_star): # left of contact discontinuity
-#                if(p_star <= _pl): # left rarefraction
-#
-#                    # sound speed of head
-#                    s_hl = vnl - cl
-#
-#                    if(0.0 <= s_hl): # left state
-#                        fm.data[i]  = _dl*vnl
-#                        fe.data[i]  = (0.5*_dl*vl_sq + gamma*_pl/(gamma - 1.0))*vnl
-#
-#                        for k in range(dim):
-#                            fmv[k][i] = _dl*vl[k][i]*vnl + _pl*nx[k][i]
-#
-#                    else: # left rarefaction
-#
-#                        # sound speed of star state and tail of rarefraction
-#                        c_star_l = cl*pow(p_star/_pl, (gamma - 1.0)/(2.0*gamma))
-#                        s_tl = u_star - c_star_l
-#
-#                        if(0.0 >= s_tl): # star left state
-#                            _d = _dl*pow(p_star/_pl, 1.0/gamma)
-#                            _p = p_star
-#
-#                            v_sq = vn = 0.
-#                            for k in range(dim):
-#                                v[k]  = vl[k][i] + (u_star - vnl)*nx[k][i]
-#                                vn   += v[k]*nx[k][i]
-#                                v_sq += v[k]*v[k]
-#
-#                            fm.data[i]  = _d*vn
-#                            fe.data[i]  = (0.5*_d*v_sq + gamma*_p/(gamma - 1.0))*vn
-#
-#                            for k in range(dim):
-#                                fmv[k][i] = _d*v[k]*vn + _p*nx[k][i]
-#
-#                        else: # inside left fan
-#
-#                            c  = (2.0/(gamma + 1.0))*(cl + 0.5*(gamma - 1.0)*vnl)
-#                            _d = _dl*pow(c/cl, 2.0/(gamma - 1.0))
-#                            _p = _pl*pow(c/cl, 2.0*gamma/(gamma - 1.0))
-#
-#                            v_sq = vn = 0.
-#                            for k in range(dim):
-#                                v[k]  = vl[k][i] + (c - vnl)*nx[k][i]
-#                                vn   += v[k]*nx[k][i]
-#                                v_sq += v[k]*v[k]
-#
-#                            fm.data[i] = _d*vn
-#                            fe.data[i] = (0.5*_d*v_sq + gamma*_p/(gamma - 1.0))*vn
-#
-#                            for k in range(dim):
-#                                fmv[k][i] = _d*v[k]*vn + _p*nx[k][i]
-#
-#                else: # left shock
-#
-#                    sl = vnl - cl*sqrt((gamma + 1.0)*p_star/(2.0*gamma*_pl)\
-#                            + (gamma - 1.0)/(2.0*gamma))
-#
-#                    if(0.0 <= sl): # left state
-#                        fm.data[i] = _dl*vnl
-#                        fe.data[i] = (0.5*_dl*vl_sq + gamma*_pl/(gamma - 1.0))*vnl
-#
-#                        for k in range(dim):
-#                            fmv[k][i] = _dl*vl[k][i]*vnl + _pl*nx[k][i]
-#
-#                    else: # star left state
-#
-#                        _d = _dl*(p_star/_pl + (gamma - 1.0)/(gamma + 1.0))\
-#                                /(p_star*(gamma - 1.0)/((gamma + 1.0)*_pl) + 1.0)
-#                        _p = p_star
-#
-#                        v_sq = vn = 0.
-#                        for k in range(dim):
-#                            v[k]  = vl[k][i] + (u_star - vnl)*nx[k][i]
-#                            vn   += v[k]*nx[k][i]
-#                            v_sq += v[k]*v[k]
-#
-#                        fm.data[i]  = _d*vn
-#                        fe.data[i]  = (0.5*_d*v_sq + gamma*_p/(gamma - 1.0))*vn
-#
-#                        for k in range(dim):
-#                            fmv[k][i] = _d*v[k]*vn + _p*nx[k][i]
-#
-#            else: # right of contact
-#
-#                if(p_star >= _pr): # right shock
-#
-#                    sr = vnr + cr*sqrt((gamma + 1.0)*p_star/(2.0*gamma*_pr)\
-#                            + (gamma-1.0)/(2.0*gamma))
-#
-#                    if(0.0 >= sr): # right state
-#                        fm.data[i] = _dr*vnr
-#                        fe.data[i] = (0.5*_dr*vr_sq + gamma*_pr/(gamma - 1.0))*vnr
-#
-#                        for k in range(dim):
-#                            fmv[k][i] = _dr*vr[k][i]*vnr + _pr*nx[k][i]
-#
-#                    else: # star right state
-#
-#                        _d = _dr*(p_star/_pr + (gamma - 1.0)/(gamma + 1.0))\
-#                                /(p_star*(gamma - 1.0)/((gamma + 1.0)*_pr) + 1.0)
-#                        _p = p_star
-#
-#                        v_sq = vn = 0.
-#                        for k in range(dim):
-#                            v[k]  = vr[k][i] + (u_star - vnr)*nx[k][i]
-#                            vn   += v[k]*nx[k][i]
-#                            v_sq += v[k]*v[k]
-#
-#                        fm.data[i]  = _d*vn
-#                        fe.data[i]  = (0.5*_d*v_sq + gamma*_p/(gamma - 1.0))*vn
-#
-#                        for k in range(dim):
-#                            fmv[k][i] = _d*v[k]*vn + _p*nx[k][i]
-#
-#                else: # right rarefaction
-#
-#                    s_hr = vnr + cr
-#
-#                    if(0.0 >= s_hr): # right data state
-#                        fm.data[i]  = _dr*vnr
-#                        fe.data[i]  = (0.5*_dr*vr_sq + gamma*_pr/(gamma - 1.0))*vnr
-#
-#                        for k in range(dim):
-#                            fmv[k][i] = _dr*vr[k][i]*vnr + _pr*nx[k][i]
-#
-#                    else:
-#
-#                        # sound speed of the star state and sound speed
-#                        # of the tail of the rarefraction
-#                        c_star_r = cr*pow(p_star/_pr, (gamma-1.0)/(2.0*gamma))
-#                        s_tr = u_star + c_star_r
-#
-#                        if(0.0 <= s_tr): # star left state
-#                            _d = _dr*pow(p_star/_pr, 1.0/gamma)
-#                            _p = p_star
-#
-#                            v_sq = vn = 0.
-#                            for k in range(dim):
-#                                v[k]  = vr[k][i] + (u_star - vnr)*nx[k][i]
-#                                vn   += v[k]*nx[k][i]
-#                                v_sq += v[k]*v[k]
-#
-#                            fm.data[i]  = _d*vn
-#                            fe.data[i]  = (0.5*_d*v_sq + gamma*_p/(gamma - 1.0))*vn
-#
-#                            for k in range(dim):
-#                                fmv[k][i] = _d*v[k]*vn + _p*nx[k][i]
-#
-#                        else:
-#
-#                            # sampled point is inside right fan
-#                            c = (2.0/(gamma + 1.0))*(cr - 0.5*(gamma - 1.0)*vnr)
-#                            u_tmp = (2.0/(gamma + 1.0))*(-cr + 0.5*(gamma-1.0)*vnr)
-#
-#                            _d = _dr*pow(c/cr, 2.0/(gamma - 1.0))
-#                            _p = _pr*pow(c/cr, 2.0*gamma/(gamma - 1.0))
-#
-#                            v_sq = vn = 0.
-#                            for k in range(dim):
-#                                v[k]  = vr[k][i] + (u_tmp - vnr)*nx[k][i]
-#                                vn   += v[k]*nx[k][i]
-#                                v_sq += v[k]*v[k]
-#
-#                            fm.data[i]  = _d*vn
-#                            fe.data[i]  = (0.5*_d*v_sq + gamma*_p/(gamma - 1.0))*vn
-#
-#                            for k in range(dim):
-#                                fmv[k][i] = _d*v[k]*vn + _p*nx[k][i]
-#
-#        self._deboost(fluxes, faces, dim)
-#
-#    @cython.cdivision(True)
-#    cdef inline double p_guess(self, double dl, double ul, double pl, double cl,
-#            double dr, double ur, double pr, double cr, double gamma) nogil:
-#        """
-#        Calculate  starting pressure for iterative exact scheme
-#        Reference: Toro (2009): Chapter 4
-#        """
-#        cdef double ppv
-#        cdef double p_lr, p_tl
-#        cdef double gl, gr, p0
-#        cdef double p_star, p_max, p_min, q_max
-#
-#        # initial guess for pressure eq: 4.47
-#        ppv = .5*(pl + pr) - .125*(ur - ul)*(dl + dr)*(cl + cr)
-#
-#        p_star = max(0., ppv)
-#        p_max  = max(pl, pr)
-#        p_min  = min(pl, pr)
-#        q_max  = p_max/p_min
-#
-#        if ((q_max <= 2.) and (p_min <= ppv <= p_max)):
-#            p0 = ppv
-#
-#        elif (ppv <= p_min):
-#            p_lr   = pow(pl/pr, (gamma - 1.)/(2.*gamma))
-#            u_star = (p_lr*ul/cl + ur/cr + 2.*(p_lr - 1.)/(gamma - 1.))
-#            u_star = u_star/(p_lr/cl + 1./cr)
-#            p_tl   = pow(1. + (gamma - 1.)*(ul - u_star)/(2.*cl), 2.*gamma/(gamma - 1.))
-#            p_tr   = pow(1. + (gamma - 1.)*(u_star - ur)/(2.*cr), 2.*gamma/(gamma - 1.))
-#            p0 = .5*(pl*p_tl + pr*p_tr)
-#
-#        else:
-#            gl = sqrt((2./(dl*(gamma + 1.)))/((gamma - 1.)*pl/(gamma + 1.) + ppv))
-#            gr = sqrt((2./(dr*(gamma + 1.)))/((gamma - 1.)*pr/(gamma + 1.) + ppv))
-#            p0 = (gl*pl + gr*pr - (ur - ul))/(gr + gl)
-#
-#        return p0
-#
-#    @cython.cdivision(True)
-#    cdef inline double p_func(self, double d, double u, double p,
-#            double c, double gamma, double p_old) nogil:
-#        """
-#        Calculate the derivative of the jump across the wave.
-#        Reference: Toro (2009): Chapter 4
-#        """
-#        cdef double f, Ak, Bk
-#
-#        # rarefaction wave eq: 4.6b and 4.7b
-#        if (p_old <= p):
-#            f = 2.*c/(gamma - 1.)*(pow(p_old/p, (gamma - 1.)/(2.*gamma)) - 1.)
-#
-#        # shock wave eq: 4.6a and 4.7a
-#        else:
-#            Ak = 2./(d*(gamma + 1.))
-#            Bk = p*(gamma - 1.)/(gamma + 1.)
-#            f = (p_old - p)*sqrt(Ak/(p_old + Bk))
-#
-#        return f
-#
-#    @cython.cdivision(True)
-#    cdef inline double p_func_deriv(self, double d, double u, double p,
-#            double c, double gamma, double p_old) nogil:
-#        """
-#        Calculate the derivative of the jump across the wave.
-#        Reference: Toro (2009): Chapter 4
-#        """
-#        cdef double df, Ak, Bk
-#
-#        # derivative for rarefaction wave eq. 4.37
-#        if (p_old <= p):
-#            df = pow(p_old/p, -(gamma + 1.)/(2.*gamma))/(c*d)
-#
-#        # derivative for shock wave
-#        else:
-#            # eq: 4.8 and 4.37
-#            Ak = 2./(d*(gamma + 1.))
-#            Bk = p*(gamma - 1.)/(gamma + 1.)
-#            df = sqrt(Ak/(p_old + Bk))*(1. - .5*(p_old - p)/(Bk + p_old))
-#
-#        return df
-#
-#    @cython.cdivision(True)
-#    cdef inline double get_pstar(self, double dl, double ul, double pl, double cl,
-#            double dr, double ur, double pr, double cr, double gamma) nogil:
-#        """
-#        Calculate star pressure by iteration.
-#        Reference: Toro (2009): Chapter 4
-#        """
-#        cdef double TOL = 1.0e-6
-#        cdef int MAX_ITER = 1000
-#
-#        cdef int i = 0
-#        cdef double p_old, p_new, p
-#        cdef double fr, fl, df_r, df_l
-#
-#        p_old = self.p_guess(dl, ul, pl, cl, dr, ur, pr, cr, gamma)
-#        while(i < MAX_ITER):
-#
-#            fl  = self.p_func(dl, ul, pl, cl, gamma, p_old)
-#            fr  = self.p_func(dr, ur, pr, cr, gamma, p_old)
-#            dfl = self.p_func_deriv(dl, ul, pl, cl, gamma, p_old)
-#            dfr = self.p_func_deriv(dr, ur, pr, cr, gamma, p_old)
-#
-#            p_new = p_old - (fl + fr + ur - ul)/(dfl + dfr)
-#
-#            if ( 2.*fabs((p_new - p_old)/(p_new + p_old)) ) <= TOL:
-#                return p_new
-#
-#            if (p_new < 0.):
-#                p_new = TOL
-#
-#            p_old = p_new
-#            i += 1
-#
-#        # failed to converge
-#        with gil:
-#            raise RuntimeError('No convergence in Exact Riemann Solver')
-#
-#    cdef inline void vacuum(self,
-#            double dl, double vl[3], double pl, double vnl, double cl,
-#            double dr, double vr[3], double pr, double vnr, double cr,
-#            double *d, double  v[3], double *p, double *vn, double *vsq,
-#            double gamma, double n[3], int dim) nogil:
-#        """
-#        Calculate vacuum solution.
-#        Reference: Toro (2009): Chapter 4
-#        """
-#        cdef int i
-#        cdef double c, u_tmp
-#
-#        cdef double sl = vnl + 2.*cl/(gamma-1.)
-#        cdef double sr = vnr - 2.*cr/(gamma-1.)
-#
-#        if(dr < 0): # right vacuum eq 4.77
-#            if(0. <= vnl - cl): # left state 
-#                d[0] = dl
-#                p[0] = pl
-#
-#                vn[0] = vsq[0] = 0.
-#                for i in range(dim):
-#                    v[i]    = vl[i]
-#                    vn[0]  += v[i]*n[i]
-#                    vsq[0] += v[i]*v[i]
-#
-#            elif(0. < sl): # left fan
-#                c    = (2./(gamma + 1.))*(cl + .5*(gamma - 1.)*vnl)
-#                d[0] = dl*pow(c/cl, 2./(gamma - 1.))
-#                p[0] = pl*pow(c/cl, 2.*gamma/(gamma - 1.))
-#
-#                vn[0] = vsq[0] = 0.
-#                for i in range(dim):
-#                    v[i]    = vl[i] + (c - vnl)*n[i]
-#                    vn[0]  += v[i]*n[i]
-#                    vsq[0] += v[i]*v[i]
-#
-#            else: # right vacuum
-#                d[0] = 0.
-#                p[0] = 0.
-#
-#                vn[0] = vsq[0] = 0
-#                for i in range(dim):
-#                    v[i] = 0.
-#
-#        elif(dl < 0): # left vacuum
-#            if 0. <= sr: # left vacuum
-#                d[0] = 0.
-#                p[0] = 0.
-#
-#                vn[0] = vsq[0] = 0.
-#                for i in range(dim):
-#                    v[i] = 0.
-#
-#            elif(0. < vnr + cr): # right fan
-#                # sampled point is inside right fan
-#                c = (2./(gamma + 1.))*(cr - .5*(gamma - 1.)*vnr)
-#                u_tmp = (2./(gamma + 1.))*(-cr + .5*(gamma-1.)*vnr)
-#
-#                d[0] = dr*pow(c/cr, 2./(gamma - 1.))
-#                p[0] = pr*pow(c/cr, 2.*gamma/(gamma - 1.))
-#
-#                vn[0] = vsq[0] = 0
-#                for i in range(dim):
-#                    v[i]    = vr[i] + (u_tmp - vnr)*n[i]
-#                    vn[0]  += v[i]*n[i]
-#                    vsq[0] += v[i]*v[i]
-#
-#            else: # right state
-#                d[0] = dr
-#                p[0] = pr
-#
-#                vn[0] = vsq[0] = 0
-#                for i in range(dim):
-#                    v[i]    = vr[i]
-#                    vn[0]  += v[i]*n[i]
-#                    vsq[0] += v[i]*v[i]
-#
-#        else: # vacuum generation
-#
-#            if(sl < 0.) and (0. < sr): # vacuum
-#                d[0] = 0.
-#                p[0] = 0.
-#
-#                vn[0] = vsq[0] = 0
-#                for i in range(dim):
-#                    v[i] = 0.
-#
-#            elif(0. <= sl):
-#                if 0. <= vnl - cl: # left state 
-#                    d[0] = dl
-#                    p[0] = pl
-#
-#                    vn[0] = vsq[0] = 0.
-#                    for i in range(dim):
-#                        v[i]    = vl[i]
-#                        vn[0]  += v[i]*n[i]
-#                        vsq[0] += v[i]*v[i]
-#
-#                else: # left fan
-#                    c    = (2./(gamma + 1.))*(cl + .5*(gamma - 1.)*vnl)
-#                    d[0] = dl*pow(c/cl, 2./(gamma - 1.))
-#                    p[0] = pl*pow(c/cl, 2.*gamma/(gamma - 1.))
-#
-#                    vn[0] = vsq[0] = 0.
-#                    for i in range(dim):
-#                        v[i]    = vl[i] + (c - vnl)*n[i]
-#                        vn[0]  += v[i]*n[i]
-#                        vsq[0] += v[i]*v[i]
-#
-#            else:
-#                if(0. < vnr + cr): # right fan
-#                    # sample inside right fan
-#                    c = (2./(gamma + 1.))*(cr - .5*(gamma - 1.)*vnr)
-#                    u_tmp = (2./(gamma + 1.))*(-cr + .5*(gamma-1.)*vnr)
-#
-#                    d[0] = dr*pow(c/cr, 2./(gamma - 1.))
-#                    p[0] = pr*pow(c/cr, 2.*gamma/(gamma - 1.))
-#
-#                    vn[0] = vsq[0] = 0.
-#                    for i in range(dim):
-#                        v[i]    = vr[i] + (u_tmp - vnr)*n[i]
-#                        vn[0]  += v[i]*n[i]
-#                        vsq[0] += v[i]*v[i]
-#
-#                else: # right state
-#                    d[0] = dr
-#                    p[0] = pr
-#
-#                    vn[0] = vsq[0] = 0.
-#                    for i in range(dim):
-#                        v[i]    = vr[i]
-#                        vn[0]  += v[i]*n[i]
-#                        vsq[0] += v[i]*v[i]
-#
+                    bs.vl[k][m] = fs.vl[k][i]
+                    bs.vr[k][m] = fs.vr[k][i]
+                    bs.nx[k][m] = fs.nx[k][i]
+                    bs.wx[k][m] = fs.wx[k][i]
+        self.time_classify += time.time() - t_start
+
+        self.exact.num_unconverged = 0
+        for c, solver in enumerate([self.hll, self.hllc, self.exact]):
+            if offset[c+1] == offset[c]:
+                continue
+
+            t_start = time.time()
+            num_blocks = (offset[c+1] - offset[c] + FACE_BLOCK - 1)/FACE_BLOCK
+            with nogil, parallel(num_threads=num_threads):
+                for b in prange(num_blocks, schedule="dynamic"):
+                    solver.solve_faces(&bs, offset[c] + b*FACE_BLOCK,
+                            min(offset[c] + (b + 1)*FACE_BLOCK, offset[c+1]),
+                            gamma, dim, boost)
+            self.time_class[c] += time.time() - t_start
+
+        if self.exact.num_unconverged:
+            raise RuntimeError("No convergence in Exact Riemann Solver, %d faces" %\
+                    self.exact.num_unconverged)
+
+        # scatter fluxes back to face order
+        t_start = time.time()
+        with nogil, parallel(num_threads=num_threads):
+            for m in prange(num_faces, schedule="static"):
+                i = face_order[m]
+                fs.fm[i] = bs.fm[m]
+                fs.fe[i] = bs.fe[m]
+                for k in range(dim):
+                    fs.fmv[k][i] = bs.fmv[k][m]
+        self.time_classify += time.time() - t_start
+
+    cdef void batch_states(self, FaceStates* bs, int num_faces, int dim):
+        """Point face states to columns of the batch buffer."""
+        cdef int k
+        cdef np.float64_t* data = self.batch.data
+
+        bs.dl = data
+        bs.pl = data + num_faces
+        bs.dr = data + 2*num_faces
+        bs.pr = data + 3*num_faces
+        bs.fm = data + 4*num_faces
+        bs.fe = data + 5*num_faces
+        bs.cl = data + 6*num_faces
+        bs.cr = data + 7*num_faces
+        bs.el = data + 8*num_faces
+        bs.er = data + 9*num_faces
+        for k in range(dim):
+            bs.vl[k]  = data + (10 + k)*num_faces
+            bs.vr[k]  = data + (10 + dim + k)*num_faces
+            bs.nx[k]  = data + (10 + 2*dim + k)*num_faces
+            bs.wx[k]  = data + (10 + 3*dim + k)*num_faces
+            bs.fmv[k] = data + (10 + 4*dim + k)*num_faces
+
+    cpdef fused_update(self, CarrayContainer particles, Mesh mesh,
+            ReconstructionBase reconstruction, EquationStateBase eos,
+            DomainManager domain_manager, bint boost, double dt):
+        self.exact.num_unconverged = 0
+
+        RiemannBase.fused_update(self, particles, mesh, reconstruction, eos,
+                domain_manager, boost, dt)
+        if self.exact.num_unconverged:
+            raise RuntimeError("No convergence in Exact Riemann Solver, %d faces" %\
+                    self.exact.num_unconverged)
+
+    cdef void face_flux(self, double* ql, double* qr, double* th, double* n,
+            double wn, double gamma, int dim, double* f) nogil:
+        """
+        Classify face and compute flux with the solver of its class, see
+        RiemannBase.face_flux.
+        """
+        cdef int k, c
+        cdef double ul = 0., ur = 0.
+
+        for k in range(dim):
+            ul += ql[1+k]*n[k]
+            ur += qr[1+k]*n[k]
+
+        c = classify_face(self.hll, ql[0], ul, ql[dim+1], th[0], qr[0], ur,
+                qr[dim+1], th[2], gamma, self.param_smooth_jump, self.param_strong_jump)
+        self.num_class[c] += 1
+
+        if c == SMOOTH:
+            self.hll.face_flux(ql, qr, th, n, wn, gamma, dim, f)
+        elif c == CONTACT:
+            self.hllc.face_flux(ql, qr, th, n, wn, gamma, dim, f)
+        else:
+            self.exact.face_flux(ql, qr, th, n, wn, gamma, dim, f)
@@ -0,0 +1,81 @@
+"""
+Thread scaling of the HLL, HLLC, Exact and Adaptive riemann solvers on
+random face states. Run directly:
+
+    python bench_riemann.py
+"""
+import timeit
+import numpy as np
+
+from phd.mesh.mesh import Mesh
+from phd.riemann.riemann import HLL, HLLC, Exact, Adaptive
+from phd.equation_state.equation_state import IdealGas
+from phd.utils.particle_creator import HydroParticleCreator
+from phd.reconstruction.reconstruction import PieceWiseConstant
+
+def random_faces(num_faces, dim=2):
+    """Create mesh and reconstruction with random face states."""
+    particles = HydroParticleCreator(num=1, dim=dim)
+
+    mesh = Mesh()
+    mesh.register_fields(particles)
+    mesh.initialize()
+
+    reconstruction = PieceWiseConstant()
+    reconstruction.set_fields_for_reconstruction(particles)
+    reconstruction.initialize()
+
+    faces = mesh.faces
+    faces.resize(num_faces)
+
+    # random unit normals and face velocities
+    normal = np.random.randn(dim, num_faces)
+    normal /= np.sqrt(np.sum(normal**2, axis=0))
+    for k, field in enumerate(faces.named_groups["normal"]):
+        faces[field][:] = normal[k]
+    for field in faces.named_groups["velocity"]:
+        faces[field][:] = 0.1*np.random.randn(num_faces)
+
+    for states in [reconstruction.left_states, reconstruction.right_states]:
+        states.resize(num_faces)
+        states["density"][:] = 0.1 + np.random.rand(num_faces)
+        states["pressure"][:] = 0.1 + np.random.rand(num_faces)
+        for field in states.named_groups["velocity"]:
+            states[field][:] = np.random.randn(num_faces)
+
+    return particles, mesh, reconstruction
+
+def bench_threads(num_faces=10**6, threads=(1, 2, 4, 8), repeat=5):
+    """Time compute_fluxes for each solver and number of threads."""
+    particles, mesh, reconstruction = random_faces(num_faces)
+    eos = IdealGas()
+
+    results = {}
+    for solver in [HLL, HLLC, Exact, Adaptive]:
+        for num_threads in threads:
+            riemann = solver(param_num_threads=num_threads)
+            riemann.set_fields_for_riemann(particles)
+            riemann.initialize()
+
+            def compute():
+                riemann.compute_fluxes(particles, mesh, reconstruction, eos)
+
+            results[solver.__name__, num_threads] = min(
+                    timeit.repeat(compute, number=1, repeat=repeat))
+    return results
+
+if __name__ == "__main__":
+    results = bench_threads()
+    for (name, num_threads), time in sorted(results.items()):
+        print("%-8s threads: %2d  time: %.2e s  speedup: %5.2fx  vs HLLC: %5.2fx" %\
+                (name, num_threads, time, results[name, 1]/time,
+                    time/results["HLLC", num_threads]))
+
+    # face mix and time per class of the adaptive solver
+    particles, mesh, reconstruction = random_faces(10**6)
+    riemann = Adaptive()
+    riemann.set_fields_for_riemann(particles)
+    riemann.initialize()
+    riemann.compute_fluxes(particles, mesh, reconstruction, IdealGas())
+    for name, stats in sorted(riemann.get_statistics().items()):
+        print("%-8s faces: %7d  time: %.2e s" % (name, stats["faces"], stats["time"]))
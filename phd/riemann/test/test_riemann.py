@@ -1,10 +1,14 @@
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
 
 
 from phd.mesh.mesh import Mesh
-from phd.riemann.riemann import HLL
-from phd.equation_state.equation_state import IdealGas
+from phd.riemann.riemann import HLL, HLLC, Exact, Adaptive
+from phd.domain.domain_manager import DomainManager
+from phd.equation_state.equation_state import IdealGas, TabulatedEOS
 from phd.utils.particle_creator import HydroParticleCreator
 from phd.reconstruction.reconstruction import PieceWiseConstant
 
@@ -121,5 +125,293 @@ class TestHLLFlux(unittest.TestCase):
         for field in self.riemann.fluxes.properties.keys():
             self.assertAlmostEqual(self.riemann.fluxes[field][0], ans[field])
 
+class TestExactFlux(TestHLLFlux):
+    """Tests for the batched exact riemann solver."""
+    def setUp(self):
+        super(TestExactFlux, self).setUp()
+
+        self.riemann = Exact(param_boost=False)
+        self.riemann.set_fields_for_riemann(self.particles)
+        self.riemann.initialize()
+
+    def test_sod(self):
+
+        lt = self.reconstruction.left_states
+        rt = self.reconstruction.right_states
+        lt.resize(1); rt.resize(1)
+
+        # sod shock tube, Toro (2009) test 1
+        lt["density"][:]    = 1.0; rt["density"][:]    = 0.125
+        lt["velocity-x"][:] = 0.0; rt["velocity-x"][:] = 0.0
+        lt["velocity-y"][:] = 0.0; rt["velocity-y"][:] = 0.0
+        lt["pressure"][:]   = 1.0; rt["pressure"][:]   = 0.1
+
+        faces = self.mesh.faces
+        faces.resize(1)
+        faces["normal-x"][0]   = 1; faces["normal-y"][0]   = 0
+        faces["velocity-x"][0] = 0; faces["velocity-y"][0] = 0
+
+        self.riemann.compute_fluxes(self.particles, self.mesh,
+                self.reconstruction, self.eos)
+
+        # face lies in the left star state
+        d, u, p = 0.42632, 0.92745, 0.30313
+        ans = {"mass": d*u, "momentum-x": d*u*u + p, "momentum-y": 0.0,
+                "energy": (0.5*d*u*u + p/0.4)*u + p*u}
+        for field in self.riemann.fluxes.properties.keys():
+            self.assertAlmostEqual(self.riemann.fluxes[field][0], ans[field], 4)
+
+        self.assertEqual(self.riemann.num_unconverged, 0)
+        self.assertTrue(self.riemann.max_iterations > 0)
+
+class TestThreadedFlux(unittest.TestCase):
+    """Tests fluxes do not depend on the number of threads."""
+    def setUp(self):
+
+        self.particles = HydroParticleCreator(num=1, dim=2)
+        self.mesh = Mesh()
+        self.mesh.register_fields(self.particles)
+        self.mesh.initialize()
+
+        self.eos = IdealGas(param_gamma=1.4)
+        self.reconstruction = PieceWiseConstant()
+        self.reconstruction.set_fields_for_reconstruction(self.particles)
+        self.reconstruction.initialize()
+
+        # more faces than a single block
+        np.random.seed(0)
+        num_faces = 5000
+        faces = self.mesh.faces
+        faces.resize(num_faces)
+        theta = 2*np.pi*np.random.rand(num_faces)
+        faces["normal-x"][:] = np.cos(theta)
+        faces["normal-y"][:] = np.sin(theta)
+        faces["velocity-x"][:] = 0.1*np.random.randn(num_faces)
+        faces["velocity-y"][:] = 0.1*np.random.randn(num_faces)
+
+        for states in [self.reconstruction.left_states,
+                self.reconstruction.right_states]:
+            states.resize(num_faces)
+            states["density"][:] = 0.1 + np.random.rand(num_faces)
+            states["pressure"][:] = 0.1 + np.random.rand(num_faces)
+            states["velocity-x"][:] = np.random.randn(num_faces)
+            states["velocity-y"][:] = np.random.randn(num_faces)
+
+    def test_num_threads(self):
+        for solver in [HLL, HLLC, Exact, Adaptive]:
+            fluxes = []
+            for num_threads in [1, 4]:
+                riemann = solver(param_num_threads=num_threads)
+                riemann.set_fields_for_riemann(self.particles)
+                riemann.initialize()
+                riemann.compute_fluxes(self.particles, self.mesh,
+                        self.reconstruction, self.eos)
+                fluxes.append(dict((field, riemann.fluxes[field].copy())
+                    for field in riemann.fluxes.properties))
+
+            for field in fluxes[0]:
+                self.assertTrue(np.array_equal(fluxes[0][field], fluxes[1][field]))
+
+    def test_zero_pressure(self):
+        # first order states can have vanishing pressure
+        self.reconstruction.left_states["pressure"][:100] = 0.0
+        self.reconstruction.right_states["pressure"][50:150] = 0.0
+        for solver in [HLL, HLLC]:
+            riemann = solver()
+            riemann.set_fields_for_riemann(self.particles)
+            riemann.initialize()
+            riemann.compute_fluxes(self.particles, self.mesh,
+                    self.reconstruction, self.eos)
+            for field in riemann.fluxes.properties:
+                self.assertTrue(np.all(np.isfinite(riemann.fluxes[field])))
+
+    def test_adaptive(self):
+        # strong jumps on part of the faces
+        rt = self.reconstruction.right_states
+        rt["pressure"][:1000] *= 50.
+        rt["density"][1000:2000] = self.reconstruction.left_states["density"][1000:2000]
+        rt["pressure"][1000:2000] = self.reconstruction.left_states["pressure"][1000:2000]
+        rt["velocity-x"][1000:2000] = self.reconstruction.left_states["velocity-x"][1000:2000]
+        rt["velocity-y"][1000:2000] = self.reconstruction.left_states["velocity-y"][1000:2000]
+
+        riemann = Adaptive(param_num_threads=2)
+        riemann.set_fields_for_riemann(self.particles)
+        riemann.initialize()
+        riemann.compute_fluxes(self.particles, self.mesh,
+                self.reconstruction, self.eos)
+        face_class = riemann.face_class.get_npy_array()
+
+        # every class is used and counted
+        stats = riemann.get_statistics()
+        for c, name in enumerate(["hll", "hllc", "exact"]):
+            self.assertEqual(stats[name]["faces"], np.sum(face_class == c))
+            self.assertTrue(stats[name]["faces"] > 0)
+        self.assertTrue(np.all(face_class[1000:2000] == 0))
+        self.assertEqual(stats["classify"]["faces"], 5000)
+
+        # each face has the flux of the solver of its class
+        for c, solver in enumerate([HLL, HLLC, Exact]):
+            reference = solver()
+            reference.set_fields_for_riemann(self.particles)
+            reference.initialize()
+            reference.compute_fluxes(self.particles, self.mesh,
+                    self.reconstruction, self.eos)
+
+            for field in riemann.fluxes.properties:
+                self.assertTrue(np.array_equal(riemann.fluxes[field][face_class == c],
+                    reference.fluxes[field][face_class == c]))
+
+        riemann.reset_statistics()
+        self.assertEqual(riemann.get_statistics()["hll"]["faces"], 0)
+
+class TestTabulatedFlux(TestThreadedFlux):
+    """Tests solvers with an equation of state without gamma."""
+    def setUp(self):
+        super(TestTabulatedFlux, self).setUp()
+
+        # ideal gas table, pressure is bilinear in density and energy
+        d = np.logspace(-3, 2, 64)
+        u = np.logspace(-3, 3, 512)
+        D, U = np.meshgrid(d, u, indexing="ij")
+
+        self.path = tempfile.mkdtemp()
+        filename = os.path.join(self.path, "table.npz")
+        np.savez(filename, density=d, energy=u, pressure=0.4*D*U,
+                sound_speed=np.sqrt(1.4*0.4*U))
+        self.table = TabulatedEOS(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_tabulated(self):
+        for solver in [HLL, HLLC]:
+            fluxes = []
+            for eos in [self.eos, self.table]:
+                riemann = solver()
+                riemann.set_fields_for_riemann(self.particles)
+                riemann.initialize()
+                riemann.compute_fluxes(self.particles, self.mesh,
+                        self.reconstruction, eos)
+                fluxes.append(dict((field, riemann.fluxes[field].copy())
+                    for field in riemann.fluxes.properties))
+
+            # energies and wave speeds come from the table, its sound speed
+            # interpolation error is ~1e-5 so compare to the flux scale
+            for field in fluxes[0]:
+                scale = np.abs(fluxes[0][field]).max()
+                self.assertTrue(np.all(np.abs(fluxes[0][field] - fluxes[1][field])
+                    <= 1.0e-3*scale))
+
+        # ideal gas solvers refuse the table
+        for solver in [Exact, Adaptive]:
+            riemann = solver()
+            riemann.set_fields_for_riemann(self.particles)
+            riemann.initialize()
+            self.assertRaises(RuntimeError, riemann.compute_fluxes,
+                    self.particles, self.mesh, self.reconstruction, self.table)
+
+class TestComputeTimeStep(unittest.TestCase):
+    """Tests time step from cached and recomputed signal speeds."""
+    def setUp(self):
+        num = 10000
+        self.particles = HydroParticleCreator(num=num, dim=2)
+        self.particles["density"][:] = 0.1 + np.random.rand(num)
+        self.particles["pressure"][:] = 0.1 + np.random.rand(num)
+        self.particles["velocity-x"][:] = np.random.randn(num)
+        self.particles["velocity-y"][:] = np.random.randn(num)
+        self.particles["volume"][:] = 1.0e-4*(0.5 + np.random.rand(num))
+        self.particles["tag"][:] = 0
+        self.particles["tag"][::7] = 1
+
+        self.eos = IdealGas(param_gamma=1.4)
+        self.eos.conserative_from_primitive(self.particles)
+
+    def test_compute_time_step(self):
+        real = self.particles["tag"] == 0
+        c = np.sqrt(1.4*self.particles["pressure"]/self.particles["density"])
+        R = np.sqrt(self.particles["volume"]/np.pi)
+        v = np.sqrt(self.particles["velocity-x"]**2 + self.particles["velocity-y"]**2)
+
+        for boost in [True, False]:
+            if boost:
+                ans = 0.5*np.min((R/c)[real])
+            else:
+                ans = 0.5*np.min((R/(c + v))[real])
+
+            for num_threads in [1, 4]:
+                riemann = HLLC(param_boost=boost, param_num_threads=num_threads)
+
+                # signal speeds computed from primitive variables
+                self.assertFalse(self.eos.signal_speeds_valid)
+                self.assertAlmostEqual(riemann.compute_time_step(
+                    self.particles, self.eos), ans)
+
+                # signal speeds cached by primitive update
+                self.eos.primitive_from_conserative(self.particles, True)
+                self.assertTrue(self.eos.signal_speeds_valid)
+                self.assertAlmostEqual(riemann.compute_time_step(
+                    self.particles, self.eos), ans)
+                self.assertFalse(self.eos.signal_speeds_valid)
+
+class TestFusedUpdate(unittest.TestCase):
+    """Tests fused face pipeline against separate stages."""
+    def setUp(self):
+
+        # create 2 particles with different values
+        self.particles = HydroParticleCreator(num=2, dim=2)
+        self.particles["density"][:] = [1.0, 0.125]
+        self.particles["velocity-x"][:] = [0.5, -0.2]
+        self.particles["velocity-y"][:] = [0.1, 0.3]
+        self.particles["pressure"][:] = [1.0, 0.1]
+        self.particles["mass"][:] = 1.0
+        self.particles["energy"][:] = 2.0
+        self.particles["tag"][:] = 0
+
+        self.mesh = Mesh()
+        self.mesh.register_fields(self.particles)
+        self.mesh.initialize()
+
+        faces = self.mesh.faces
+        faces.resize(1)
+        faces["pair-i"][0] = 0; faces["pair-j"][0] = 1
+        faces["area"][0] = 1.0
+        faces["normal-x"][0]   = 1.0; faces["normal-y"][0]   = 0.0
+        faces["velocity-x"][0] = 0.2; faces["velocity-y"][0] = 0.1
+        self.mesh.build_face_adjacency(2)
+
+        self.eos = IdealGas(param_gamma=1.4)
+        self.domain_manager = DomainManager(0.2)
+
+        self.reconstruction = PieceWiseConstant()
+        self.reconstruction.set_fields_for_reconstruction(self.particles)
+        self.reconstruction.initialize()
+
+    def test_fused_update(self):
+        fields = self.particles.named_groups["conserative"]
+        initial = dict((field, self.particles[field].copy()) for field in fields)
+
+        for riemann in [HLL(), HLLC(), Exact(), Adaptive()]:
+            riemann.set_fields_for_riemann(self.particles)
+            riemann.initialize()
+
+            # reconstruction, riemann and update as separate stages
+            self.reconstruction.compute_states(self.particles, self.mesh,
+                    riemann.param_boost, self.domain_manager, 0.1)
+            riemann.compute_fluxes(self.particles, self.mesh,
+                    self.reconstruction, self.eos)
+            self.mesh.update_from_fluxes(self.particles, riemann, 0.1)
+            separate = dict((field, self.particles[field].copy()) for field in fields)
+
+            # all stages in one loop over faces
+            for field in fields:
+                self.particles[field][:] = initial[field]
+            riemann.fused_update(self.particles, self.mesh, self.reconstruction,
+                    self.eos, self.domain_manager, riemann.param_boost, 0.1)
+
+            for field in fields:
+                self.assertTrue(np.allclose(separate[field], self.particles[field]))
+                self.particles[field][:] = initial[field]
+            self.assertFalse(np.allclose(separate["mass"], 1.0))
+
 if __name__ == "__main__":
     unittest.main()
@@ -4,6 +4,7 @@ import logging
 
 from ..integrate.integrate import IntegrateBase
 from ..io.simulation_time import SimulationTime
+from ..io.checkpoint import write_checkpoint, read_checkpoint
 
 from ..utils.logo import logo_str
 from ..utils.tools import check_class, class_dict
@@ -14,7 +15,8 @@ class Simulation(object):
     """Marshalls the simulation."""
     def __init__(
         self, param_max_dt_change=1.e33, param_initial_timestep_factor=1.0,
-        param_simulation_name='simulation', param_colored_logs=True, param_log_level='debug'):
+        param_simulation_name='simulation', param_colored_logs=True, param_log_level='debug',
+        param_checkpoint_interval=0):
         """Constructor for simulation.
 
         Parameters:
@@ -39,6 +41,9 @@ class Simulation(object):
 
         param_colored_logs : bool
             Output colored logs to screen if True otherwise revmove color
+
+        param_checkpoint_interval : int
+            Write checkpoint every this many iterations, never if 0
         """
         # integrator uses a setter 
         self.integrator = None
@@ -48,6 +53,7 @@ class Simulation(object):
 
         # time step parameters
         self.param_max_dt_change = param_max_dt_change
+        self.param_checkpoint_interval = param_checkpoint_interval
         self.param_initial_timestep_factor = param_initial_timestep_factor
 
         # parallel parameters
@@ -112,6 +118,7 @@ class Simulation(object):
         Set time outputer for data outputs
         """
         self.simulation_time = simulation_time
+        self.simulation_time.set_base_name(self.param_simulation_name)
 
     def solve(self):
         """
@@ -127,6 +134,45 @@ class Simulation(object):
 
         # output initial state of simulation
         integrator.before_loop(self)
+        self.evolve()
+
+    def restart(self, filename):
+        """
+        Resume the simulation from a checkpoint written by checkpoint.
+        The simulation has to be setup as the run that wrote the
+        checkpoint. Mesh relaxation and initial output are skipped.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the checkpoint without extension.
+        """
+        integrator = self.integrator
+
+        integrator.initialize()
+        self.start_up_message()
+
+        # restore state and rebuild mesh
+        read_checkpoint(filename, integrator, self.simulation_time)
+        integrator.restart_loop(self)
+        self.evolve()
+
+    def checkpoint(self):
+        """
+        Write checkpoint of current state to the output directory.
+        """
+        filename = os.path.join(self.param_output_directory,
+                "%s_checkpoint_%04d" % (self.param_simulation_name,
+                    self.integrator.iteration))
+        phdLogger.info("Writing checkpoint %s" % filename)
+        write_checkpoint(filename, self.integrator, self.simulation_time)
+
+    def evolve(self):
+        """
+        Advance the simulation until finished.
+        """
+        integrator = self.integrator
+        simulation_time = self.simulation_time
 
         # compute first time step
         integrator.compute_time_step()
@@ -144,11 +190,20 @@ class Simulation(object):
                     self.param_output_directory,
                     integrator)
 
+            if self.param_checkpoint_interval and\
+                    integrator.iteration % self.param_checkpoint_interval == 0:
+                self.checkpoint()
+
             # compute new time step
             integrator.compute_time_step()
             self.modify_timestep()
 
+            # aggregate stage timings
+            if integrator.profiler is not None:
+                integrator.profiler.end_step(integrator.iteration)
+
         # clean up or last calculations
+        simulation_time.close()
         integrator.after_loop(self)
         phdLogger.success("Simulation successfully finished!")
 
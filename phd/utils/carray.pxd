@@ -11,6 +11,7 @@ cdef class BaseArrayIter:
 cdef class BaseArray:
     """Base Class for managed C-arrays."""
     cdef readonly long length, alloc
+    cdef readonly long num_reallocs     # times the buffer was reallocated
     cdef np.ndarray _npy_array
 
     cpdef reserve(self, long size)
@@ -21,12 +22,14 @@ cdef class BaseArray:
     cpdef extend(self, np.ndarray in_array)
     cpdef reset(self)
     cpdef shrink(self, long size)
+    cdef _grow(self, long size)
 
     cpdef align_array(self, np.ndarray new_indices)
     cpdef str get_c_type(self)
     cpdef copy_values(self, LongArray indices, BaseArray dest)
     cpdef paste_values(self, LongArray indices, BaseArray dest)
     cpdef add_values(self, LongArray indices, BaseArray dest)
+    cpdef paste_block(self, long start, BaseArray dest)
 
 cdef class DoubleArray(BaseArray):
     """This class defines a managed array of np.float64_t"""
@@ -50,6 +53,7 @@ cdef class DoubleArray(BaseArray):
     cpdef copy_values(self, LongArray indices, BaseArray dest)
     cpdef paste_values(self, LongArray indices, BaseArray dest)
     cpdef add_values(self, LongArray indices, BaseArray dest)
+    cpdef paste_block(self, long start, BaseArray dest)
 
 cdef class IntArray(BaseArray):
     """This class defines a managed array of np.int8_t"""
@@ -73,6 +77,7 @@ cdef class IntArray(BaseArray):
     cpdef copy_values(self, LongArray indices, BaseArray dest)
     cpdef paste_values(self, LongArray indices, BaseArray dest)
     cpdef add_values(self, LongArray indices, BaseArray dest)
+    cpdef paste_block(self, long start, BaseArray dest)
 
 cdef class LongArray(BaseArray):
     """This class defines a managed array of np.int32_t"""
@@ -96,6 +101,7 @@ cdef class LongArray(BaseArray):
     cpdef copy_values(self, LongArray indices, BaseArray dest)
     cpdef paste_values(self, LongArray indices, BaseArray dest)
     cpdef add_values(self, LongArray indices, BaseArray dest)
+    cpdef paste_block(self, long start, BaseArray dest)
 
 cdef class LongLongArray(BaseArray):
     """This class defines a managed array of np.int64_t"""
@@ -119,3 +125,4 @@ cdef class LongLongArray(BaseArray):
     cpdef copy_values(self, LongArray indices, BaseArray dest)
     cpdef paste_values(self, LongArray indices, BaseArray dest)
     cpdef add_values(self, LongArray indices, BaseArray dest)
+    cpdef paste_block(self, long start, BaseArray dest)
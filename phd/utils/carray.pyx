@@ -77,6 +77,23 @@ cdef class BaseArray:
     cpdef add_values(self, LongArray indices, BaseArray dest):
         """"Copy values of particles from self to dest at indices."""
 
+    cpdef paste_block(self, long start, BaseArray dest):
+        """"Copy all values from self to dest starting at start."""
+        raise NotImplementedError, 'BaseArray::paste_block'
+
+    cdef _grow(self, long size):
+        """
+        Set the length of the array to size. If the buffer is too small
+        it is grown geometrically so repeated calls are amortized.
+        """
+        cdef PyArrayObject* arr = <PyArrayObject*> self._npy_array
+
+        if size > self.alloc:
+            self.reserve(max(size, 2*self.alloc))
+
+        self.length = size
+        arr.dimensions[0] = self.length
+
     def __len__(self):
         return self.length
 
@@ -126,6 +143,8 @@ cdef class DoubleArray(BaseArray):
             Size of the data buffer allocated.
         length : int
             Number of slots used in the buffer.
+        num_reallocs : int
+            Number of times the buffer was reallocated.
         """
         self.length = n
         if n == 0:
@@ -199,6 +218,7 @@ cdef class DoubleArray(BaseArray):
 
             self.data = <np.float64_t*> data
             self.alloc = size
+            self.num_reallocs += 1
             arr.data = <char*> self.data
 
     cpdef resize(self, long size):
@@ -228,6 +248,7 @@ cdef class DoubleArray(BaseArray):
 
         self.data = <np.float64_t*> data
         self.alloc = self.length
+        self.num_reallocs += 1
         arr.data = <char*> self.data
 
     cpdef remove(self, np.ndarray index_list, bint input_sorted=0):
@@ -265,17 +286,27 @@ cdef class DoubleArray(BaseArray):
 
     cpdef extend(self, np.ndarray in_array):
         """
-        Extend the array with data from in_array.
+        Extend the array with data from in_array. The buffer is grown
+        once and the data is copied in a single memcpy.
 
         Parameters
         ----------
         in_array : ndarray
-            Array with data to be added to the current array.
+            Array with data to be added to the current array, converted
+            to a contiguous np.float64 array if needed.
         """
-        cdef int length = in_array.size
-        cdef int i
-        for i in range(length):
-            self.append(in_array[i])
+        cdef long length = in_array.size
+        cdef long old_length = self.length
+        cdef np.ndarray src
+
+        if length == 0:
+            return
+
+        src = np.ascontiguousarray(in_array, dtype=np.float64)
+        self._grow(old_length + length)
+
+        string.memcpy(<void*> (self.data + old_length), np.PyArray_DATA(src),
+                length*sizeof(np.float64_t))
 
     cpdef align_array(self, np.ndarray new_indices):
         """Rearrange the array contents according to the new indices."""
@@ -335,6 +366,23 @@ cdef class DoubleArray(BaseArray):
         for i in range(indices.length):
             dest_array.data[indices.data[i]] += self.data[i]
 
+    cpdef paste_block(self, long start, BaseArray dest):
+        """
+        Copy all values from self to dest, stored contiguously starting
+        at position start. Dest has to be of the same type and atleast
+        start + length of self long.
+        """
+        cdef DoubleArray dest_array
+
+        if not isinstance(dest, DoubleArray):
+            raise TypeError, 'paste_block destination is not a DoubleArray'
+        if start < 0 or start + self.length > dest.length:
+            raise ValueError, 'paste_block destination is too short'
+
+        dest_array = <DoubleArray>dest
+        string.memcpy(<void*> (dest_array.data + start), <void*> self.data,
+                self.length*sizeof(np.float64_t))
+
 cdef class IntArray(BaseArray):
     """Represents an array of 8 bit integers."""
 
@@ -358,6 +406,8 @@ cdef class IntArray(BaseArray):
             Size of the data buffer allocated
         length : int
             Number of slots used in the buffer
+        num_reallocs : int
+            Number of times the buffer was reallocated
         """
         self.length = n
         if n == 0:
@@ -431,6 +481,7 @@ cdef class IntArray(BaseArray):
 
             self.data = <np.int8_t*> data
             self.alloc = size
+            self.num_reallocs += 1
             arr.data = <char*> self.data
 
     cpdef resize(self, long size):
@@ -460,6 +511,7 @@ cdef class IntArray(BaseArray):
 
         self.data = <np.int8_t*> data
         self.alloc = self.length
+        self.num_reallocs += 1
         arr.data = <char*> self.data
 
     cpdef remove(self, np.ndarray index_list, bint input_sorted=0):
@@ -497,17 +549,27 @@ cdef class IntArray(BaseArray):
 
     cpdef extend(self, np.ndarray in_array):
         """
-        Extend the array with data from in_array.
+        Extend the array with data from in_array. The buffer is grown
+        once and the data is copied in a single memcpy.
 
         Parameters
         ----------
         in_array : ndarray
-            Array with data to be added to the current array.
+            Array with data to be added to the current array, converted
+            to a contiguous np.int8 array if needed.
         """
         cdef long length = in_array.size
-        cdef long i
-        for i in range(length):
-            self.append(in_array[i])
+        cdef long old_length = self.length
+        cdef np.ndarray src
+
+        if length == 0:
+            return
+
+        src = np.ascontiguousarray(in_array, dtype=np.int8)
+        self._grow(old_length + length)
+
+        string.memcpy(<void*> (self.data + old_length), np.PyArray_DATA(src),
+                length*sizeof(np.int8_t))
 
     cpdef align_array(self, np.ndarray new_indices):
         """Rearrange the array contents according to the new indices."""
@@ -567,6 +629,23 @@ cdef class IntArray(BaseArray):
         for i in range(indices.length):
             dest_array.data[indices.data[i]] += self.data[i]
 
+    cpdef paste_block(self, long start, BaseArray dest):
+        """
+        Copy all values from self to dest, stored contiguously starting
+        at position start. Dest has to be of the same type and atleast
+        start + length of self long.
+        """
+        cdef IntArray dest_array
+
+        if not isinstance(dest, IntArray):
+            raise TypeError, 'paste_block destination is not an IntArray'
+        if start < 0 or start + self.length > dest.length:
+            raise ValueError, 'paste_block destination is too short'
+
+        dest_array = <IntArray>dest
+        string.memcpy(<void*> (dest_array.data + start), <void*> self.data,
+                self.length*sizeof(np.int8_t))
+
 cdef class LongArray(BaseArray):
     """Represents an array of np.int32_t."""
 
@@ -590,6 +669,8 @@ cdef class LongArray(BaseArray):
             Size of the data buffer allocated
         length : int
             Number of slots used in the buffer
+        num_reallocs : int
+            Number of times the buffer was reallocated
         """
         self.length = n
         if n == 0:
@@ -663,6 +744,7 @@ cdef class LongArray(BaseArray):
 
             self.data = <np.int32_t*> data
             self.alloc = size
+            self.num_reallocs += 1
             arr.data = <char*> self.data
 
     cpdef resize(self, long size):
@@ -692,6 +774,7 @@ cdef class LongArray(BaseArray):
 
         self.data = <np.int32_t*> data
         self.alloc = self.length
+        self.num_reallocs += 1
         arr.data = <char*> self.data
 
     cpdef remove(self, np.ndarray index_list, bint input_sorted=0):
@@ -729,17 +812,27 @@ cdef class LongArray(BaseArray):
 
     cpdef extend(self, np.ndarray in_array):
         """
-        Extend the array with data from in_array.
+        Extend the array with data from in_array. The buffer is grown
+        once and the data is copied in a single memcpy.
 
         Parameters
         ----------
         in_array : ndarray
-            Array with data to be added to the current array.
+            Array with data to be added to the current array, converted
+            to a contiguous np.int32 array if needed.
         """
         cdef long length = in_array.size
-        cdef long i
-        for i in range(length):
-            self.append(in_array[i])
+        cdef long old_length = self.length
+        cdef np.ndarray src
+
+        if length == 0:
+            return
+
+        src = np.ascontiguousarray(in_array, dtype=np.int32)
+        self._grow(old_length + length)
+
+        string.memcpy(<void*> (self.data + old_length), np.PyArray_DATA(src),
+                length*sizeof(np.int32_t))
 
     cpdef align_array(self, np.ndarray new_indices):
         """Rearrange the array contents according to the new indices."""
@@ -799,6 +892,23 @@ cdef class LongArray(BaseArray):
         for i in range(indices.length):
             dest_array.data[indices.data[i]] += self.data[i]
 
+    cpdef paste_block(self, long start, BaseArray dest):
+        """
+        Copy all values from self to dest, stored contiguously starting
+        at position start. Dest has to be of the same type and atleast
+        start + length of self long.
+        """
+        cdef LongArray dest_array
+
+        if not isinstance(dest, LongArray):
+            raise TypeError, 'paste_block destination is not a LongArray'
+        if start < 0 or start + self.length > dest.length:
+            raise ValueError, 'paste_block destination is too short'
+
+        dest_array = <LongArray>dest
+        string.memcpy(<void*> (dest_array.data + start), <void*> self.data,
+                self.length*sizeof(np.int32_t))
+
 cdef class LongLongArray(BaseArray):
     """Represents an array of np.int64_t."""
 
@@ -822,6 +932,8 @@ cdef class LongLongArray(BaseArray):
             Size of the data buffer allocated
         length : int
             Number of slots used in the buffer
+        num_reallocs : int
+            Number of times the buffer was reallocated
         """
         self.length = n
         if n == 0:
@@ -895,6 +1007,7 @@ cdef class LongLongArray(BaseArray):
 
             self.data = <np.int64_t*> data
             self.alloc = size
+            self.num_reallocs += 1
             arr.data = <char*> self.data
 
     cpdef resize(self, long size):
@@ -924,6 +1037,7 @@ cdef class LongLongArray(BaseArray):
 
         self.data = <np.int64_t*> data
         self.alloc = self.length
+        self.num_reallocs += 1
         arr.data = <char*> self.data
 
     cpdef remove(self, np.ndarray index_list, bint input_sorted=0):
@@ -961,17 +1075,27 @@ cdef class LongLongArray(BaseArray):
 
     cpdef extend(self, np.ndarray in_array):
         """
-        Extend the array with data from in_array.
+        Extend the array with data from in_array. The buffer is grown
+        once and the data is copied in a single memcpy.
 
         Parameters
         ----------
         in_array : ndarray
-            Array with data to be added to the current array.
+            Array with data to be added to the current array, converted
+            to a contiguous np.int64 array if needed.
         """
         cdef long length = in_array.size
-        cdef long i
-        for i in range(length):
-            self.append(in_array[i])
+        cdef long old_length = self.length
+        cdef np.ndarray src
+
+        if length == 0:
+            return
+
+        src = np.ascontiguousarray(in_array, dtype=np.int64)
+        self._grow(old_length + length)
+
+        string.memcpy(<void*> (self.data + old_length), np.PyArray_DATA(src),
+                length*sizeof(np.int64_t))
 
     cpdef align_array(self, np.ndarray new_indices):
         """Rearrange the array contents according to the new indices."""
@@ -1030,3 +1154,20 @@ cdef class LongLongArray(BaseArray):
 
         for i in range(indices.length):
             dest_array.data[indices.data[i]] += self.data[i]
+
+    cpdef paste_block(self, long start, BaseArray dest):
+        """
+        Copy all values from self to dest, stored contiguously starting
+        at position start. Dest has to be of the same type and atleast
+        start + length of self long.
+        """
+        cdef LongLongArray dest_array
+
+        if not isinstance(dest, LongLongArray):
+            raise TypeError, 'paste_block destination is not a LongLongArray'
+        if start < 0 or start + self.length > dest.length:
+            raise ValueError, 'paste_block destination is too short'
+
+        dest_array = <LongLongArray>dest
+        string.memcpy(<void*> (dest_array.data + start), <void*> self.data,
+                self.length*sizeof(np.int64_t))
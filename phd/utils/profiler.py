@@ -0,0 +1,116 @@
+import csv
+import json
+import time
+
+class Profiler(object):
+    """
+    Record wall time, number of calls, items processed and carray
+    reallocations of each stage of a time step. Stages are aggregated
+    over windows of param_interval steps, finished windows are stored
+    as rows and written out by dump.
+
+    Parameters
+    ----------
+    param_interval : int
+        Number of steps aggregated in one row.
+
+    param_format : str
+        Format of dump, 'json' or 'csv'.
+
+    """
+    def __init__(self, param_interval=1, param_format='json'):
+        if param_interval < 1:
+            raise RuntimeError("Profiler: interval has to be positive")
+        if param_format not in ['json', 'csv']:
+            raise RuntimeError("Profiler: unknown format %s" % param_format)
+
+        self.param_interval = param_interval
+        self.param_format = param_format
+
+        self.containers = []    # containers checked for reallocations
+        self.rows = []          # aggregated windows
+
+        self.open_stages = {}
+        self.window = {}
+        self.window_order = []
+        self.window_steps = 0
+        self.window_first = None
+
+    def watch(self, *containers):
+        """Add containers whose reallocations are recorded."""
+        for container in containers:
+            if container is not None and container not in self.containers:
+                self.containers.append(container)
+
+    def num_reallocs(self):
+        return sum(c.get_number_of_reallocs() for c in self.containers)
+
+    def start(self, stage):
+        """Start timing stage."""
+        self.open_stages[stage] = (time.time(), self.num_reallocs())
+
+    def stop(self, stage, **items):
+        """
+        Stop timing stage and add number of items processed, i.e.
+        cells=100, faces=300.
+        """
+        start, reallocs = self.open_stages.pop(stage)
+
+        if stage not in self.window:
+            self.window_order.append(stage)
+            self.window[stage] = {"calls": 0, "time": 0., "reallocs": 0}
+
+        record = self.window[stage]
+        record["calls"] += 1
+        record["time"] += time.time() - start
+        record["reallocs"] += self.num_reallocs() - reallocs
+        for key, value in items.items():
+            record[key] = record.get(key, 0) + value
+
+    def end_step(self, iteration):
+        """Signal end of time step, full windows are stored as rows."""
+        if self.window_first is None:
+            self.window_first = iteration
+        self.window_steps += 1
+
+        if self.window_steps == self.param_interval:
+            self.flush(iteration)
+
+    def flush(self, iteration):
+        """Store current window as rows, one per stage."""
+        for stage in self.window_order:
+            row = {"first_iteration": self.window_first,
+                    "last_iteration": iteration,
+                    "steps": self.window_steps,
+                    "stage": stage}
+            row.update(self.window[stage])
+            self.rows.append(row)
+
+        self.window = {}
+        self.window_order = []
+        self.window_steps = 0
+        self.window_first = None
+
+    def dump(self, filename, iteration=None):
+        """
+        Write all rows to filename, a partial window is stored first.
+        """
+        if self.window_steps:
+            self.flush(iteration)
+
+        if self.param_format == 'json':
+            with open(filename, 'w') as f:
+                json.dump(self.rows, f, indent=1, sort_keys=True)
+        else:
+            fields = ["first_iteration", "last_iteration", "steps", "stage",
+                    "calls", "time", "reallocs"]
+            for row in self.rows:
+                for key in sorted(row.keys()):
+                    if key not in fields:
+                        fields.append(key)
+
+            with open(filename, 'w') as f:
+                writer = csv.DictWriter(f, fieldnames=fields, restval=0)
+                writer.writeheader()
+                for row in self.rows:
+                    writer.writerow(row)
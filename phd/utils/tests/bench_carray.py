@@ -0,0 +1,66 @@
+"""
+Micro-benchmarks for bulk carray operations. Run directly:
+
+    python bench_carray.py
+"""
+import timeit
+import numpy as np
+
+from phd.utils.carray import DoubleArray, IntArray, LongArray, LongLongArray
+from phd.containers.containers import CarrayContainer
+
+carrays = [
+        (DoubleArray, np.float64),
+        (IntArray, np.int8),
+        (LongArray, np.int32),
+        (LongLongArray, np.int64)
+        ]
+
+def bench_extend(n=100000, repeat=5):
+    """Compare element by element append against bulk extend."""
+    results = {}
+    for carray, dtype in carrays:
+        data = np.ones(n, dtype=dtype)
+
+        def append_loop():
+            arr = carray()
+            for i in range(n):
+                arr.append(data[i])
+
+        def extend():
+            arr = carray()
+            arr.extend(data)
+
+        results[carray.__name__] = (
+                min(timeit.repeat(append_loop, number=1, repeat=repeat)),
+                min(timeit.repeat(extend, number=1, repeat=repeat)))
+    return results
+
+def bench_append_container(n=100000, num_fields=16, repeat=5):
+    """Compare numpy slice assignment against raw buffer append_container."""
+    var_dict = dict(("field-%d" % i, "double") for i in range(num_fields))
+    source = CarrayContainer(n, var_dict)
+    dest = CarrayContainer(n, var_dict)
+
+    # memory is retained by resize, only the copy is timed
+    def slice_copy():
+        dest.resize(n)
+        dest.extend(n)
+        for field in source.properties:
+            dest[field][n:] = source[field]
+
+    def append_container():
+        dest.resize(n)
+        dest.append_container(source)
+
+    return (min(timeit.repeat(slice_copy, number=1, repeat=repeat)),
+            min(timeit.repeat(append_container, number=1, repeat=repeat)))
+
+if __name__ == "__main__":
+    for name, (loop, bulk) in sorted(bench_extend().items()):
+        print("%-14s append loop: %.2e s  extend: %.2e s  speedup: %6.1fx" %\
+                (name, loop, bulk, loop/bulk))
+
+    slice_copy, bulk = bench_append_container()
+    print("%-14s slice copy:  %.2e s  append: %.2e s  speedup: %6.1fx" %\
+            ("CarrayContainer", slice_copy, bulk, slice_copy/bulk))
@@ -197,6 +197,61 @@ class TestDoubleArray(unittest.TestCase):
         for i in indices:
             self.assertTrue(da2[i] == 2.0)
 
+    def test_num_reallocs(self):
+        """Tests the reallocation counter."""
+        da = DoubleArray(10)
+        self.assertEqual(da.num_reallocs, 0)
+
+        # shrinking the length keeps the buffer
+        da.resize(5)
+        da.resize(10)
+        self.assertEqual(da.num_reallocs, 0)
+
+        da.resize(20)
+        self.assertEqual(da.num_reallocs, 1)
+
+        da.squeeze()
+        self.assertEqual(da.num_reallocs, 2)
+
+    def test_extend_conversion(self):
+        """Tests extend with a strided array of a different type."""
+        da1 = DoubleArray(0)
+        da1.extend(np.arange(10, dtype=np.float32)[::2])
+
+        self.assertEqual(da1.length, 5)
+        self.assertEqual(da1.get_npy_array().dtype, np.float64)
+        self.assertEqual(np.allclose(da1.get_npy_array(), [0, 2, 4, 6, 8]), True)
+
+        # repeated extends grow the buffer geometrically
+        for i in range(10):
+            da1.extend(np.ones(20, dtype=np.float64))
+        self.assertEqual(da1.length, 205)
+        self.assertEqual(da1.alloc >= da1.length, True)
+        self.assertEqual(np.allclose(da1.get_npy_array()[5:], 1), True)
+
+        # extending by an empty array is a no-op
+        da1.extend(np.array([], dtype=np.float64))
+        self.assertEqual(da1.length, 205)
+
+    def test_paste_block(self):
+        """Tests the paste block function."""
+        da1 = DoubleArray(3)
+        da1_array = da1.get_npy_array()
+        da1_array[:] = 2.0
+
+        da2 = DoubleArray(6)
+        da2_array = da2.get_npy_array()
+        da2_array[:] = 0.0
+
+        da1.paste_block(2, da2)
+        self.assertEqual(np.allclose(da2.get_npy_array(),
+            [0, 0, 2, 2, 2, 0]), True)
+
+        # wrong type or too short destination
+        self.assertRaises(TypeError, da1.paste_block, 0, IntArray(6))
+        self.assertRaises(ValueError, da1.paste_block, 4, da2)
+        self.assertRaises(ValueError, da1.paste_block, -1, da2)
+
 class TestIntArray(unittest.TestCase):
     """Tests for the DoubleArray class."""
     def test_constructor(self):
@@ -382,6 +437,45 @@ class TestIntArray(unittest.TestCase):
         for i in indices:
             self.assertTrue(ia2[i] == 2)
 
+    def test_extend_conversion(self):
+        """Tests extend with a strided array of a different type."""
+        ia1 = IntArray(0)
+        ia1.extend(np.arange(10, dtype=np.float32)[::2])
+
+        self.assertEqual(ia1.length, 5)
+        self.assertEqual(ia1.get_npy_array().dtype, np.int8)
+        self.assertEqual(np.allclose(ia1.get_npy_array(), [0, 2, 4, 6, 8]), True)
+
+        # repeated extends grow the buffer geometrically
+        for i in range(10):
+            ia1.extend(np.ones(20, dtype=np.int8))
+        self.assertEqual(ia1.length, 205)
+        self.assertEqual(ia1.alloc >= ia1.length, True)
+        self.assertEqual(np.allclose(ia1.get_npy_array()[5:], 1), True)
+
+        # extending by an empty array is a no-op
+        ia1.extend(np.array([], dtype=np.int8))
+        self.assertEqual(ia1.length, 205)
+
+    def test_paste_block(self):
+        """Tests the paste block function."""
+        ia1 = IntArray(3)
+        ia1_array = ia1.get_npy_array()
+        ia1_array[:] = 2
+
+        ia2 = IntArray(6)
+        ia2_array = ia2.get_npy_array()
+        ia2_array[:] = 0
+
+        ia1.paste_block(2, ia2)
+        self.assertEqual(np.allclose(ia2.get_npy_array(),
+            [0, 0, 2, 2, 2, 0]), True)
+
+        # wrong type or too short destination
+        self.assertRaises(TypeError, ia1.paste_block, 0, LongArray(6))
+        self.assertRaises(ValueError, ia1.paste_block, 4, ia2)
+        self.assertRaises(ValueError, ia1.paste_block, -1, ia2)
+
 class TestLongArray(unittest.TestCase):
     """Tests for the DoubleArray class."""
     def test_constructor(self):
@@ -567,6 +661,45 @@ class TestLongArray(unittest.TestCase):
         for i in indices:
             self.assertTrue(la2[i] == 2)
 
+    def test_extend_conversion(self):
+        """Tests extend with a strided array of a different type."""
+        la1 = LongArray(0)
+        la1.extend(np.arange(10, dtype=np.float32)[::2])
+
+        self.assertEqual(la1.length, 5)
+        self.assertEqual(la1.get_npy_array().dtype, np.int32)
+        self.assertEqual(np.allclose(la1.get_npy_array(), [0, 2, 4, 6, 8]), True)
+
+        # repeated extends grow the buffer geometrically
+        for i in range(10):
+            la1.extend(np.ones(20, dtype=np.int32))
+        self.assertEqual(la1.length, 205)
+        self.assertEqual(la1.alloc >= la1.length, True)
+        self.assertEqual(np.allclose(la1.get_npy_array()[5:], 1), True)
+
+        # extending by an empty array is a no-op
+        la1.extend(np.array([], dtype=np.int32))
+        self.assertEqual(la1.length, 205)
+
+    def test_paste_block(self):
+        """Tests the paste block function."""
+        la1 = LongArray(3)
+        la1_array = la1.get_npy_array()
+        la1_array[:] = 2
+
+        la2 = LongArray(6)
+        la2_array = la2.get_npy_array()
+        la2_array[:] = 0
+
+        la1.paste_block(2, la2)
+        self.assertEqual(np.allclose(la2.get_npy_array(),
+            [0, 0, 2, 2, 2, 0]), True)
+
+        # wrong type or too short destination
+        self.assertRaises(TypeError, la1.paste_block, 0, DoubleArray(6))
+        self.assertRaises(ValueError, la1.paste_block, 4, la2)
+        self.assertRaises(ValueError, la1.paste_block, -1, la2)
+
 class TestLongLongArray(unittest.TestCase):
     """Tests for the LongLongArray class."""
     def test_constructor(self):
@@ -751,3 +884,42 @@ class TestLongLongArray(unittest.TestCase):
         lla1.paste_values(indices, lla2)
         for i in indices:
             self.assertTrue(lla2[i] == 2)
+
+    def test_extend_conversion(self):
+        """Tests extend with a strided array of a different type."""
+        lla1 = LongLongArray(0)
+        lla1.extend(np.arange(10, dtype=np.float32)[::2])
+
+        self.assertEqual(lla1.length, 5)
+        self.assertEqual(lla1.get_npy_array().dtype, np.int64)
+        self.assertEqual(np.allclose(lla1.get_npy_array(), [0, 2, 4, 6, 8]), True)
+
+        # repeated extends grow the buffer geometrically
+        for i in range(10):
+            lla1.extend(np.ones(20, dtype=np.int64))
+        self.assertEqual(lla1.length, 205)
+        self.assertEqual(lla1.alloc >= lla1.length, True)
+        self.assertEqual(np.allclose(lla1.get_npy_array()[5:], 1), True)
+
+        # extending by an empty array is a no-op
+        lla1.extend(np.array([], dtype=np.int64))
+        self.assertEqual(lla1.length, 205)
+
+    def test_paste_block(self):
+        """Tests the paste block function."""
+        lla1 = LongLongArray(3)
+        lla1_array = lla1.get_npy_array()
+        lla1_array[:] = 2
+
+        lla2 = LongLongArray(6)
+        lla2_array = lla2.get_npy_array()
+        lla2_array[:] = 0
+
+        lla1.paste_block(2, lla2)
+        self.assertEqual(np.allclose(lla2.get_npy_array(),
+            [0, 0, 2, 2, 2, 0]), True)
+
+        # wrong type or too short destination
+        self.assertRaises(TypeError, lla1.paste_block, 0, IntArray(6))
+        self.assertRaises(ValueError, lla1.paste_block, 4, lla2)
+        self.assertRaises(ValueError, lla1.paste_block, -1, lla2)
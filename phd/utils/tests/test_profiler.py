@@ -0,0 +1,80 @@
+import os
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+
+from phd.utils.profiler import Profiler
+
+class Container(object):
+    """Stand in for CarrayContainer reallocation counter."""
+    def __init__(self):
+        self.reallocs = 0
+
+    def get_number_of_reallocs(self):
+        return self.reallocs
+
+class TestProfiler(unittest.TestCase):
+    """Tests aggregation and output of stage profiler."""
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.container = Container()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def run_steps(self, profiler, num_steps):
+        profiler.watch(self.container)
+        for iteration in range(num_steps):
+            profiler.start("riemann")
+            profiler.stop("riemann", faces=10)
+
+            profiler.start("mesh")
+            self.container.reallocs += 1
+            profiler.stop("mesh", cells=4, ghosts=2, ghost_rounds=1)
+            profiler.end_step(iteration)
+
+    def test_windows(self):
+        profiler = Profiler(param_interval=2)
+        self.run_steps(profiler, 5)
+
+        # two full windows of two stages
+        self.assertEqual(len(profiler.rows), 4)
+        mesh = profiler.rows[1]
+        self.assertEqual(mesh["stage"], "mesh")
+        self.assertEqual(mesh["first_iteration"], 0)
+        self.assertEqual(mesh["last_iteration"], 1)
+        self.assertEqual(mesh["calls"], 2)
+        self.assertEqual(mesh["ghosts"], 4)
+        self.assertEqual(mesh["reallocs"], 2)
+        self.assertEqual(profiler.rows[0]["reallocs"], 0)
+        self.assertEqual(profiler.rows[0]["faces"], 20)
+
+        # partial window written by dump
+        filename = os.path.join(self.path, "profile.json")
+        profiler.dump(filename, 4)
+        with open(filename) as f:
+            rows = json.load(f)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[-1]["steps"], 1)
+
+    def test_csv(self):
+        profiler = Profiler(param_interval=1, param_format='csv')
+        self.run_steps(profiler, 2)
+
+        filename = os.path.join(self.path, "profile.csv")
+        profiler.dump(filename)
+        with open(filename) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]["stage"], "riemann")
+        self.assertEqual(rows[0]["ghosts"], "0")
+        self.assertEqual(rows[1]["ghost_rounds"], "1")
+
+    def test_bad_parameters(self):
+        self.assertRaises(RuntimeError, Profiler, param_interval=0)
+        self.assertRaises(RuntimeError, Profiler, param_format='hdf5')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -32,6 +32,19 @@ def class_dict(cl):
             dic[attr_name] = attr.__class__.__name__
     return dic
 
+def parameter_dict(cl):
+    '''
+    Store every parameter, attribute prefixed with param_ that is
+    a number, string or None, of a class in a dictionary.
+    '''
+    dic = {}
+    for attr_name in dir(cl):
+        if attr_name.startswith('param_'):
+            attr = getattr(cl, attr_name)
+            if attr is None or isinstance(attr, (int, float, str)):
+                dic[attr_name] = attr
+    return dic
+
 #def _check_component(self):
 #    '''
 #    Cycle through all classes and make sure all attributes are
@@ -45,31 +58,24 @@ def class_dict(cl):
 #        if comp == None:
 #            raise RuntimeError("Component: %s not set." % attr_name)
 
-#def _create_components_timeshot(self):
-#    '''
-#    Cycle through all classes and record all attributes and store
-#    it in a dictionary, key = class name val = attributes.
-#    '''
-#    dict_output = {}
-#    for attr_name, cl in self.__dict__.iteritems():
-#
-#        comp = getattr(self, attr_name)
-#
-#        # ignore parameters
-#        if isinstance(comp, (int, float, str)):
-#            continue
-#
-#        # store components
-#        d = {}
-#        for i in dir(cl):
-#            x = getattr(cl, i)
-#            if isinstance(x, (int, float, str)):
-#                d[i] = x
-#
-#        dict_output[attr_name] = (cl.__class__.__name__, d)
-#
-#    return dict_output
-#
+def create_components_timeshot(integrator):
+    '''
+    Cycle through the integrator and every component set in the
+    integrator and record class name and parameters in a dictionary,
+    key = attribute name val = (class name, parameters).
+    '''
+    components = {'integrator': integrator}
+    for attr_name, comp in integrator.__dict__.iteritems():
+
+        # ignore parameters and components not set
+        if comp is None or isinstance(comp, (int, float, str,
+            dict, tuple, list, np.ndarray)):
+            continue
+        components[attr_name] = comp
+
+    return dict((name, (comp.__class__.__name__, parameter_dict(comp)))
+            for name, comp in components.iteritems())
+
 #def _create_components_from_dict(self, cl_dict):
 #    '''
 #    Create a simulation from dictionary cl_dict created by _create_components_from_dict
@@ -25,6 +25,7 @@ subdirs = [
 ]
 
 cpp = ("mesh", "boundary", "reconstruction", "riemann", "integrate")
+openmp = ("riemann", "hilbert")
 
 extensions = []
 for subdir in subdirs:
@@ -40,6 +41,9 @@ for subdir in subdirs:
     )
     if any(_ in subdir for _ in cpp):
         extensions[-1].language = "c++"
+    if any(_ in subdir for _ in openmp):
+        extensions[-1].extra_compile_args = ["-fopenmp"]
+        extensions[-1].extra_link_args = ["-fopenmp"]
 
 setup(
         name="phd",